@@ -0,0 +1,5 @@
+import sys
+
+sys.path.append('.')
+sys.path.append('./src/')
+sys.path.append('./src/books')
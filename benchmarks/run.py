@@ -0,0 +1,395 @@
+"""
+Benchmark runner
+
+Run `python -m benchmarks.run` from the root of the project to seed the
+database, start the app in-process against a local fake Gutendex and
+measure the latency and throughput of every route. Results are written as
+JSON and compared with a stored baseline.
+"""
+
+import os
+
+os.environ.setdefault("SQLALCHEMY_DATABASE_URL", "sqlite+aiosqlite:///./benchmark.db")
+
+import argparse
+import asyncio
+import json
+import math
+import platform
+import random
+import sys
+import time
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+import httpx
+
+import books.known_ids as known_ids
+import books.leaderboard as leaderboard
+import books.warming as warming
+import caching
+import migrations
+import upstream
+from benchmarks import seed
+from database import SQLALCHEMY_DATABASE_URL, SessionLocal, engine
+from main import app
+from tests import fake_gutendex
+
+Request = Tuple[str, str, dict]
+
+SEARCH_TERMS = ["oz", "ghosts", "tolkien", "generated book", "spirits vol"]
+GRANULARITIES = ["day", "week", "month", "year"]
+IMPORT_BATCH_SIZE = 100
+
+
+def percentile(latencies: List[float], percent: float) -> float:
+    """
+    This function is used to get a nearest-rank percentile
+
+    :param latencies: sorted latencies
+    :param percent: percentile, between 0 and 100
+
+    :return: latency
+    """
+
+    if not latencies:
+        return 0.0
+    rank = max(math.ceil(percent / 100 * len(latencies)), 1)
+    return latencies[rank - 1]
+
+
+def summarize(latencies: List[float], errors: int, elapsed: float) -> dict:
+    """
+    This function is used to summarize the measures of a route
+
+    :param latencies: request latencies, in seconds
+    :param errors: number of failed requests
+    :param elapsed: wall time, in seconds
+
+    :return: route results, latencies in milliseconds
+    """
+
+    latencies = sorted(latencies)
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+        "mean_ms": round(sum(latencies) / len(latencies) * 1000, 3)
+        if latencies
+        else 0.0,
+        "throughput_rps": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+    }
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> List[str]:
+    """
+    This function is used to find the routes that got slower than the
+    baseline: a higher p95 latency or a lower throughput, beyond the
+    tolerance
+
+    :param results: benchmark results
+    :param baseline: baseline results
+    :param tolerance: allowed relative change, e.g. 0.2 for 20%
+
+    :return: regression descriptions
+    """
+
+    regressions = []
+    for route, current in results["routes"].items():
+        before = baseline.get("routes", {}).get(route)
+        if not before:
+            continue
+        if current["p95_ms"] > before["p95_ms"] * (1 + tolerance):
+            regressions.append(
+                f"{route}: p95 {before['p95_ms']}ms -> {current['p95_ms']}ms"
+            )
+        if current["throughput_rps"] < before["throughput_rps"] * (1 - tolerance):
+            regressions.append(
+                f"{route}: throughput {before['throughput_rps']}/s -> "
+                f"{current['throughput_rps']}/s"
+            )
+    return regressions
+
+
+def build_scenarios(
+    book_ids: List[int], rng: random.Random
+) -> Dict[str, Callable[[], Request]]:
+    """
+    This function is used to describe one random request per route. Reads
+    come first, so the writes do not change the data they measure.
+
+    :param book_ids: reviewed books
+    :param rng: random generator
+
+    :return: request factories by route name
+    """
+
+    def book_id() -> int:
+        return rng.choice(book_ids)
+
+    def review() -> dict:
+        return {"review": "Benchmark review", "rating": rng.randint(0, 5)}
+
+    def import_body() -> str:
+        return "\n".join(
+            json.dumps({"book_id": book_id(), **review()})
+            for _ in range(IMPORT_BATCH_SIZE)
+        )
+
+    return {
+        "search_books": lambda: (
+            "GET",
+            "/books",
+            {"params": {"search": rng.choice(SEARCH_TERMS)}},
+        ),
+        "get_top_rated_books": lambda: (
+            "GET",
+            "/books/top-rated",
+            {"params": {"limit": 10, "offset": rng.randrange(0, 50)}},
+        ),
+        "get_top_rated_books_filtered": lambda: (
+            "GET",
+            "/books/top-rated",
+            {
+                "params": {
+                    "language": "en",
+                    "min_reviews": rng.choice([1, 5, 20]),
+                    "ranking": "bayesian",
+                }
+            },
+        ),
+        "get_book": lambda: ("GET", f"/books/{book_id()}", {}),
+        "get_book_reviews": lambda: ("GET", f"/books/{book_id()}/reviews", {}),
+        "get_monthly_rating": lambda: (
+            "GET",
+            f"/books/{book_id()}/monthly-rating",
+            {},
+        ),
+        "get_rating_trend": lambda: (
+            "GET",
+            f"/books/{book_id()}/rating-trend",
+            {
+                "params": {
+                    "from": "2023-01-01",
+                    "to": "2023-12-31",
+                    "granularity": rng.choice(GRANULARITIES),
+                }
+            },
+        ),
+        "add_review": lambda: (
+            "POST",
+            f"/books/{book_id()}/review",
+            {"json": review()},
+        ),
+        "import_reviews": lambda: (
+            "POST",
+            "/books/reviews/bulk",
+            {
+                "content": import_body(),
+                "headers": {"content-type": "application/x-ndjson"},
+            },
+        ),
+    }
+
+
+async def measure(
+    client: httpx.AsyncClient,
+    make_request: Callable[[], Request],
+    requests: int,
+    concurrency: int,
+) -> dict:
+    """
+    This function is used to send `requests` requests from `concurrency`
+    concurrent workers and to measure them
+
+    :param client: client for the app
+    :param make_request: request factory
+    :param requests: number of requests
+    :param concurrency: number of concurrent workers
+
+    :return: route results
+    """
+
+    latencies: List[float] = []
+    errors = 0
+    remaining = iter(range(requests))
+
+    async def worker():
+        nonlocal errors
+        for _ in remaining:
+            method, url, kwargs = make_request()
+            started = time.perf_counter()
+            try:
+                response = await client.request(method, url, **kwargs)
+                failed = response.status_code >= 400
+            except httpx.HTTPError:
+                failed = True
+            latencies.append(time.perf_counter() - started)
+            errors += failed
+
+    started = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    return summarize(latencies, errors, time.perf_counter() - started)
+
+
+async def start_app(gutendex):
+    # Same steps as the app startup, with the upstream client pointed at the
+    # fake Gutendex
+    await migrations.upgrade()
+    await caching.startup()
+    await known_ids.load()
+    transport = httpx.ASGITransport(app=gutendex)
+    await upstream.startup(upstream.create_client(transport=transport))
+    await leaderboard.startup()
+    await warming.startup()
+
+
+async def stop_app():
+    await warming.shutdown()
+    await leaderboard.shutdown()
+    await upstream.shutdown()
+    await caching.shutdown()
+    await engine.dispose()
+
+
+async def run(args: argparse.Namespace) -> dict:
+    """
+    This function is used to seed the database and benchmark every route
+
+    :param args: command line arguments
+
+    :return: benchmark results
+    """
+
+    rows = seed.parse_size(args.rows)
+    catalog = {**fake_gutendex.BOOKS, **fake_gutendex.generate_books(args.books)}
+    book_ids = list(catalog)
+    gutendex = fake_gutendex.create_app(
+        catalog, latency=args.upstream_latency, error_rate=args.upstream_error_rate
+    )
+
+    await start_app(gutendex)
+    try:
+        async with SessionLocal() as db:
+            started = time.perf_counter()
+            seeded = await seed.seed_reviews(db, rows, book_ids, args.seed)
+            seed_seconds = time.perf_counter() - started
+        if not args.cold_metadata:
+            await seed.seed_books(catalog)
+        if seeded:
+            print(f"Seeded {rows} reviews in {seed_seconds:.1f}s", file=sys.stderr)
+
+        scenarios = build_scenarios(book_ids, random.Random(args.seed))
+        routes = args.routes or list(scenarios)
+        results = {}
+        # Unhandled app errors are answered with a 500 and counted as errors
+        transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://benchmark"
+        ) as client:
+            for route in routes:
+                await measure(client, scenarios[route], args.warmup, args.concurrency)
+                upstream_calls = len(gutendex.state.calls)
+                results[route] = await measure(
+                    client, scenarios[route], args.requests, args.concurrency
+                )
+                results[route]["upstream_calls"] = (
+                    len(gutendex.state.calls) - upstream_calls
+                )
+                print(f"{route}: {results[route]}", file=sys.stderr)
+    finally:
+        await stop_app()
+
+    return {
+        "meta": {
+            "date": datetime.utcnow().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "database": engine.url.get_backend_name(),
+            "rows": rows,
+            "books": len(catalog),
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "upstream_latency": args.upstream_latency,
+            "upstream_error_rate": args.upstream_error_rate,
+            "cache_backend": type(caching.FastAPICache.get_backend()).__name__,
+        },
+        "routes": results,
+    }
+
+
+def load_baseline(path: str) -> Optional[dict]:
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as file:
+        return json.load(file)
+
+
+def write_json(path: str, data: dict):
+    with open(path, "w", encoding="utf-8") as file:
+        json.dump(data, file, indent=2)
+        file.write("\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the Books API")
+    parser.add_argument(
+        "--rows", default="10k", help="number of reviews, e.g. 10k, 1M or 10M"
+    )
+    parser.add_argument("--books", type=int, default=1000, help="catalog size")
+    parser.add_argument("--requests", type=int, default=500, help="per route")
+    parser.add_argument("--warmup", type=int, default=20, help="per route")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument(
+        "--upstream-latency", type=float, default=0.05, help="seconds"
+    )
+    parser.add_argument("--upstream-error-rate", type=float, default=0.0)
+    parser.add_argument(
+        "--cold-metadata",
+        action="store_true",
+        help="do not store the book metadata before the run",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--route", dest="routes", action="append", help="only run these routes"
+    )
+    parser.add_argument("--output", default="benchmark-results.json")
+    parser.add_argument("--baseline", default="benchmarks/baseline.json")
+    parser.add_argument(
+        "--save-baseline",
+        action="store_true",
+        help="store the results as the new baseline",
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.2,
+        help="allowed relative change before a route counts as a regression",
+    )
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    write_json(args.output, results)
+    print(f"Results written to {args.output} ({SQLALCHEMY_DATABASE_URL})")
+
+    if args.save_baseline:
+        write_json(args.baseline, results)
+        print(f"Baseline written to {args.baseline}")
+        return
+    baseline = load_baseline(args.baseline)
+    if baseline is None:
+        print(f"No baseline at {args.baseline}, run with --save-baseline")
+        return
+    if baseline["meta"]["rows"] != results["meta"]["rows"]:
+        print("Warning: the baseline was measured with a different number of rows")
+    regressions = compare(results, baseline, args.tolerance)
+    for regression in regressions:
+        print(f"Regression: {regression}")
+    if regressions:
+        sys.exit(1)
+    print("No regressions against the baseline")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+"""
+Benchmark data
+
+Fills book_reviews with random reviews spread over a catalog of books and
+over three years, then rebuilds the rating aggregates and rollups. The seed
+parameters and the last seeded review are recorded in benchmark_seeds, so
+later runs with the same parameters keep the seeded reviews and only drop
+the reviews written by earlier benchmark runs.
+"""
+
+import random
+from datetime import datetime, timedelta
+from typing import Dict, List
+
+from sqlalchemy import (Column, Integer, MetaData, Table, delete, insert,
+                        select)
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.sql import func
+
+import books.aggregates as aggregates
+import books.repository as repository
+import models as models
+
+SEED_CHUNK_SIZE = 50000
+SEED_START_DATE = datetime(2022, 1, 1)
+SEED_DAYS = 3 * 365
+SIZE_SUFFIXES = {"k": 1000, "m": 1000000}
+
+benchmark_seeds = Table(
+    "benchmark_seeds",
+    MetaData(),
+    Column("id", Integer, primary_key=True),
+    Column("rows", Integer, nullable=False),
+    Column("book_count", Integer, nullable=False),
+    Column("seed", Integer, nullable=False),
+    Column("last_review_id", Integer),
+)
+
+
+def parse_size(value: str) -> int:
+    """
+    This function is used to read a row count such as 10k, 1M or 10M
+
+    :param value: row count, with an optional k or M suffix
+
+    :return: row count
+    """
+
+    multiplier = SIZE_SUFFIXES.get(value[-1:].lower())
+    if multiplier:
+        return int(float(value[:-1]) * multiplier)
+    return int(value)
+
+
+async def count_reviews(db: AsyncSession) -> int:
+    """
+    This function is used to count the stored reviews
+
+    :param db: database session
+
+    :return: number of reviews
+    """
+
+    count = await db.execute(select(func.count()).select_from(models.BookReview))
+    return count.scalar()
+
+
+async def seed_reviews(
+    db: AsyncSession, rows: int, book_ids: List[int], seed: int = 0
+) -> bool:
+    """
+    This function is used to replace the stored reviews with `rows` random
+    reviews. When the database was already seeded with the same parameters,
+    the seeded reviews are kept and the reviews written since are deleted,
+    so large datasets are only generated once.
+
+    :param db: database session
+    :param rows: number of reviews
+    :param book_ids: books to review
+    :param seed: random seed
+
+    :return: whether the reviews were generated
+    """
+
+    await db.run_sync(
+        lambda session: benchmark_seeds.create(session.connection(), checkfirst=True)
+    )
+    seeded = (await db.execute(select(benchmark_seeds))).first()
+    if seeded is not None and (seeded.rows, seeded.book_count, seeded.seed) == (
+        rows,
+        len(book_ids),
+        seed,
+    ):
+        await delete_written_reviews(db, seeded.last_review_id or 0)
+        return False
+
+    rng = random.Random(seed)
+    await db.execute(delete(benchmark_seeds))
+    await db.execute(delete(models.BookReview))
+    for start in range(0, rows, SEED_CHUNK_SIZE):
+        await db.execute(
+            insert(models.BookReview.__table__),
+            [
+                {
+                    "book_id": rng.choice(book_ids),
+                    "rating": rng.randint(0, 5),
+                    "review": f"Benchmark review {start + number}",
+                    "date": SEED_START_DATE
+                    + timedelta(seconds=rng.randrange(SEED_DAYS * 24 * 60 * 60)),
+                }
+                for number in range(min(SEED_CHUNK_SIZE, rows - start))
+            ],
+        )
+        await db.commit()
+    last_review_id = await db.execute(select(func.max(models.BookReview.id)))
+    await db.execute(
+        insert(benchmark_seeds).values(
+            rows=rows,
+            book_count=len(book_ids),
+            seed=seed,
+            last_review_id=last_review_id.scalar(),
+        )
+    )
+    await db.commit()
+    await aggregates.rebuild_rating_stats(db)
+    await aggregates.rebuild_rating_rollups(db)
+    return True
+
+
+async def delete_written_reviews(db: AsyncSession, last_review_id: int) -> int:
+    """
+    This function is used to delete the reviews written by benchmark runs,
+    after the seeded ones, and to rebuild the aggregates without them
+
+    :param db: database session
+    :param last_review_id: id of the last seeded review
+
+    :return: number of deleted reviews
+    """
+
+    deleted = await db.execute(
+        delete(models.BookReview).where(models.BookReview.id > last_review_id)
+    )
+    await db.commit()
+    if deleted.rowcount:
+        await aggregates.rebuild_rating_stats(db)
+        await aggregates.rebuild_rating_rollups(db)
+    return deleted.rowcount
+
+
+async def seed_books(catalog: Dict[int, dict]):
+    """
+    This function is used to store the metadata of every book in the
+    catalog, so reads do not depend on the upstream until it expires
+
+    :param catalog: book data by book id
+    """
+
+    await repository.store_books(catalog.values())
@@ -0,0 +1,165 @@
+"""
+Response serialization benchmark
+
+Run `python -m benchmarks.serialization` from the root of the project to
+measure the CPU time per request of a top-rated page and a search page of
+100 books, when responses are validated against their response model and
+encoded with the standard JSON encoder, validated and encoded with orjson,
+or sent as is with orjson (TRUSTED_RESPONSES=true).
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+import time
+from datetime import datetime
+from typing import Dict, Type
+
+import httpx
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse, ORJSONResponse
+from pydantic import BaseModel
+
+import books.schemas as schemas
+from responses import trusted_response
+from tests import fake_gutendex
+
+MODES = ("validated", "orjson", "trusted")
+
+
+def build_payloads(book_count: int) -> Dict[str, tuple]:
+    """
+    This function is used to build a top-rated page and a search page, as
+    returned by the repository
+
+    :param book_count: number of books per page
+
+    :return: response model and payload by endpoint name
+    """
+
+    books = [
+        {
+            "id": book["id"],
+            "title": book["title"],
+            "authors": book["authors"],
+            "languages": book["languages"],
+            "download_count": book["download_count"],
+        }
+        for book in fake_gutendex.generate_books(book_count).values()
+    ]
+    top_rated = {
+        "books": [
+            {
+                **book,
+                "rating": 4.5,
+                "review_count": 120,
+                "reviews": ["A review of a few words"] * 5,
+                "rank": rank,
+                "score": 4.5,
+            }
+            for rank, book in enumerate(books, start=1)
+        ],
+        "total": 1000,
+        "ranking": schemas.LeaderboardRanking.average,
+        "refreshed_at": datetime.utcnow(),
+    }
+    search = {
+        "count": 1000,
+        "next": "http://localhost:8000/books?page=2&search=book",
+        "previous": None,
+        "books": books,
+    }
+    return {
+        "top_rated": (schemas.LeaderboardPage, top_rated),
+        "search": (schemas.APIResponse, search),
+    }
+
+
+def build_app(model: Type[BaseModel], payload: dict, mode: str) -> FastAPI:
+    """
+    This function is used to serve a payload the way the API would in a
+    serialization mode
+
+    :param model: response model
+    :param payload: response payload
+    :param mode: one of validated, orjson or trusted
+
+    :return: app serving the payload at /
+    """
+
+    app = FastAPI(
+        default_response_class=JSONResponse if mode == "validated" else ORJSONResponse
+    )
+
+    async def endpoint():
+        return payload
+
+    if mode == "trusted":
+        endpoint = trusted_response(endpoint, trusted=True)
+    app.get("/", response_model=model)(endpoint)
+    return app
+
+
+async def measure(app: FastAPI, requests: int) -> dict:
+    """
+    This function is used to measure the CPU time per request of an app
+
+    :param app: app under test
+    :param requests: number of requests
+
+    :return: CPU time per request and response size
+    """
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(
+        transport=transport, base_url="http://benchmark"
+    ) as client:
+        response = await client.get("/")
+        started = time.process_time()
+        for _ in range(requests):
+            await client.get("/")
+        cpu_seconds = time.process_time() - started
+    return {
+        "cpu_ms_per_request": round(cpu_seconds / requests * 1000, 3),
+        "response_bytes": len(response.content),
+    }
+
+
+async def run(book_count: int, requests: int) -> dict:
+    """
+    This function is used to measure every endpoint in every mode
+
+    :param book_count: number of books per page
+    :param requests: number of requests per endpoint and mode
+
+    :return: results by endpoint and mode
+    """
+
+    results: Dict[str, dict] = {}
+    for name, (model, payload) in build_payloads(book_count).items():
+        results[name] = {}
+        for mode in MODES:
+            results[name][mode] = await measure(
+                build_app(model, payload, mode), requests
+            )
+            print(f"{name} {mode}: {results[name][mode]}", file=sys.stderr)
+        baseline = results[name]["validated"]["cpu_ms_per_request"]
+        for mode in MODES:
+            cpu = results[name][mode]["cpu_ms_per_request"]
+            results[name][mode]["speedup"] = round(baseline / cpu, 2) if cpu else None
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the response serialization modes"
+    )
+    parser.add_argument("--books", type=int, default=100, help="books per page")
+    parser.add_argument("--requests", type=int, default=500, help="per mode")
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args.books, args.requests)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
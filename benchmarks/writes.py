@@ -0,0 +1,116 @@
+"""
+Review write benchmark
+
+Run `python -m benchmarks.writes` from the root of the project to measure
+the sustained review write throughput when every review is committed by
+its request (REVIEW_WRITE_MODE=sync), and when reviews are queued and
+written in batches (REVIEW_WRITE_MODE=queued). Queued throughput counts
+the time until the last queued review is committed.
+"""
+
+import os
+
+os.environ.setdefault("SQLALCHEMY_DATABASE_URL", "sqlite+aiosqlite:///./benchmark.db")
+
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+
+import httpx
+
+import books.repository as repository
+import books.router as router
+from benchmarks import run, seed
+from database import SessionLocal
+from main import app
+from tests import fake_gutendex
+
+MODES = ("sync", "queued")
+
+
+async def measure_writes(
+    client: httpx.AsyncClient,
+    book_ids: list,
+    mode: str,
+    requests: int,
+    concurrency: int,
+    rng: random.Random,
+) -> dict:
+    """
+    This function is used to send `requests` reviews and to measure how
+    fast they are committed
+
+    :param client: client for the app
+    :param book_ids: reviewed books
+    :param mode: review write mode
+    :param requests: number of reviews
+    :param concurrency: number of concurrent clients
+    :param rng: random generator
+
+    :return: request latencies, and committed reviews per second
+    """
+
+    def make_request() -> run.Request:
+        return (
+            "POST",
+            f"/books/{rng.choice(book_ids)}/review",
+            {"json": {"review": "Benchmark review", "rating": rng.randint(0, 5)}},
+        )
+
+    router.REVIEW_WRITE_MODE = mode
+    async with SessionLocal() as db:
+        reviews_before = await seed.count_reviews(db)
+
+    started = time.perf_counter()
+    results = await run.measure(client, make_request, requests, concurrency)
+    await repository.review_writer.stop()
+    elapsed = time.perf_counter() - started
+
+    async with SessionLocal() as db:
+        committed = await seed.count_reviews(db) - reviews_before
+    results["committed"] = committed
+    results["committed_per_second"] = round(committed / elapsed, 1)
+    return results
+
+
+async def main_async(args: argparse.Namespace) -> dict:
+    catalog = {**fake_gutendex.BOOKS, **fake_gutendex.generate_books(args.books)}
+    book_ids = list(catalog)
+    rng = random.Random(args.seed)
+
+    await run.start_app(fake_gutendex.create_app(catalog))
+    try:
+        await seed.seed_books(catalog)
+        results = {}
+        transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://benchmark"
+        ) as client:
+            for mode in args.modes or MODES:
+                results[mode] = await measure_writes(
+                    client, book_ids, mode, args.requests, args.concurrency, rng
+                )
+                print(f"{mode}: {results[mode]}", file=sys.stderr)
+    finally:
+        await run.stop_app()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the review writes")
+    parser.add_argument("--books", type=int, default=1000, help="catalog size")
+    parser.add_argument("--requests", type=int, default=2000, help="per mode")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--mode", dest="modes", action="append", choices=MODES, help="only this mode"
+    )
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(main_async(args)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
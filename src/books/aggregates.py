@@ -0,0 +1,243 @@
+"""
+Book rating aggregates
+
+Run `python -m books.aggregates` from the `src` directory to rebuild the
+aggregates and the daily rating rollups from the existing reviews.
+"""
+
+import asyncio
+from datetime import date, datetime
+from typing import Dict, Iterable, Optional, Tuple
+
+from sqlalchemy import (Float, Table, case, cast, delete, insert, or_, select)
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.sql import func
+
+import migrations
+import models as models
+from database import SessionLocal, day_of, engine
+
+
+def upsert(table: Table, dialect_name: str = engine.dialect.name):
+    """
+    This function is used to build an INSERT ... ON CONFLICT statement, so
+    concurrent writers adding the first row of a key do not conflict
+
+    :param table: table
+    :param dialect_name: database dialect name
+
+    :return: dialect insert statement
+    """
+
+    if dialect_name == "postgresql":
+        return postgresql.insert(table)
+    return sqlite.insert(table)
+
+
+def _add_stats():
+    stats = models.BookRatingStats.__table__
+    statement = upsert(stats)
+    added = statement.excluded
+    return statement.on_conflict_do_update(
+        index_elements=[stats.c.book_id],
+        set_={
+            "review_count": stats.c.review_count + added.review_count,
+            "rating_sum": stats.c.rating_sum + added.rating_sum,
+            "rating_avg": cast(stats.c.rating_sum + added.rating_sum, Float)
+            / (stats.c.review_count + added.review_count),
+            "last_review_at": case(
+                (
+                    or_(
+                        stats.c.last_review_at.is_(None),
+                        stats.c.last_review_at < added.last_review_at,
+                    ),
+                    added.last_review_at,
+                ),
+                else_=stats.c.last_review_at,
+            ),
+        },
+    )
+
+
+def _add_rollups():
+    rollups = models.BookRatingRollup.__table__
+    statement = upsert(rollups)
+    added = statement.excluded
+    return statement.on_conflict_do_update(
+        index_elements=[rollups.c.book_id, rollups.c.day],
+        set_={
+            "review_count": rollups.c.review_count + added.review_count,
+            "rating_sum": rollups.c.rating_sum + added.rating_sum,
+        },
+    )
+
+
+async def record_review_rating(
+    book_id: int, rating: int, db: AsyncSession, day: Optional[date] = None
+):
+    """
+    This function is used to add a new review rating to the book aggregates
+    and to the daily rating rollups, within the caller's transaction
+
+    :param book_id: book id
+    :param rating: review rating
+    :param db: database session
+    :param day: review day, today (UTC) by default
+    """
+
+    await db.execute(
+        _add_stats().values(
+            book_id=book_id,
+            review_count=1,
+            rating_sum=rating,
+            rating_avg=float(rating),
+            last_review_at=func.now(),
+        )
+    )
+    await db.execute(
+        _add_rollups().values(
+            book_id=book_id,
+            day=day or datetime.utcnow().date(),
+            review_count=1,
+            rating_sum=rating,
+        )
+    )
+
+
+async def record_review_ratings(reviews: Iterable[dict], db: AsyncSession):
+    """
+    This function is used to add many new reviews to the book aggregates
+    and to the daily rating rollups, with executemany upserts, within the
+    caller's transaction
+
+    :param reviews: inserted reviews, with book_id, rating and date
+    :param db: database session
+    """
+
+    reviews = list(reviews)
+    totals: Dict[int, dict] = {}
+    for review in reviews:
+        total = totals.setdefault(
+            review["book_id"],
+            {
+                "book_id": review["book_id"],
+                "review_count": 0,
+                "rating_sum": 0,
+                "last_review_at": None,
+            },
+        )
+        total["review_count"] += 1
+        total["rating_sum"] += review["rating"]
+        if total["last_review_at"] is None or review["date"] > total["last_review_at"]:
+            total["last_review_at"] = review["date"]
+    if not totals:
+        return
+
+    for total in totals.values():
+        total["rating_avg"] = total["rating_sum"] / total["review_count"]
+    await db.execute(_add_stats(), list(totals.values()))
+    await record_rollups(reviews, db)
+
+
+async def record_rollups(reviews: Iterable[dict], db: AsyncSession):
+    """
+    This function is used to add many new reviews to the daily rating
+    rollups, within the caller's transaction
+
+    :param reviews: inserted reviews, with book_id, rating and date
+    :param db: database session
+    """
+
+    totals: Dict[Tuple[int, date], dict] = {}
+    for review in reviews:
+        day = review["date"].date()
+        total = totals.setdefault(
+            (review["book_id"], day),
+            {
+                "book_id": review["book_id"],
+                "day": day,
+                "review_count": 0,
+                "rating_sum": 0,
+            },
+        )
+        total["review_count"] += 1
+        total["rating_sum"] += review["rating"]
+    if totals:
+        await db.execute(_add_rollups(), list(totals.values()))
+
+
+async def rebuild_rating_stats(db: AsyncSession) -> int:
+    """
+    This function is used to recompute the aggregates from all reviews
+
+    :param db: database session
+
+    :return: number of books with aggregates
+    """
+
+    reviews = models.BookReview
+    aggregates = select(
+        [
+            reviews.book_id,
+            func.count(reviews.id),
+            func.sum(reviews.rating),
+            cast(func.avg(reviews.rating), Float),
+            func.max(reviews.date),
+        ]
+    ).group_by(reviews.book_id)
+
+    await db.execute(delete(models.BookRatingStats))
+    await db.execute(
+        insert(models.BookRatingStats).from_select(
+            ["book_id", "review_count", "rating_sum", "rating_avg", "last_review_at"],
+            aggregates,
+        )
+    )
+    await db.commit()
+    book_count = await db.execute(select(func.count(models.BookRatingStats.book_id)))
+    return book_count.scalar()
+
+
+async def rebuild_rating_rollups(db: AsyncSession) -> int:
+    """
+    This function is used to recompute the daily rating rollups from all
+    reviews
+
+    :param db: database session
+
+    :return: number of rollup rows
+    """
+
+    reviews = models.BookReview
+    day = day_of(reviews.date)
+    rollups = select(
+        [reviews.book_id, day, func.count(reviews.id), func.sum(reviews.rating)]
+    ).group_by(reviews.book_id, day)
+
+    await db.execute(delete(models.BookRatingRollup))
+    await db.execute(
+        insert(models.BookRatingRollup).from_select(
+            ["book_id", "day", "review_count", "rating_sum"], rollups
+        )
+    )
+    await db.commit()
+    rollup_count = await db.execute(
+        select(func.count()).select_from(models.BookRatingRollup)
+    )
+    return rollup_count.scalar()
+
+
+async def main():
+    await migrations.upgrade()
+    async with SessionLocal() as session:
+        book_count = await rebuild_rating_stats(session)
+        rollup_count = await rebuild_rating_rollups(session)
+    print(
+        f"Rebuilt rating aggregates for {book_count} books "
+        f"and {rollup_count} daily rating rollups"
+    )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,250 @@
+"""
+Book catalog import
+
+Run `python -m books.catalog <file>` from the `src` directory to load a
+book catalog into the book metadata and the local search index. The file
+can be a Gutendex dump (a JSON list of books, a JSON object with results,
+or JSON lines) or the Project Gutenberg pg_catalog.csv. Run
+`python -m books.catalog --rebuild-index` to rebuild the search index from
+the stored books.
+"""
+
+import argparse
+import asyncio
+import csv
+import json
+import re
+from datetime import datetime
+from typing import Iterable, Iterator, List, Optional
+
+from sqlalchemy import delete, insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import books.schemas as schemas
+import books.search as search_index
+import migrations
+import models as models
+from database import SessionLocal, engine
+
+CATALOG_BATCH_SIZE = 1000
+# pg_catalog.csv has no download counts, so its books are stored as expired
+# metadata, refreshed from Gutendex when they are first read
+STALE_UPDATED_AT = datetime(1970, 1, 1)
+
+AUTHOR_ROLE = re.compile(r"\s*\[[^\]]*\]")
+AUTHOR_YEARS = re.compile(
+    r"^(?P<name>.*?),\s*(?P<birth>\d{1,4})?\??(?: BCE)?-(?P<death>\d{1,4})?\??"
+    r"(?: BCE)?$"
+)
+
+
+def parse_author(author: str) -> dict:
+    """
+    This function is used to read a pg_catalog.csv author, such as
+    "Baum, L. Frank, 1856-1919 [Illustrator]"
+
+    :param author: catalog author
+
+    :return: author data
+    """
+
+    author = AUTHOR_ROLE.sub("", author).strip()
+    years = AUTHOR_YEARS.match(author)
+    if years is None:
+        return {"name": author, "birth_year": None, "death_year": None}
+    return {
+        "name": years["name"],
+        "birth_year": int(years["birth"]) if years["birth"] else None,
+        "death_year": int(years["death"]) if years["death"] else None,
+    }
+
+
+def read_pg_catalog(lines: Iterable[str]) -> Iterator[dict]:
+    """
+    This function is used to read the books of pg_catalog.csv, of every
+    type, as Gutendex lists them all
+
+    :param lines: file lines
+
+    :return: book data
+    """
+
+    for row in csv.DictReader(lines):
+        yield {
+            "id": int(row["Text#"]),
+            "title": " ".join(row["Title"].split()),
+            "authors": [
+                parse_author(author)
+                for author in row.get("Authors", "").split(";")
+                if author.strip()
+            ],
+            "languages": [
+                language.strip()
+                for language in row.get("Language", "").split(";")
+                if language.strip()
+            ],
+            "download_count": 0,
+        }
+
+
+def read_gutendex_dump(file) -> Iterator[dict]:
+    """
+    This function is used to read Gutendex books, from a JSON list, a JSON
+    page with results, or JSON lines
+
+    :param file: open file
+
+    :return: book data
+    """
+
+    first_character = file.read(1)
+    file.seek(0)
+    if first_character in "[{":
+        try:
+            data = json.load(file)
+        except json.JSONDecodeError:
+            file.seek(0)
+        else:
+            yield from data["results"] if isinstance(data, dict) else data
+            return
+    for line in file:
+        if line.strip():
+            yield json.loads(line)
+
+
+def read_catalog(path: str) -> Iterator[dict]:
+    with open(path, encoding="utf-8", newline="") as file:
+        if path.endswith(".csv"):
+            yield from read_pg_catalog(file)
+        else:
+            yield from read_gutendex_dump(file)
+
+
+async def store_catalog_books(
+    books: List[dict], db: AsyncSession, stale: bool = False
+):
+    """
+    This function is used to store the metadata and the index entries of a
+    batch of books, within the caller's transaction. Stored books are
+    replaced, or, for stale book data, kept as they are.
+
+    :param books: validated book data
+    :param db: database session
+    :param stale: whether the book data is incomplete, such as the
+        pg_catalog.csv books without download counts
+
+    :return: number of stored books
+    """
+
+    book_ids = [book["id"] for book in books]
+    if stale:
+        stored_ids = set(
+            (
+                await db.execute(
+                    select(models.Book.id).where(models.Book.id.in_(book_ids))
+                )
+            ).scalars()
+        )
+        books = [book for book in books if book["id"] not in stored_ids]
+        if not books:
+            return 0
+        updated_at = STALE_UPDATED_AT
+    else:
+        await db.execute(delete(models.Book).where(models.Book.id.in_(book_ids)))
+        updated_at = datetime.utcnow()
+    await db.execute(
+        insert(models.Book.__table__),
+        [{**book, "updated_at": updated_at} for book in books],
+    )
+    await search_index.index_books(books, db)
+    return len(books)
+
+
+async def import_catalog(
+    books_data: Iterable[dict],
+    source: str,
+    db: AsyncSession,
+    batch_size: int = CATALOG_BATCH_SIZE,
+    stale: bool = False,
+    complete: bool = False,
+) -> int:
+    """
+    This function is used to load a book catalog, one transaction per batch
+
+    :param books_data: book data
+    :param source: catalog file name
+    :param db: database session
+    :param batch_size: number of books per transaction
+    :param stale: whether the book data is incomplete, so books that are
+        already stored are kept and new books are refreshed when first read
+    :param complete: whether the catalog lists every book up to its highest
+        id, so lower ids that are not in it can be rejected
+
+    :return: number of imported books
+    """
+
+    book_count = 0
+    max_book_id = None
+    batch = {}
+    for book_data in books_data:
+        book = schemas.Book(**book_data).dict()
+        if max_book_id is None or book["id"] > max_book_id:
+            max_book_id = book["id"]
+        batch[book["id"]] = book
+        if len(batch) >= batch_size:
+            book_count += await store_catalog_books(list(batch.values()), db, stale)
+            await db.commit()
+            batch = {}
+    if batch:
+        book_count += await store_catalog_books(list(batch.values()), db, stale)
+
+    db.add(
+        models.CatalogImport(
+            source=source,
+            book_count=book_count,
+            imported_at=datetime.utcnow(),
+            max_book_id=max_book_id,
+            complete=complete,
+        )
+    )
+    await db.commit()
+    return book_count
+
+
+async def main(path: Optional[str], rebuild_index: bool, complete: bool):
+    await migrations.upgrade()
+    if rebuild_index:
+        async with engine.begin() as connection:
+            await connection.run_sync(search_index.create_index)
+        print("Rebuilt the search index from the stored books")
+    if path:
+        async with SessionLocal() as session:
+            book_count = await import_catalog(
+                read_catalog(path),
+                path,
+                session,
+                stale=path.endswith(".csv"),
+                complete=complete or path.endswith(".csv"),
+            )
+        print(f"Imported {book_count} books from {path}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import a book catalog")
+    parser.add_argument(
+        "path", nargs="?", help="Gutendex JSON dump or pg_catalog.csv file"
+    )
+    parser.add_argument(
+        "--rebuild-index",
+        action="store_true",
+        help="rebuild the search index from the stored books",
+    )
+    parser.add_argument(
+        "--complete",
+        action="store_true",
+        help="the Gutendex dump lists every book, pg_catalog.csv always does",
+    )
+    args = parser.parse_args()
+    if not args.path and not args.rebuild_index:
+        parser.error("a catalog file or --rebuild-index is required")
+    asyncio.run(main(args.path, args.rebuild_index, args.complete))
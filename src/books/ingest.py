@@ -0,0 +1,270 @@
+"""
+Bulk review import
+
+Run `python -m books.ingest <file>` from the `src` directory to import a
+JSON lines or CSV file of reviews. Each row needs book_id, review and
+rating, and may have an ISO 8601 date.
+"""
+
+import argparse
+import asyncio
+import csv
+import json
+import sys
+import time
+from datetime import datetime, timezone
+from typing import AsyncIterator, Dict, Iterable, List, Tuple
+
+from pydantic import ValidationError
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import books.aggregates as aggregates
+import books.repository as repository
+import books.schemas as schemas
+import caching
+import metrics
+import migrations
+import models as models
+import upstream
+from constants import INGEST_BATCH_SIZE, INGEST_MAX_REPORTED_REJECTIONS
+from database import SessionLocal
+
+BOOK_LOOKUP_CHUNK_SIZE = 500
+
+
+async def iter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    """
+    This function is used to split a byte stream into text lines
+
+    :param chunks: byte chunks, e.g. a request body stream
+
+    :return: lines, without line endings
+    """
+
+    buffer = b""
+    async for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            yield line.decode("utf-8").rstrip("\r")
+    if buffer:
+        yield buffer.decode("utf-8").rstrip("\r")
+
+
+async def iter_rows(
+    lines: AsyncIterator[str], file_format: str
+) -> AsyncIterator[Tuple[int, object]]:
+    """
+    This function is used to parse JSON lines or CSV lines into rows.
+    CSV input needs a header line, and quoted values can not span lines.
+
+    :param lines: text lines
+    :param file_format: jsonl or csv
+
+    :return: line numbers with the parsed row, or the parsing error
+    """
+
+    header = None
+    line_number = 0
+    async for line in lines:
+        line_number += 1
+        if not line.strip():
+            continue
+        if file_format == "csv":
+            values = next(csv.reader([line]))
+            if header is None:
+                header = [value.strip() for value in values]
+                continue
+            if len(values) != len(header):
+                yield line_number, ValueError(
+                    f"Expected {len(header)} columns, got {len(values)}"
+                )
+                continue
+            yield line_number, {
+                name: value for name, value in zip(header, values) if value != ""
+            }
+        else:
+            try:
+                yield line_number, json.loads(line)
+            except ValueError as exc:
+                yield line_number, ValueError(f"Invalid JSON: {exc}")
+
+
+def format_error(exc: Exception) -> str:
+    """
+    This function is used to describe why a row was rejected
+
+    :param exc: validation or parsing error
+
+    :return: rejection reason
+    """
+
+    if isinstance(exc, ValidationError):
+        return "; ".join(
+            f"{'.'.join(map(str, error['loc']))}: {error['msg']}"
+            for error in exc.errors()
+        )
+    return str(exc)
+
+
+def to_utc(date: datetime) -> datetime:
+    """
+    This function is used to store review dates as naive UTC datetimes
+
+    :param date: review date
+
+    :return: naive UTC date
+    """
+
+    if date.tzinfo is not None:
+        date = date.astimezone(timezone.utc).replace(tzinfo=None)
+    return date
+
+
+class ReviewImporter:
+    """
+    Validates, batches and inserts imported reviews, keeping the rating
+    aggregates and the response cache up to date
+    """
+
+    def __init__(self, db: AsyncSession, batch_size: int = INGEST_BATCH_SIZE):
+        self.db = db
+        self.batch_size = batch_size
+        self.report = schemas.ImportReport()
+        self.known_books: Dict[int, bool] = {}
+        self.batch: List[Tuple[int, schemas.ReviewImport]] = []
+
+    def reject(self, line: int, reason: str):
+        self.report.rows_rejected += 1
+        if len(self.report.rejections) < INGEST_MAX_REPORTED_REJECTIONS:
+            self.report.rejections.append(
+                schemas.ImportRejection(line=line, reason=reason)
+            )
+
+    async def add(self, line: int, row: object):
+        self.report.rows_read += 1
+        if isinstance(row, Exception):
+            self.reject(line, format_error(row))
+            return
+        try:
+            review = schemas.ReviewImport.parse_obj(row)
+        except (ValidationError, TypeError) as exc:
+            self.reject(line, format_error(exc))
+            return
+        self.batch.append((line, review))
+        if len(self.batch) >= self.batch_size:
+            await self.flush()
+
+    async def check_books(self, book_ids: Iterable[int]):
+        unknown_ids = [
+            book_id for book_id in book_ids if book_id not in self.known_books
+        ]
+        for start in range(0, len(unknown_ids), BOOK_LOOKUP_CHUNK_SIZE):
+            chunk = unknown_ids[start : start + BOOK_LOOKUP_CHUNK_SIZE]
+            books = await repository.get_books_json(chunk)
+            self.known_books.update({book_id: book_id in books for book_id in chunk})
+
+    async def flush(self):
+        batch, self.batch = self.batch, []
+        if not batch:
+            return
+        await self.check_books(dict.fromkeys(review.book_id for _, review in batch))
+
+        now = datetime.utcnow()
+        rows = []
+        for line, review in batch:
+            if not self.known_books[review.book_id]:
+                self.reject(line, f"book_id: book {review.book_id} not found")
+                continue
+            rows.append(
+                {
+                    "book_id": review.book_id,
+                    "rating": review.rating,
+                    "review": review.review,
+                    "date": to_utc(review.date) if review.date else now,
+                }
+            )
+        if not rows:
+            return
+
+        await self.db.execute(insert(models.BookReview.__table__), rows)
+        await aggregates.record_review_ratings(rows, self.db)
+        await self.db.commit()
+        self.report.rows_inserted += len(rows)
+        await repository.invalidate_book_cache(*{row["book_id"] for row in rows})
+
+
+@metrics.timed
+async def ingest_reviews(
+    lines: AsyncIterator[str],
+    file_format: str,
+    db: AsyncSession,
+    batch_size: int = INGEST_BATCH_SIZE,
+) -> schemas.ImportReport:
+    """
+    This function is used to import reviews for many books. Book ids are
+    checked once per distinct id, reviews are inserted in batched
+    transactions and the rating aggregates are updated once per batch.
+
+    :param lines: JSON lines or CSV lines
+    :param file_format: jsonl or csv
+    :param db: database session
+    :param batch_size: number of rows per transaction
+
+    :return: import report
+    """
+
+    started = time.perf_counter()
+    importer = ReviewImporter(db, batch_size)
+    async for line, row in iter_rows(lines, file_format):
+        await importer.add(line, row)
+    await importer.flush()
+
+    report = importer.report
+    report.elapsed_seconds = time.perf_counter() - started
+    if report.elapsed_seconds:
+        report.rows_per_second = report.rows_read / report.elapsed_seconds
+    return report
+
+
+async def read_file(path: str) -> AsyncIterator[str]:
+    with open(path, encoding="utf-8", newline="") as file:
+        for line in file:
+            yield line.rstrip("\r\n")
+
+
+async def main(path: str, file_format: str, batch_size: int):
+    await migrations.upgrade()
+    await caching.startup()
+    await upstream.startup()
+    try:
+        async with SessionLocal() as session:
+            report = await ingest_reviews(
+                read_file(path), file_format, session, batch_size
+            )
+    finally:
+        await upstream.shutdown()
+        await caching.shutdown()
+
+    for rejection in report.rejections:
+        print(f"line {rejection.line}: {rejection.reason}", file=sys.stderr)
+    print(
+        f"Imported {report.rows_inserted} of {report.rows_read} rows "
+        f"({report.rows_rejected} rejected) in {report.elapsed_seconds:.1f}s, "
+        f"{report.rows_per_second:.0f} rows/s"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import book reviews")
+    parser.add_argument("path", help="JSON lines or CSV file")
+    parser.add_argument(
+        "--format",
+        choices=("jsonl", "csv"),
+        help="file format, guessed from the file extension by default",
+    )
+    parser.add_argument("--batch-size", type=int, default=INGEST_BATCH_SIZE)
+    args = parser.parse_args()
+    file_format = args.format or ("csv" if args.path.endswith(".csv") else "jsonl")
+    asyncio.run(main(args.path, file_format, args.batch_size))
@@ -0,0 +1,170 @@
+"""
+Known and unknown book ids
+
+Book ids are checked here before asking the external API about them. Ids
+of the stored books are kept in a bitmap, one bit per id. Once a complete
+catalog was imported, such as pg_catalog.csv, the bitmap holds every book
+up to the highest id of that catalog, so lower ids missing from it are
+rejected without any call. Ids the external
+API answered as not found are remembered for BOOK_NOT_FOUND_TTL seconds.
+"""
+
+import time
+from collections import OrderedDict
+from typing import Iterable, Optional
+
+from sqlalchemy import select
+
+import metrics
+import models as models
+from constants import BOOK_NOT_FOUND_CACHE_SIZE, BOOK_NOT_FOUND_TTL
+from database import SessionLocal
+
+MAX_BITMAP_BOOK_ID = 10_000_000
+
+
+class BookIdSet:
+    """
+    Set of non-negative book ids, stored as a bitmap that grows up to the
+    highest id added
+    """
+
+    def __init__(self, book_ids: Iterable[int] = ()):
+        self.bits = bytearray()
+        self.add_many(book_ids)
+
+    def add(self, book_id: int):
+        if not 0 <= book_id <= MAX_BITMAP_BOOK_ID:
+            return
+        index = book_id >> 3
+        if index >= len(self.bits):
+            self.bits.extend(bytes(max(index + 1 - len(self.bits), len(self.bits))))
+        self.bits[index] |= 1 << (book_id & 7)
+
+    def add_many(self, book_ids: Iterable[int]):
+        for book_id in book_ids:
+            self.add(book_id)
+
+    def __contains__(self, book_id: int) -> bool:
+        index = book_id >> 3
+        return (
+            0 <= book_id
+            and index < len(self.bits)
+            and bool(self.bits[index] & (1 << (book_id & 7)))
+        )
+
+
+class ExpiringSet:
+    """
+    Set whose members expire after `ttl` seconds, holding at most
+    `max_size` members, the oldest are dropped first
+    """
+
+    def __init__(self, ttl: float, max_size: int):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._expires_at: "OrderedDict[int, float]" = OrderedDict()
+
+    def add(self, member: int):
+        self._expires_at.pop(member, None)
+        self._expires_at[member] = time.monotonic() + self.ttl
+        while len(self._expires_at) > self.max_size:
+            self._expires_at.popitem(last=False)
+
+    def discard(self, member: int):
+        self._expires_at.pop(member, None)
+
+    def __contains__(self, member: int) -> bool:
+        expires_at = self._expires_at.get(member)
+        if expires_at is None:
+            return False
+        if expires_at <= time.monotonic():
+            del self._expires_at[member]
+            return False
+        return True
+
+    def __len__(self) -> int:
+        return len(self._expires_at)
+
+
+_known = BookIdSet()
+_catalog_max_id: Optional[int] = None
+_not_found = ExpiringSet(BOOK_NOT_FOUND_TTL, BOOK_NOT_FOUND_CACHE_SIZE)
+
+
+async def load():
+    """
+    This function is used to fill the bitmap with the stored book ids on
+    app startup, and to trust it for ids up to the highest id of the last
+    complete catalog imported
+    """
+
+    global _known, _catalog_max_id
+
+    imports = models.CatalogImport
+    async with SessionLocal() as db:
+        max_id = await db.execute(
+            select(imports.max_book_id)
+            .where(imports.complete.is_(True))
+            .order_by(imports.imported_at.desc(), imports.id.desc())
+            .limit(1)
+        )
+        book_ids = await db.execute(select(models.Book.id))
+        _known = BookIdSet(book_ids.scalars())
+        _catalog_max_id = max_id.scalar()
+
+
+def reset():
+    """
+    This function is used to forget every known and unknown book id
+    """
+
+    global _known, _catalog_max_id, _not_found
+
+    _known = BookIdSet()
+    _catalog_max_id = None
+    _not_found = ExpiringSet(BOOK_NOT_FOUND_TTL, BOOK_NOT_FOUND_CACHE_SIZE)
+
+
+def is_missing(book_id: int) -> bool:
+    """
+    This function is used to tell, without any call, that a book does not
+    exist
+
+    :param book_id: book id
+
+    :return: whether the book is known not to exist
+    """
+
+    if book_id in _known:
+        return False
+    if book_id < 0 or (_catalog_max_id is not None and book_id <= _catalog_max_id):
+        metrics.BOOK_ID_REJECTIONS.inc("catalog")
+        return True
+    if book_id in _not_found:
+        metrics.BOOK_ID_REJECTIONS.inc("not_found")
+        return True
+    return False
+
+
+def record_found(book_ids: Iterable[int]):
+    """
+    This function is used to remember books that exist
+
+    :param book_ids: book ids
+    """
+
+    for book_id in book_ids:
+        _known.add(book_id)
+        _not_found.discard(book_id)
+
+
+def record_not_found(book_ids: Iterable[int]):
+    """
+    This function is used to remember books the external API does not know
+
+    :param book_ids: book ids
+    """
+
+    for book_id in book_ids:
+        _not_found.add(book_id)
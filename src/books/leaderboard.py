@@ -0,0 +1,261 @@
+"""
+Materialized top-rated leaderboards
+
+Every rated book is ranked in memory from the rating aggregates. A
+background task rebuilds the rankings on an interval and shortly after
+review writes, and pages are sliced from the rankings, so a read costs the
+page size rather than the number of rated books. Rankings are built in a
+worker thread, so the event loop keeps serving requests meanwhile. Each
+process keeps its own rankings, writes made by other processes show up on
+the next interval. Cached top-rated responses are only dropped when the
+rankings changed.
+"""
+
+import asyncio
+import logging
+import operator
+import time
+from datetime import datetime
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from sqlalchemy import select
+
+import books.schemas as schemas
+import caching
+import metrics
+import models as models
+from constants import (LEADERBOARD_MIN_REFRESH_INTERVAL,
+                       LEADERBOARD_PRIOR_WEIGHT, LEADERBOARD_REFRESH_INTERVAL)
+from database import SessionLocal
+from singleflight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+MAX_FILTERED_VIEWS = 64
+
+
+class Entry(NamedTuple):
+    """
+    Ranked book
+    """
+
+    book_id: int
+    rating: float
+    review_count: int
+    score: float
+    languages: Tuple[str, ...]
+
+
+class Leaderboard:
+    """
+    Rankings of every rated book by average and by Bayesian average. The
+    Bayesian average pulls the rating of books with few reviews towards the
+    mean rating of all reviews, weighted as `prior_weight` reviews.
+    """
+
+    def __init__(
+        self,
+        stats: List[Tuple[int, int, int, Optional[Iterable[str]]]],
+        prior_weight: float = LEADERBOARD_PRIOR_WEIGHT,
+    ):
+        self.refreshed_at = datetime.utcnow()
+        self.built_at = time.monotonic()
+        self.version = 0
+        review_total = sum(review_count for _, review_count, _, _ in stats)
+        rating_total = sum(rating_sum for _, _, rating_sum, _ in stats)
+        prior = prior_weight * (rating_total / review_total if review_total else 0)
+
+        self.rankings: Dict[schemas.LeaderboardRanking, List[Entry]] = {}
+        for ranking in schemas.LeaderboardRanking:
+            entries = []
+            for book_id, review_count, rating_sum, languages in stats:
+                rating = rating_sum / review_count
+                score = rating
+                if ranking == schemas.LeaderboardRanking.bayesian:
+                    score = (prior + rating_sum) / (prior_weight + review_count)
+                entries.append(
+                    Entry(
+                        book_id, rating, review_count, score, tuple(languages or ())
+                    )
+                )
+            entries.sort(
+                key=lambda entry: (-entry.score, -entry.review_count, entry.book_id)
+            )
+            self.rankings[ranking] = entries
+        self._views: Dict[tuple, List[Entry]] = {}
+
+    def view(
+        self,
+        ranking: schemas.LeaderboardRanking,
+        language: Optional[str] = None,
+        min_reviews: int = 1,
+    ) -> List[Entry]:
+        """
+        This function is used to get a filtered ranking, filtering once per
+        leaderboard build
+
+        :param ranking: ranking order
+        :param language: only books in this language
+        :param min_reviews: only books with at least this many reviews
+
+        :return: ranked books
+        """
+
+        entries = self.rankings[ranking]
+        if language is None and min_reviews <= 1:
+            return entries
+        key = (ranking, language, min_reviews)
+        view = self._views.get(key)
+        if view is None:
+            view = [
+                entry
+                for entry in entries
+                if entry.review_count >= min_reviews
+                and (language is None or language in entry.languages)
+            ]
+            if len(self._views) >= MAX_FILTERED_VIEWS:
+                self._views.clear()
+            self._views[key] = view
+        return view
+
+
+_leaderboard: Optional[Leaderboard] = None
+_version = 0
+_wake: Optional[asyncio.Event] = None
+_task: Optional[asyncio.Task] = None
+_flight = SingleFlight()
+
+
+@metrics.timed
+async def build() -> Leaderboard:
+    """
+    This function is used to rank every rated book from the rating
+    aggregates and the stored book languages, off the event loop
+
+    :return: leaderboard
+    """
+
+    stats = models.BookRatingStats
+    async with SessionLocal() as db:
+        rows = await db.execute(
+            select(
+                stats.book_id,
+                stats.review_count,
+                stats.rating_sum,
+                models.Book.languages,
+            )
+            .outerjoin(models.Book, models.Book.id == stats.book_id)
+            .where(stats.review_count > 0)
+        )
+        rows = rows.all()
+    return await asyncio.to_thread(Leaderboard, rows)
+
+
+async def _rebuild() -> Leaderboard:
+    global _leaderboard
+
+    version = _version
+    board = await build()
+    board.version = version
+    previous, _leaderboard = _leaderboard, board
+    if (
+        previous is None
+        or board.version > previous.version
+        or await asyncio.to_thread(operator.ne, board.rankings, previous.rankings)
+    ):
+        await caching.bump_generation("top-rated")
+    return _leaderboard
+
+
+async def refresh() -> Leaderboard:
+    """
+    This function is used to rebuild the leaderboard, or join the rebuild in
+    progress. Cached top-rated responses are dropped once it is rebuilt, if
+    reviews were written or the rankings changed.
+
+    :return: leaderboard
+    """
+
+    return await _flight.do("leaderboard", _rebuild)
+
+
+async def get_leaderboard() -> Leaderboard:
+    """
+    This function is used to get the current leaderboard. It is rebuilt
+    first if it was never built, or if reviews were written since it was
+    built and LEADERBOARD_MIN_REFRESH_INTERVAL has passed.
+
+    :return: leaderboard
+    """
+
+    if _leaderboard is None or (
+        _leaderboard.version < _version
+        and time.monotonic() - _leaderboard.built_at
+        >= LEADERBOARD_MIN_REFRESH_INTERVAL
+    ):
+        return await refresh()
+    return _leaderboard
+
+
+def invalidate():
+    """
+    This function is used to mark the leaderboard as out of date after a
+    review write, and to wake up the refresh task
+    """
+
+    global _version
+
+    _version += 1
+    if _wake is not None:
+        _wake.set()
+
+
+async def _refresh_periodically(interval: float):
+    while True:
+        try:
+            await asyncio.wait_for(_wake.wait(), timeout=interval)
+        except asyncio.TimeoutError:
+            pass
+        _wake.clear()
+        if _leaderboard is not None:
+            wait = LEADERBOARD_MIN_REFRESH_INTERVAL - (
+                time.monotonic() - _leaderboard.built_at
+            )
+            if wait > 0:
+                await asyncio.sleep(wait)
+        try:
+            await refresh()
+        except Exception as exc:
+            logger.warning("Leaderboard refresh failed: %r", exc)
+
+
+async def startup(interval: float = LEADERBOARD_REFRESH_INTERVAL):
+    """
+    This function is used to start the leaderboard refresh task
+
+    :param interval: seconds between refreshes without review writes,
+        0 disables the task
+    """
+
+    global _wake, _task
+
+    _wake = asyncio.Event()
+    if interval > 0:
+        _task = asyncio.create_task(_refresh_periodically(interval))
+
+
+async def shutdown():
+    """
+    This function is used to stop the leaderboard refresh task and to drop
+    the leaderboard
+    """
+
+    global _leaderboard, _wake, _task
+
+    if _task is not None:
+        _task.cancel()
+        try:
+            await _task
+        except asyncio.CancelledError:
+            pass
+    _leaderboard, _wake, _task = None, None, None
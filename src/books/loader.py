@@ -0,0 +1,150 @@
+"""
+Batched book loader for the external API
+"""
+
+import asyncio
+import math
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional
+
+from fastapi import HTTPException, status
+
+import upstream
+from constants import (BOOK_LOADER_BATCH_WINDOW, BOOK_LOADER_MAX_BATCH_SIZE,
+                       EXTERNAL_API_URL)
+
+
+async def fetch_books_page(book_ids: List[int], page: int = 1) -> dict:
+    """
+    This function is used to get one page of the external API ids listing
+
+    :param book_ids: book ids
+    :param page: page number
+
+    :return: page data
+    """
+
+    queryparam_dict = {
+        "ids": ",".join(str(book_id) for book_id in book_ids),
+        "page": page if page > 1 else None,
+    }
+    book_list = await upstream.get(EXTERNAL_API_URL, params=queryparam_dict)
+    if book_list.status_code != status.HTTP_200_OK:
+        raise HTTPException(
+            status_code=book_list.status_code, detail=upstream.error_detail(book_list)
+        )
+    return book_list.json()
+
+
+async def fetch_books_json(book_ids: List[int]) -> Dict[int, dict]:
+    """
+    This function is used to get several books from the external API with
+    a single ids query, fetching any extra result pages concurrently
+
+    :param book_ids: book ids
+
+    :return: book data by id, books that do not exist are left out
+    """
+
+    first_page = await fetch_books_page(book_ids)
+    results = list(first_page["results"])
+    if first_page["next"] and results:
+        page_count = math.ceil(first_page["count"] / len(results))
+        pages = await asyncio.gather(
+            *[fetch_books_page(book_ids, page) for page in range(2, page_count + 1)]
+        )
+        for page in pages:
+            results.extend(page["results"])
+    return {book_data["id"]: book_data for book_data in results}
+
+
+class BookLoader:
+    """
+    Collects the book ids requested within a short window, including ids
+    coming from concurrent requests, and resolves them in batched upstream
+    calls. Ids already being fetched join the call in flight instead of
+    starting a new one. Ids the external API does not know resolve to None.
+    When on_loaded returns a list, its books are served instead of the raw
+    upstream ones.
+    """
+
+    def __init__(
+        self,
+        batch_window: float = BOOK_LOADER_BATCH_WINDOW,
+        max_batch_size: int = BOOK_LOADER_MAX_BATCH_SIZE,
+        on_loaded: Optional[
+            Callable[[List[dict]], Awaitable[Optional[List[dict]]]]
+        ] = None,
+    ):
+        self.batch_window = batch_window
+        self.max_batch_size = max_batch_size
+        self.on_loaded = on_loaded
+        self._pending: Dict[int, asyncio.Future] = {}
+        self._in_flight: Dict[int, asyncio.Future] = {}
+        self._dispatch: Optional[asyncio.TimerHandle] = None
+
+    async def load(self, book_id: int) -> Optional[dict]:
+        """
+        This function is used to load a single book
+
+        :param book_id: book id
+
+        :return: book data, or None if the book does not exist
+        """
+
+        return (await self.load_many([book_id]))[book_id]
+
+    async def load_many(self, book_ids: Iterable[int]) -> Dict[int, Optional[dict]]:
+        """
+        This function is used to load several books
+
+        :param book_ids: book ids
+
+        :return: book data by id, None for books that do not exist
+        """
+
+        loop = asyncio.get_running_loop()
+        futures = {}
+        for book_id in dict.fromkeys(book_ids):
+            future = self._in_flight.get(book_id) or self._pending.get(book_id)
+            if future is None:
+                future = self._pending[book_id] = loop.create_future()
+            futures[book_id] = future
+
+        if self._pending and self._dispatch is None:
+            self._dispatch = loop.call_later(self.batch_window, self._dispatch_batch)
+
+        results = await asyncio.gather(
+            *[asyncio.shield(future) for future in futures.values()]
+        )
+        return dict(zip(futures.keys(), results))
+
+    def _dispatch_batch(self):
+        batch, self._pending, self._dispatch = self._pending, {}, None
+        self._in_flight.update(batch)
+        book_ids = list(batch.keys())
+        for start in range(0, len(book_ids), self.max_batch_size):
+            chunk = {
+                book_id: batch[book_id]
+                for book_id in book_ids[start : start + self.max_batch_size]
+            }
+            asyncio.ensure_future(self._resolve(chunk))
+
+    async def _resolve(self, futures: Dict[int, asyncio.Future]):
+        try:
+            books = await fetch_books_json(list(futures.keys()))
+            if books and self.on_loaded:
+                loaded = await self.on_loaded(list(books.values()))
+                if loaded is not None:
+                    books = {book_data["id"]: book_data for book_data in loaded}
+        except Exception as exc:
+            for future in futures.values():
+                if not future.done():
+                    future.set_exception(exc)
+        else:
+            for book_id, future in futures.items():
+                if not future.done():
+                    future.set_result(books.get(book_id))
+        finally:
+            for book_id, future in futures.items():
+                if self._in_flight.get(book_id) is future:
+                    del self._in_flight[book_id]
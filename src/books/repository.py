@@ -3,38 +3,56 @@ Books repository
 """
 
 import asyncio
+import time
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, List, Optional
+from uuid import uuid4
 
-import requests
 from fastapi import Depends, HTTPException, status
-from sqlalchemy import extract, select
-from sqlalchemy.orm import Session
+from sqlalchemy import Float, and_, cast, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.sql import func
 
+import books.aggregates as aggregates
+import books.known_ids as known_ids
+import books.leaderboard as leaderboard
+import books.loader as loader
+import books.review_queue as review_queue
 import books.schemas as schemas
+import books.search as search_index
+import caching
+import metrics
 import models as models
-from constants import (BOOK_SEARCH_ENDPOINT, EXTERNAL_API_URL, MONTHS,
-                           PROJECT_URL)
-from database import get_db
-
-
-async def get_books_by_title(search: str, page: int) -> list:
+import rate_limit
+import upstream
+from constants import (BOOK_METADATA_TTL, BOOK_SEARCH_ENDPOINT,
+                       EXTERNAL_API_URL, GET_BOOK_CACHE_TTL,
+                       LEADERBOARD_PAGE_SIZE, MONTHS, PROJECT_URL,
+                       REVIEW_PAGE_SIZE, REVIEW_PREVIEW_SIZE,
+                       SEARCH_BOOKS_CACHE_TTL, STALE_WHILE_REVALIDATE)
+from conditional import Validators, as_utc, make_validators
+from database import SessionLocal, extract_int, get_db
+from singleflight import SingleFlight
+
+
+@metrics.timed
+async def fetch_books_by_title(search: str, page: int) -> dict:
     """
-    This function is used to get books by title from external API
+    This function is used to search books in the external API, storing
+    the books found
 
     :param search: search string
     :param page: page number
 
-    :return: list of books
+    :return: search results, with links pointing to this API
     """
 
-    if not search:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST, detail="Search string is required"
-        )
     queryparam_dict = {"search": search, "page": page}
-    book_list = requests.get(EXTERNAL_API_URL, params=queryparam_dict)
+    book_list = await upstream.get(EXTERNAL_API_URL, params=queryparam_dict)
     if not book_list.status_code == status.HTTP_200_OK:
-        raise HTTPException(status_code=book_list.status_code, detail=book_list.json())
+        raise HTTPException(
+            status_code=book_list.status_code, detail=upstream.error_detail(book_list)
+        )
 
     results = book_list.json()
     if results["next"]:
@@ -45,10 +63,60 @@ async def get_books_by_title(search: str, page: int) -> list:
         results["previous"] = results["previous"].replace(
             EXTERNAL_API_URL, f"{PROJECT_URL}/{BOOK_SEARCH_ENDPOINT}"
         )
-    results["books"] = results.pop("results")
+    results["books"] = await store_books(results.pop("results"))
+
+    if STALE_WHILE_REVALIDATE:
+        await caching.set_value(
+            "search-results",
+            caching.hash_key(search, page),
+            value={"fetched_at": time.time(), "results": results},
+            expire=SEARCH_BOOKS_CACHE_TTL + STALE_WHILE_REVALIDATE,
+        )
     return results
 
 
+@metrics.timed
+async def get_books_by_title(search: str, page: int, revalidate: bool = False) -> list:
+    """
+    This function is used to get books by title, from the local search
+    index when it is enabled and has hits, or else from the external API.
+    Concurrent identical searches share one upstream call and, with
+    STALE_WHILE_REVALIDATE set, expired results are served while a single
+    background call refreshes them.
+
+    :param search: search string
+    :param page: page number
+    :param revalidate: whether to skip the stale results and ask the
+        external API
+
+    :return: list of books
+    """
+
+    if not search:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="Search string is required"
+        )
+
+    async with SessionLocal() as db:
+        if await search_index.is_enabled(db):
+            results = await search_index.search_books(search, page, db)
+            if results is not None:
+                return results
+
+    def fetch():
+        return fetch_books_by_title(search, page)
+
+    if STALE_WHILE_REVALIDATE and not revalidate:
+        entry = await caching.get_value(
+            "search-results", caching.hash_key(search, page)
+        )
+        if entry:
+            if time.time() - entry["fetched_at"] >= SEARCH_BOOKS_CACHE_TTL:
+                search_flight.refresh((search, page), fetch)
+            return entry["results"]
+    return await search_flight.do((search, page), fetch)
+
+
 async def get_book(book_id: int) -> dict:
     """
     This function is used to get book by id from external API
@@ -58,10 +126,147 @@ async def get_book(book_id: int) -> dict:
     :return: book data
     """
 
-    return requests.get(EXTERNAL_API_URL + str(book_id))
+    return await upstream.get(EXTERNAL_API_URL + str(book_id))
+
+
+def book_to_json(book: models.Book) -> dict:
+    """
+    This function is used to serialize stored book metadata
+
+    :param book: stored book
+
+    :return: book data
+    """
+
+    return {
+        "id": book.id,
+        "title": book.title,
+        "authors": book.authors,
+        "languages": book.languages,
+        "download_count": book.download_count,
+    }
+
+
+def is_book_fresh(book: models.Book, max_age: Optional[int] = None) -> bool:
+    """
+    This function is used to check if stored book metadata is within its TTL
+
+    :param book: stored book
+    :param max_age: maximum age in seconds, defaults to BOOK_METADATA_TTL
+
+    :return: whether the book can be served without refreshing
+    """
+
+    if max_age is None:
+        max_age = BOOK_METADATA_TTL
+    return book.updated_at >= datetime.utcnow() - timedelta(seconds=max_age)
+
+
+@metrics.timed
+async def get_stored_books(book_ids: Iterable[int]) -> Dict[int, models.Book]:
+    """
+    This function is used to get stored book metadata
+
+    :param book_ids: book ids
+
+    :return: stored books by id
+    """
+
+    book_ids = list(book_ids)
+    if not book_ids:
+        return {}
+    async with SessionLocal() as db:
+        books = await db.execute(
+            select(models.Book).where(models.Book.id.in_(book_ids))
+        )
+        return {book.id: book for book in books.scalars()}
 
 
-async def get_book_json(book_id: int):
+@metrics.timed
+async def store_books(books_data: Iterable[dict]) -> List[dict]:
+    """
+    This function is used to save or refresh book metadata, and its entry
+    in the local search index
+
+    :param books_data: book data from the external API
+
+    :return: validated book data, without the fields the API does not serve
+    """
+
+    updated_at = datetime.utcnow()
+    books = [schemas.Book(**book_data).dict() for book_data in books_data]
+    async with SessionLocal() as db:
+        for book in books:
+            await db.merge(models.Book(**book, updated_at=updated_at))
+        await search_index.index_books(books, db)
+        await db.commit()
+    known_ids.record_found(book["id"] for book in books)
+    return books
+
+
+book_loader = loader.BookLoader(on_loaded=store_books)
+search_flight = SingleFlight()
+book_refresh_flight = SingleFlight()
+
+
+@metrics.timed
+async def get_books_json(book_ids: Iterable[int]) -> Dict[int, dict]:
+    """
+    This function is used to get data for several books, reading the local
+    store first and only asking the external API for missing or stale books.
+    Books known not to exist are left out without asking the external API.
+    The store uses its own short-lived sessions, so lookups can run
+    concurrently with queries on the request session. With
+    STALE_WHILE_REVALIDATE set, expired books are served while a single
+    background call refreshes them. While the external API is unavailable,
+    expired books are served whatever their age.
+
+    :param book_ids: book ids
+
+    :return: book data by id, books that do not exist are left out
+    """
+
+    book_ids = list(dict.fromkeys(book_ids))
+    stored_books = await get_stored_books(book_ids)
+    results = {}
+    stale_ids = []
+    for book_id, book in stored_books.items():
+        if is_book_fresh(book):
+            results[book_id] = book_to_json(book)
+        elif STALE_WHILE_REVALIDATE and is_book_fresh(
+            book, BOOK_METADATA_TTL + STALE_WHILE_REVALIDATE
+        ):
+            results[book_id] = book_to_json(book)
+            stale_ids.append(book_id)
+
+    book_refresh_flight.refresh_many(stale_ids, book_loader.load_many)
+
+    missing_ids = [
+        book_id
+        for book_id in book_ids
+        if book_id not in results
+        and (book_id in stored_books or not known_ids.is_missing(book_id))
+    ]
+    try:
+        fetched_books = await book_loader.load_many(missing_ids)
+    except (upstream.UpstreamUnavailable, rate_limit.RateLimited):
+        if not all(book_id in stored_books for book_id in missing_ids):
+            raise
+        fetched_books = {
+            book_id: book_to_json(stored_books[book_id]) for book_id in missing_ids
+        }
+    not_found_ids = []
+    for book_id, book_data in fetched_books.items():
+        if book_data:
+            results[book_id] = book_data
+        else:
+            not_found_ids.append(book_id)
+    known_ids.record_not_found(not_found_ids)
+    return results
+
+
+@metrics.timed
+async def get_book_json(book_id: int) -> dict:
     """
     This function is used to get book data
 
@@ -70,12 +275,19 @@ async def get_book_json(book_id: int):
     :return: book data
     """
 
-    book_request = await get_book(book_id)
-    return book_request.json()
+    books = await get_books_json([book_id])
+    if book_id not in books:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail={"detail": "Not found."}
+        )
+    return books[book_id]
 
 
+@metrics.timed
 async def create_review(
-    book_id: int, book_review: schemas.BaseBookReview, db: Session = Depends(get_db)
+    book_id: int,
+    book_review: schemas.BaseBookReview,
+    db: AsyncSession = Depends(get_db),
 ):
     """
     This function is used to create book review
@@ -87,40 +299,249 @@ async def create_review(
     :return: book review data
     """
 
-    book_request = await get_book(book_id)
-    if book_request.status_code != status.HTTP_200_OK:
-        raise HTTPException(
-            status_code=book_request.status_code, detail=book_request.json()
-        )
+    await get_book_json(book_id)
     review = models.BookReview(**book_review.dict(), book_id=book_id)
     db.add(review)
-    db.commit()
-    db.refresh(review)
+    await aggregates.record_review_rating(book_id, review.rating, db)
+    await db.commit()
+    await db.refresh(review)
+    await invalidate_book_cache(book_id)
     return review
 
 
-async def get_book_avg_rating(book_id: int, db: Session = Depends(get_db)):
+async def invalidate_book_cache(*book_ids: int):
     """
-    This function is used to get book average rating
+    This function is used to drop the cached responses that include the
+    reviews or rating of the given books
+
+    :param book_ids: book ids
+    """
+
+    await asyncio.gather(
+        *[caching.invalidate("book", book_id) for book_id in book_ids],
+        caching.bump_generation("top-rated"),
+    )
+    leaderboard.invalidate()
+
+
+review_writer = review_queue.ReviewWriter(on_written=invalidate_book_cache)
+
+
+@metrics.timed
+async def queue_review(book_id: int, book_review: schemas.BaseBookReview) -> dict:
+    """
+    This function is used to accept a book review, which the review writer
+    stores with the next batch
+
+    :param book_id: book id
+    :param book_review: book review data
+
+    :return: queued review data
+    """
+
+    await get_book_json(book_id)
+    review = {
+        **book_review.dict(),
+        "book_id": book_id,
+        "uuid": str(uuid4()),
+        "date": datetime.utcnow(),
+    }
+    await review_writer.submit(review)
+    return review
+
+
+def latest_reviews_first(query):
+    """
+    This function is used to sort a review query by (date, id), newest first
+
+    :param query: review query
+
+    :return: sorted query
+    """
+
+    return query.order_by(models.BookReview.date.desc(), models.BookReview.id.desc())
+
+
+@metrics.timed
+async def get_review_previews(
+    book_ids: Iterable[int], db: AsyncSession = Depends(get_db)
+) -> Dict[int, list]:
+    """
+    This function is used to get the latest reviews of several books, reading
+    at most REVIEW_PREVIEW_SIZE reviews per book, numbered by a window
+    function in a single query
+
+    :param book_ids: book ids
+    :param db: database session
+
+    :return: review texts by book id
+    """
+
+    previews = {book_id: [] for book_id in book_ids}
+    if not previews:
+        return previews
+    review = models.BookReview
+    position = (
+        func.row_number()
+        .over(
+            partition_by=review.book_id,
+            order_by=(review.date.desc(), review.id.desc()),
+        )
+        .label("position")
+    )
+    latest = (
+        select([review.book_id, review.review, position])
+        .where(review.book_id.in_(list(previews)))
+        .subquery()
+    )
+    reviews = (
+        select([latest.c.book_id, latest.c.review])
+        .where(latest.c.position <= REVIEW_PREVIEW_SIZE)
+        .order_by(latest.c.book_id, latest.c.position)
+    )
+    for row in await db.execute(reviews):
+        previews[row.book_id].append(row.review)
+    return previews
+
+
+@metrics.timed
+async def get_rating_validators(
+    book_id: int, db: AsyncSession = Depends(get_db)
+) -> Validators:
+    """
+    This function is used to get the version of the ratings of a book, from
+    its rating aggregates
+
+    :param book_id: book id
+    :param db: database session
+
+    :return: validators of the rating responses
+    """
+
+    stats = models.BookRatingStats
+    result = await db.execute(
+        select([stats.review_count, stats.last_review_at]).where(
+            stats.book_id == book_id
+        )
+    )
+    review_count, last_review_at = result.first() or (0, None)
+    return make_validators(
+        "ratings", book_id, review_count, last_review_at, last_modified=last_review_at
+    )
+
+
+@metrics.timed
+async def get_book_validators(
+    book_id: int, db: AsyncSession = Depends(get_db)
+) -> Optional[Validators]:
+    """
+    This function is used to get the version of the details of a book, from
+    its rating aggregates and its stored metadata, in a single query
 
     :param book_id: book id
     :param db: database session
 
-    :return: book reviews and average rating
+    :return: validators of the book details, or None if the book metadata is
+        not stored
     """
 
-    avg_rating = select([func.avg(models.BookReview.rating)]).where(
-        models.BookReview.book_id == book_id
+    stats = models.BookRatingStats
+    result = await db.execute(
+        select(
+            [
+                select(models.Book.updated_at)
+                .where(models.Book.id == book_id)
+                .scalar_subquery(),
+                select(stats.review_count)
+                .where(stats.book_id == book_id)
+                .scalar_subquery(),
+                select(stats.last_review_at)
+                .where(stats.book_id == book_id)
+                .scalar_subquery(),
+            ]
+        )
     )
-    reviews = select([models.BookReview.review]).where(
-        models.BookReview.book_id == book_id
+    updated_at, review_count, last_review_at = result.first()
+    if updated_at is None:
+        return None
+    changes = [as_utc(updated_at)]
+    if last_review_at is not None:
+        changes.append(as_utc(last_review_at))
+    return make_validators(
+        "book",
+        book_id,
+        updated_at,
+        review_count or 0,
+        last_review_at,
+        last_modified=max(changes),
     )
-    rating_result = db.execute(avg_rating).scalar()
-    review_result = db.execute(reviews).fetchall()
-    return review_result, rating_result
 
 
-async def gather_book_and_rating(book_id: int, db: Session = Depends(get_db)):
+async def get_cached_book_validators(book_id: int) -> Optional[Validators]:
+    """
+    This function is used to get the version of the details of a book from
+    the cache, next to the cached details, and to only query the database
+    when they are not cached. The validators are kept under the generation of
+    the cached details, so invalidating the details also invalidates them.
+
+    :param book_id: book id
+
+    :return: validators of the book details, or None if the book metadata is
+        not stored
+    """
+
+    generation = await caching.get_generation("book", book_id)
+    entry = await caching.get_value("book-validators", book_id, generation)
+    if entry is not None:
+        last_modified = entry["last_modified"]
+        return Validators(
+            entry["etag"],
+            datetime.fromisoformat(last_modified) if last_modified else None,
+        )
+
+    async with SessionLocal() as db:
+        validators = await get_book_validators(book_id, db)
+    if validators is not None:
+        last_modified = validators.last_modified
+        await caching.set_value(
+            "book-validators",
+            book_id,
+            generation,
+            value={
+                "etag": validators.etag,
+                "last_modified": last_modified.isoformat() if last_modified else None,
+            },
+            expire=GET_BOOK_CACHE_TTL,
+        )
+    return validators
+
+
+@metrics.timed
+async def get_book_avg_rating(
+    book_id: int, db: AsyncSession = Depends(get_db)
+):
+    """
+    This function is used to get book average rating
+
+    :param book_id: book id
+    :param db: database session
+
+    :return: latest book reviews, average rating and review count
+    """
+
+    stats = select(
+        [models.BookRatingStats.rating_avg, models.BookRatingStats.review_count]
+    ).where(models.BookRatingStats.book_id == book_id)
+    stats_result = (await db.execute(stats)).first()
+    review_result = (await get_review_previews([book_id], db))[book_id]
+    if not stats_result:
+        return review_result, None, 0
+    return review_result, stats_result.rating_avg, stats_result.review_count
+
+
+async def gather_book_and_rating(
+    book_id: int, db: AsyncSession = Depends(get_db)
+):
     """
     This function is used to get book data and average rating
 
@@ -133,7 +554,10 @@ async def gather_book_and_rating(book_id: int, db: Session = Depends(get_db)):
     await asyncio.gather(get_book_avg_rating(book_id, db), get_book_json(book_id))
 
 
-async def get_book_with_review(book_id: int, db: Session = Depends(get_db)):
+@metrics.timed
+async def get_book_with_review(
+    book_id: int, db: AsyncSession = Depends(get_db)
+):
     """
     This function is used to get book data and reviews
 
@@ -143,66 +567,177 @@ async def get_book_with_review(book_id: int, db: Session = Depends(get_db)):
     :return: book data and reviews
     """
 
-    (reviews, rating), book_data = await asyncio.gather(
+    (reviews, rating, review_count), book_data = await asyncio.gather(
         get_book_avg_rating(book_id, db), get_book_json(book_id)
     )
     query_dict = {
-        "book_id": book_id,
-        "reviews": [instance[0] for instance in reviews if reviews],
+        "reviews": reviews,
         "rating": rating or 0.0,
+        "review_count": review_count,
     }
     book_data.update(query_dict)
     return book_data
 
 
-async def get_top_rated_books(limit: int = 10, db: Session = Depends(get_db)):
+@metrics.timed
+async def get_book_reviews(
+    book_id: int,
+    cursor: Optional[int] = None,
+    limit: int = REVIEW_PAGE_SIZE,
+    db: AsyncSession = Depends(get_db),
+):
     """
-    This function is used to get top rated books
+    This function is used to get a page of book reviews, newest first.
+    Pages are keyset paginated on (date, id), so each page is an index
+    range read regardless of how deep it is.
+
+    :param book_id: book id
+    :param cursor: id of the last review of the previous page, a review of
+        this book
+    :param limit: number of reviews to return
+    :param db: database session
+
+    :return: page of reviews
+    """
+
+    reviews = select(models.BookReview).where(models.BookReview.book_id == book_id)
+    if cursor is not None:
+        cursor_review = await db.execute(
+            select(models.BookReview.id).where(
+                models.BookReview.id == cursor, models.BookReview.book_id == book_id
+            )
+        )
+        if cursor_review.first() is None:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="cursor is not a review of this book",
+            )
+        # Compared in SQL, so the stored date format is kept
+        cursor_date = (
+            select(models.BookReview.date)
+            .where(models.BookReview.id == cursor)
+            .scalar_subquery()
+        )
+        reviews = reviews.where(
+            or_(
+                models.BookReview.date < cursor_date,
+                and_(
+                    models.BookReview.date == cursor_date,
+                    models.BookReview.id < cursor,
+                ),
+            )
+        )
+    review_result = (
+        await db.execute(latest_reviews_first(reviews).limit(limit + 1))
+    ).scalars()
+    review_list = list(review_result)
+
+    next_cursor = None
+    if len(review_list) > limit:
+        review_list = review_list[:limit]
+        next_cursor = review_list[-1].id
+    return {"book_id": book_id, "reviews": review_list, "next_cursor": next_cursor}
+
+
+@metrics.timed
+async def get_top_rated_books(
+    limit: int = LEADERBOARD_PAGE_SIZE,
+    db: AsyncSession = Depends(get_db),
+    offset: int = 0,
+    language: Optional[str] = None,
+    min_reviews: int = 1,
+    ranking: schemas.LeaderboardRanking = schemas.LeaderboardRanking.average,
+):
+    """
+    This function is used to get a page of top rated books from the
+    materialized leaderboard
 
     :param limit: number of books to return
     :param db: database session
+    :param offset: number of ranked books to skip
+    :param language: only books in this language
+    :param min_reviews: only books with at least this many reviews
+    :param ranking: ranking order
 
-    :return: list of top rated books
+    :return: page of top rated books
     """
 
-    top_rated_books = (
-        select([models.BookReview.book_id, func.avg(models.BookReview.rating)])
-        .group_by(models.BookReview.book_id)
-        .order_by(func.avg(models.BookReview.rating).desc())
-        .limit(limit)
+    board = await leaderboard.get_leaderboard()
+    ranked = board.view(ranking, language, min_reviews)
+    entries = ranked[offset : offset + limit]
+    book_ids = [entry.book_id for entry in entries]
+
+    previews, books = await asyncio.gather(
+        get_review_previews(book_ids, db),
+        get_books_json(book_ids),
     )
-    rating_result = db.execute(top_rated_books)
 
-    query_dict = {}
-    for row in rating_result:
-        query_dict[row.book_id] = {
-            "book_id": row.book_id,
-            "rating": row.avg,
-            "reviews": [],
-        }
+    book_results = []
+    for rank, entry in enumerate(entries, start=offset + 1):
+        if entry.book_id not in books:
+            continue
+        book_result = dict(books[entry.book_id])
+        book_result.update(
+            {
+                "rating": entry.rating,
+                "review_count": entry.review_count,
+                "reviews": previews[entry.book_id],
+                "rank": rank,
+                "score": entry.score,
+            }
+        )
+        book_results.append(book_result)
 
-    reviews = select([models.BookReview.book_id, models.BookReview.review]).where(
-        models.BookReview.book_id.in_(query_dict.keys())
-    )
-    review_result = db.execute(reviews)
+    return {
+        "books": book_results,
+        "total": len(ranked),
+        "ranking": ranking,
+        "refreshed_at": board.refreshed_at,
+    }
 
-    for row in review_result:
-        query_dict[row.book_id]["reviews"].append(row.review)
 
-    book_results = await asyncio.gather(
-        *[get_book_json(book_id) for book_id in query_dict.keys()]
-    )
+async def get_top_rated_validators(
+    limit: int = LEADERBOARD_PAGE_SIZE,
+    offset: int = 0,
+    language: Optional[str] = None,
+    min_reviews: int = 1,
+    ranking: schemas.LeaderboardRanking = schemas.LeaderboardRanking.average,
+) -> Validators:
+    """
+    This function is used to get the version of a top-rated page, from the
+    generation of the cached pages, which changes with every leaderboard
+    rebuild
+
+    :param limit: number of books to return
+    :param offset: number of ranked books to skip
+    :param language: only books in this language
+    :param min_reviews: only books with at least this many reviews
+    :param ranking: ranking order
 
-    for book_result in book_results:
-        book_result["reviews"] = query_dict[book_result["id"]]["reviews"]
-        book_result["rating"] = query_dict[book_result["id"]]["rating"]
+    :return: validators of the page
+    """
 
-    return book_results
+    board = await leaderboard.get_leaderboard()
+    generation = await caching.get_generation("top-rated")
+    return make_validators(
+        "top-rated",
+        generation,
+        limit,
+        offset,
+        language,
+        min_reviews,
+        ranking.value,
+        last_modified=board.refreshed_at,
+    )
 
 
-async def get_monthly_rating(book_id: int, db: Session = Depends(get_db)):
+@metrics.timed
+async def get_monthly_rating(
+    book_id: int, db: AsyncSession = Depends(get_db)
+):
     """
-    This function is used to get monthly rating of a book
+    This function is used to get monthly rating of a book, from the daily
+    rating rollups
 
     :param book_id: book id
     :param db: database session
@@ -210,21 +745,104 @@ async def get_monthly_rating(book_id: int, db: Session = Depends(get_db)):
     :return: monthly rating of a book
     """
 
+    rollups = models.BookRatingRollup
+    year = extract_int("year", rollups.day).label("year")
+    month = extract_int("month", rollups.day).label("month")
     book_rating_by_month = (
         select(
             [
-                extract("month", models.BookReview.date).label("month"),
-                func.avg(models.BookReview.rating),
+                year,
+                month,
+                (
+                    cast(func.sum(rollups.rating_sum), Float)
+                    / func.sum(rollups.review_count)
+                ).label("rating"),
             ]
         )
-        .group_by("month")
-        .where(models.BookReview.book_id == book_id)
-        .order_by("month")
+        .where(rollups.book_id == book_id)
+        .group_by(year, month)
+        .order_by(year, month)
     )
-    rating_result = db.execute(book_rating_by_month)
+    rating_result = await db.execute(book_rating_by_month)
 
     query_dict = {"book_id": book_id, "ratings": []}
     for row in rating_result:
-        query_dict["ratings"].append({"month": MONTHS[row.month], "rating": row.avg})
+        query_dict["ratings"].append(
+            {"year": row.year, "month": MONTHS[row.month], "rating": row.rating}
+        )
 
     return query_dict
+
+
+def bucket_start(day: date, granularity: schemas.TrendGranularity) -> date:
+    """
+    This function is used to get the first day of the trend bucket of a day,
+    weeks start on Monday
+
+    :param day: day
+    :param granularity: bucket size
+
+    :return: first day of the bucket
+    """
+
+    if granularity == schemas.TrendGranularity.week:
+        return day - timedelta(days=day.weekday())
+    if granularity == schemas.TrendGranularity.month:
+        return day.replace(day=1)
+    if granularity == schemas.TrendGranularity.year:
+        return day.replace(month=1, day=1)
+    return day
+
+
+@metrics.timed
+async def get_rating_trend(
+    book_id: int,
+    date_from: Optional[date],
+    date_to: Optional[date],
+    granularity: schemas.TrendGranularity,
+    db: AsyncSession = Depends(get_db),
+) -> dict:
+    """
+    This function is used to get the rating trend of a book. It reads one
+    daily rating rollup per day with reviews in the range, whatever the
+    number of reviews.
+
+    :param book_id: book id
+    :param date_from: first day of the range, included
+    :param date_to: last day of the range, included
+    :param granularity: bucket size
+    :param db: database session
+
+    :return: rating trend of a book
+    """
+
+    if date_from and date_to and date_from > date_to:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="from must not be after to",
+        )
+
+    rollups = models.BookRatingRollup
+    query = select(rollups.day, rollups.review_count, rollups.rating_sum).where(
+        rollups.book_id == book_id
+    )
+    if date_from:
+        query = query.where(rollups.day >= date_from)
+    if date_to:
+        query = query.where(rollups.day <= date_to)
+    rollup_rows = await db.execute(query.order_by(rollups.day))
+
+    buckets: Dict[date, list] = {}
+    for row in rollup_rows:
+        bucket = buckets.setdefault(bucket_start(row.day, granularity), [0, 0])
+        bucket[0] += row.review_count
+        bucket[1] += row.rating_sum
+
+    return {
+        "book_id": book_id,
+        "granularity": granularity,
+        "points": [
+            {"start": start, "review_count": count, "rating": rating_sum / count}
+            for start, (count, rating_sum) in buckets.items()
+        ],
+    }
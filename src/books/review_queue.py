@@ -0,0 +1,225 @@
+"""
+Queued review writes
+
+With REVIEW_WRITE_MODE=queued, new reviews are accepted as soon as they are
+validated, and a background task writes them in batches: one insert, one
+aggregates update and one commit per batch (group commit) instead of one
+per review. The queue is bounded: when it is full, new reviews wait up to
+REVIEW_QUEUE_MAX_WAIT seconds for room and are then rejected with a 503.
+A batch failing with a transient database error, such as a locked SQLite
+database, is retried REVIEW_QUEUE_RETRIES times with backoff, and a batch
+rejected by the database is split in halves until the rejected reviews
+are found, so a single bad review can not take its neighbours down with
+it. Queued reviews are kept in process memory. They are written before a
+clean shutdown, but are lost if the process is killed.
+"""
+
+import asyncio
+import logging
+import random
+from typing import Awaitable, Callable, List, Optional
+
+from fastapi import HTTPException, status
+from sqlalchemy import insert
+from sqlalchemy.exc import DBAPIError, OperationalError
+
+import books.aggregates as aggregates
+import metrics
+import models as models
+from constants import (REVIEW_QUEUE_BATCH_SIZE, REVIEW_QUEUE_FLUSH_INTERVAL,
+                       REVIEW_QUEUE_MAX_SIZE, REVIEW_QUEUE_MAX_WAIT,
+                       REVIEW_QUEUE_RETRIES, REVIEW_QUEUE_RETRY_BACKOFF)
+from database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+
+class ReviewQueueFull(HTTPException):
+    """
+    The review queue stayed full for REVIEW_QUEUE_MAX_WAIT seconds
+    """
+
+    def __init__(self, retry_after: float):
+        super().__init__(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many reviews waiting to be written",
+            headers={"Retry-After": str(max(int(retry_after), 1))},
+        )
+
+
+class ReviewWriter:
+    """
+    Writes queued reviews in batches of up to `batch_size`, waiting up to
+    `flush_interval` seconds for a batch to fill up
+    """
+
+    def __init__(
+        self,
+        batch_size: int = REVIEW_QUEUE_BATCH_SIZE,
+        flush_interval: float = REVIEW_QUEUE_FLUSH_INTERVAL,
+        max_size: int = REVIEW_QUEUE_MAX_SIZE,
+        max_wait: float = REVIEW_QUEUE_MAX_WAIT,
+        on_written: Optional[Callable[..., Awaitable[None]]] = None,
+        retries: int = REVIEW_QUEUE_RETRIES,
+        retry_backoff: float = REVIEW_QUEUE_RETRY_BACKOFF,
+    ):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_size = max_size
+        self.max_wait = max_wait
+        self.on_written = on_written
+        self.retries = retries
+        self.retry_backoff = retry_backoff
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    async def start(self):
+        """
+        This function is used to start the writer task, its queue belongs
+        to the running event loop
+        """
+
+        if self.running:
+            await self.stop()
+        self._queue = asyncio.Queue(maxsize=self.max_size)
+        self._task = asyncio.create_task(self._run())
+        queue = self._queue
+        metrics.REVIEW_QUEUE_DEPTH.collect = lambda: {(): queue.qsize()}
+
+    async def stop(self):
+        """
+        This function is used to write the queued reviews and to stop the
+        writer task
+        """
+
+        if not self.running:
+            return
+        await self._queue.join()
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def submit(self, review: dict):
+        """
+        This function is used to queue a review, waiting for room in the
+        queue when it is full
+
+        :param review: review row, with uuid, book_id, rating, review and date
+        """
+
+        if not self.running:
+            await self.start()
+        try:
+            self._queue.put_nowait(review)
+        except asyncio.QueueFull:
+            try:
+                await asyncio.wait_for(self._queue.put(review), self.max_wait)
+            except asyncio.TimeoutError:
+                raise ReviewQueueFull(self.flush_interval) from None
+
+    async def _next_batch(self) -> List[dict]:
+        loop = asyncio.get_running_loop()
+        batch = [await self._queue.get()]
+        deadline = loop.time() + self.flush_interval
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+                continue
+            except asyncio.QueueEmpty:
+                pass
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        while True:
+            batch = await self._next_batch()
+            try:
+                await self.write(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    async def insert(self, batch: List[dict]):
+        """
+        This function is used to insert a batch of reviews and their rating
+        aggregates in a single transaction
+
+        :param batch: review rows
+        """
+
+        async with SessionLocal() as db:
+            await db.execute(insert(models.BookReview.__table__), batch)
+            await aggregates.record_review_ratings(batch, db)
+            await db.commit()
+
+    async def _insert_with_retries(self, batch: List[dict]) -> Optional[Exception]:
+        attempt = 0
+        while True:
+            try:
+                await self.insert(batch)
+                return None
+            except Exception as exc:
+                if not is_transient(exc) or attempt >= self.retries:
+                    return exc
+            backoff = self.retry_backoff * 2**attempt
+            await asyncio.sleep(random.uniform(backoff / 2, backoff))
+            attempt += 1
+
+    async def _write(self, batch: List[dict]) -> List[dict]:
+        error = await self._insert_with_retries(batch)
+        if error is None:
+            return batch
+        if len(batch) == 1 or is_transient(error):
+            logger.error("Could not write %d queued reviews: %r", len(batch), error)
+            metrics.REVIEW_WRITES.inc("lost", amount=len(batch))
+            return []
+        middle = len(batch) // 2
+        return await self._write(batch[:middle]) + await self._write(batch[middle:])
+
+    async def write(self, batch: List[dict]):
+        """
+        This function is used to write a batch of reviews, retrying
+        transient errors and splitting the batch while it is rejected
+
+        :param batch: review rows
+        """
+
+        written = await self._write(batch)
+        if not written:
+            return
+        metrics.REVIEW_WRITES.inc("written", amount=len(written))
+        metrics.REVIEW_BATCH_SIZE.observe(len(written))
+        if self.on_written is not None:
+            try:
+                await self.on_written(*{review["book_id"] for review in written})
+            except Exception as exc:
+                logger.warning("Could not invalidate reviewed books: %r", exc)
+
+
+def is_transient(exc: Exception) -> bool:
+    """
+    This function is used to tell database errors that may go away on
+    retry, such as a locked database or a lost connection, from errors
+    caused by the written rows
+
+    :param exc: error
+
+    :return: whether retrying may succeed
+    """
+
+    if isinstance(exc, OperationalError):
+        return True
+    return isinstance(exc, DBAPIError) and exc.connection_invalidated
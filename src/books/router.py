@@ -2,18 +2,33 @@
 Book API router
 """
 
+from datetime import date
 from typing import Optional
 
-from fastapi import APIRouter, Depends, Query, status
-from fastapi_cache.decorator import cache
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, Query, Request, Response, status
+from fastapi.responses import ORJSONResponse
+from sqlalchemy.ext.asyncio import AsyncSession
 
+import books.ingest as ingest
 import books.repository as repository
 import books.schemas as schemas
-from constants import BOOK_SEARCH_ENDPOINT
+import books.warming as warming
+import rate_limit
+from caching import cached, hash_key
+from conditional import conditional
+from constants import (BOOK_SEARCH_ENDPOINT, GET_BOOK_CACHE_TTL,
+                       LEADERBOARD_MAX_PAGE_SIZE, LEADERBOARD_PAGE_SIZE,
+                       REVIEW_MAX_PAGE_SIZE, REVIEW_PAGE_SIZE,
+                       REVIEW_WRITE_MODE, SEARCH_BOOKS_CACHE_TTL,
+                       TOP_RATED_CACHE_TTL)
 from database import get_db
+from responses import trusted_response
 
-book_router = APIRouter(tags=["books"])
+book_router = APIRouter(
+    tags=["books"],
+    default_response_class=ORJSONResponse,
+    dependencies=[Depends(rate_limit.limit_client)],
+)
 
 
 @book_router.get(
@@ -23,7 +38,13 @@ book_router = APIRouter(tags=["books"])
     summary="Search for books by title",
     description="Search for books by title",
 )
-@cache(expire=60)
+@warming.tracked(warming.search_hits, key=lambda search, page, **_: (search, page))
+@trusted_response
+@cached(
+    "search",
+    expire=SEARCH_BOOKS_CACHE_TTL,
+    key=lambda search, page, **_: hash_key(search, page),
+)
 async def search_books(
     search: str = Query(...), page: Optional[int] = Query(default=None, ge=1)
 ):
@@ -42,25 +63,62 @@ async def search_books(
 
 @book_router.get(
     f"/{BOOK_SEARCH_ENDPOINT}/top-rated",
-    response_model=schemas.BookListWithReview,
+    response_model=schemas.LeaderboardPage,
     status_code=status.HTTP_200_OK,
     summary="Get top rated books",
-    description="Get top rated books",
+    description="Get top rated books, page by page, optionally filtered by "
+    "language and minimum number of reviews. The bayesian ranking keeps books "
+    "with few reviews from topping the list",
+)
+@conditional(
+    lambda limit, offset, language, min_reviews, ranking, **_: (
+        repository.get_top_rated_validators(
+            limit, offset, language, min_reviews, ranking
+        )
+    )
+)
+@trusted_response
+@cached(
+    "top-rated",
+    expire=TOP_RATED_CACHE_TTL,
+    key=lambda limit, offset, language, min_reviews, ranking, **_: hash_key(
+        limit, offset, language, min_reviews, ranking.value
+    ),
+    versioned=True,
 )
 async def get_top_rated_books(
-    limit: Optional[int] = Query(default=10, ge=1), db: Session = Depends(get_db)
+    request: Request,
+    response: Response,
+    limit: Optional[int] = Query(
+        default=LEADERBOARD_PAGE_SIZE, ge=1, le=LEADERBOARD_MAX_PAGE_SIZE
+    ),
+    offset: int = Query(default=0, ge=0),
+    language: Optional[str] = Query(default=None, min_length=2, max_length=5),
+    min_reviews: int = Query(default=1, ge=1),
+    ranking: schemas.LeaderboardRanking = Query(
+        default=schemas.LeaderboardRanking.average
+    ),
+    db: AsyncSession = Depends(get_db),
 ):
     """
     Get top rated books
 
+    :param request: Request, for its conditional headers
+    :param response: Response, for its caching headers
     :param limit: Number of results to return
+    :param offset: Number of ranked books to skip
+    :param language: Language code, e.g. en
+    :param min_reviews: Minimum number of reviews
+    :param ranking: Ranking order
     :param db: Database session
 
-    :return: List of top rated books
+    :return: Page of top rated books
     """
 
-    results = await repository.get_top_rated_books(limit, db)
-    return {"books": results}
+    results = await repository.get_top_rated_books(
+        limit, db, offset, language, min_reviews, ranking
+    )
+    return results
 
 
 @book_router.get(
@@ -70,11 +128,19 @@ async def get_top_rated_books(
     summary="Get book monthly rating",
     description="Get book monthly rating",
 )
-async def get_monthly_rating(book_id: int, db: Session = Depends(get_db)):
+@conditional(lambda book_id, db, **_: repository.get_rating_validators(book_id, db))
+async def get_monthly_rating(
+    book_id: int,
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(get_db),
+):
     """
     Get book monthly rating
 
     :param book_id: Book ID
+    :param request: Request, for its conditional headers
+    :param response: Response, for its caching headers
     :param db: Database session
 
     :return: Book monthly rating
@@ -84,32 +150,134 @@ async def get_monthly_rating(book_id: int, db: Session = Depends(get_db)):
     return results
 
 
+@book_router.get(
+    f"/{BOOK_SEARCH_ENDPOINT}/" + "{book_id}/rating-trend",
+    response_model=schemas.RatingTrend,
+    status_code=status.HTTP_200_OK,
+    summary="Get book rating trend",
+    description="Get book rating by day, week, month or year, between two "
+    "optional dates",
+)
+async def get_rating_trend(
+    book_id: int,
+    date_from: Optional[date] = Query(default=None, alias="from"),
+    date_to: Optional[date] = Query(default=None, alias="to"),
+    granularity: schemas.TrendGranularity = Query(
+        default=schemas.TrendGranularity.month
+    ),
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Get book rating trend
+
+    :param book_id: Book ID
+    :param date_from: First day of the range
+    :param date_to: Last day of the range
+    :param granularity: Bucket size
+    :param db: Database session
+
+    :return: Book rating trend
+    """
+
+    results = await repository.get_rating_trend(
+        book_id, date_from, date_to, granularity, db
+    )
+    return results
+
+
 @book_router.post(
     f"/{BOOK_SEARCH_ENDPOINT}/" + "{book_id}/review",
     response_model=schemas.BookReviewWithRatingAndBookID,
     status_code=status.HTTP_201_CREATED,
+    responses={
+        status.HTTP_202_ACCEPTED: {
+            "model": schemas.BookReviewWithRatingAndBookID,
+            "description": "Review queued, it is stored within moments",
+        }
+    },
     summary="Add a review for a book",
-    description="Add a review for a book",
+    description="Add a review for a book. When review writes are queued, the "
+    "review is accepted with a 202 and stored with the next batch",
 )
 async def add_review(
     book_id: int,
     book_review: schemas.BookReviewAndRating,
-    db: Session = Depends(get_db),
+    response: Response,
+    db: AsyncSession = Depends(get_db),
 ):
     """
     Add a review for a book
 
     :param book_id: Book ID
     :param book_review: Book review
+    :param response: Response, for the queued status code
     :param db: Database session
 
     :return: Book with review
     """
 
+    if REVIEW_WRITE_MODE == "queued":
+        response.status_code = status.HTTP_202_ACCEPTED
+        return await repository.queue_review(book_id, book_review)
     review = await repository.create_review(book_id, book_review, db)
     return review
 
 
+@book_router.post(
+    f"/{BOOK_SEARCH_ENDPOINT}/reviews/bulk",
+    response_model=schemas.ImportReport,
+    status_code=status.HTTP_200_OK,
+    summary="Import reviews for many books",
+    description="Import reviews from a JSON lines body, or a CSV body with a "
+    "header line when the content type is text/csv. Each row needs book_id, "
+    "review and rating, and may have an ISO 8601 date",
+)
+async def import_reviews(request: Request, db: AsyncSession = Depends(get_db)):
+    """
+    Import reviews for many books
+
+    :param request: Request, its body is streamed
+    :param db: Database session
+
+    :return: Import report with per-row rejections
+    """
+
+    file_format = "csv" if "csv" in request.headers.get("content-type", "") else "jsonl"
+    results = await ingest.ingest_reviews(
+        ingest.iter_lines(request.stream()), file_format, db
+    )
+    return results
+
+
+@book_router.get(
+    f"/{BOOK_SEARCH_ENDPOINT}/" + "{book_id}/reviews",
+    response_model=schemas.ReviewPage,
+    status_code=status.HTTP_200_OK,
+    summary="Get book reviews",
+    description="Get book reviews, newest first. Pass the returned next_cursor "
+    "as cursor to get the following page",
+)
+async def get_book_reviews(
+    book_id: int,
+    cursor: Optional[int] = Query(default=None),
+    limit: int = Query(default=REVIEW_PAGE_SIZE, ge=1, le=REVIEW_MAX_PAGE_SIZE),
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Get book reviews
+
+    :param book_id: Book ID
+    :param cursor: Cursor returned with the previous page
+    :param limit: Number of reviews to return
+    :param db: Database session
+
+    :return: Page of book reviews
+    """
+
+    results = await repository.get_book_reviews(book_id, cursor, limit, db)
+    return results
+
+
 @book_router.get(
     f"/{BOOK_SEARCH_ENDPOINT}/" + "{book_id}",
     response_model=schemas.BookWithReview,
@@ -117,12 +285,27 @@ async def add_review(
     summary="Get book details",
     description="Get book details",
 )
-@cache(expire=60)
-async def get_book(book_id: int, db: Session = Depends(get_db)):
+@warming.tracked(warming.book_hits, key=lambda book_id, **_: book_id)
+@conditional(lambda book_id, **_: repository.get_cached_book_validators(book_id))
+@trusted_response
+@cached(
+    "book",
+    expire=GET_BOOK_CACHE_TTL,
+    key=lambda book_id, **_: book_id,
+    invalidated=True,
+)
+async def get_book(
+    book_id: int,
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(get_db),
+):
     """
     Get book details, with reviews and rating
 
     :param book_id: Book ID
+    :param request: Request, for its conditional headers
+    :param response: Response, for its caching headers
     :param db: Database session
 
     :return: Book details
@@ -2,6 +2,8 @@
 Book schemas
 """
 
+from datetime import date, datetime
+from enum import Enum
 from typing import List, Optional
 
 from pydantic import BaseModel, Field
@@ -58,6 +60,7 @@ class MonthlyRating(BookRating):
     Monthly rating schema
     """
 
+    year: int
     month: str
 
 
@@ -72,12 +75,42 @@ class MonthlyRatingList(BaseBookId):
         orm_mode = True
 
 
+class TrendGranularity(str, Enum):
+    """
+    Rating trend bucket size
+    """
+
+    day = "day"
+    week = "week"
+    month = "month"
+    year = "year"
+
+
+class RatingTrendPoint(BookRating):
+    """
+    Rating trend bucket schema, starting on the first day of the bucket
+    """
+
+    start: date
+    review_count: int
+
+
+class RatingTrend(BaseBookId):
+    """
+    Rating trend schema, with only the buckets that have reviews
+    """
+
+    granularity: TrendGranularity
+    points: List[RatingTrendPoint]
+
+
 class BookWithReview(Book, BookRating):
     """
-    Book with review schema
+    Book with review schema, reviews holds a preview of the latest reviews
     """
 
     reviews: List[Optional[str]] = list()
+    review_count: int = 0
 
     class Config:
         orm_mode = True
@@ -91,6 +124,37 @@ class BookListWithReview(BaseModel):
     books: List[BookWithReview]
 
 
+class LeaderboardRanking(str, Enum):
+    """
+    Top-rated ranking order, bayesian ranks books with few reviews closer
+    to the mean rating of all reviews
+    """
+
+    average = "average"
+    bayesian = "bayesian"
+
+
+class LeaderboardBook(BookWithReview):
+    """
+    Ranked book schema, score is the rating used for the ranking
+    """
+
+    rank: int
+    score: float
+
+
+class LeaderboardPage(BaseModel):
+    """
+    Top-rated books page schema, refreshed_at tells when the ranking was
+    last rebuilt
+    """
+
+    books: List[LeaderboardBook]
+    total: int
+    ranking: LeaderboardRanking
+    refreshed_at: datetime
+
+
 class APIResponse(BaseModel):
     """
     API response schema
@@ -110,8 +174,64 @@ class BookReviewAndRating(BaseBookReview, BookRating):
 
 class BookReviewWithRatingAndBookID(BookReviewAndRating, BaseBookId):
     """
-    Book review with rating and Book ID schema
+    Book review with rating and Book ID schema, uuid identifies the review,
+    including while it is queued
     """
 
+    uuid: str
+
     class Config:
         orm_mode = True
+
+
+class Review(BookReviewAndRating):
+    """
+    Review schema
+    """
+
+    id: int
+    uuid: Optional[str]
+    date: Optional[datetime]
+
+    class Config:
+        orm_mode = True
+
+
+class ReviewPage(BaseBookId):
+    """
+    Review page schema, next_cursor is used to request the following page
+    """
+
+    reviews: List[Review]
+    next_cursor: Optional[int]
+
+
+class ReviewImport(BookReviewAndRating, BaseBookId):
+    """
+    Review import schema, one row of a bulk import
+    """
+
+    rating: int = Field(..., ge=0, le=5, description="Book rating")
+    date: Optional[datetime] = None
+
+
+class ImportRejection(BaseModel):
+    """
+    Import rejection schema
+    """
+
+    line: int
+    reason: str
+
+
+class ImportReport(BaseModel):
+    """
+    Import report schema
+    """
+
+    rows_read: int = 0
+    rows_inserted: int = 0
+    rows_rejected: int = 0
+    elapsed_seconds: float = 0.0
+    rows_per_second: float = 0.0
+    rejections: List[ImportRejection] = list()
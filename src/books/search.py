@@ -0,0 +1,240 @@
+"""
+Local book search index
+
+Titles and author names of the stored books are indexed in a SQLite FTS5
+table, kept up to date whenever book metadata is stored. Searches match
+every word as a prefix, ordered by popularity like Gutendex. Other
+database backends have no local index and always search upstream.
+"""
+
+import time
+from typing import Iterable, List, Optional
+from urllib.parse import urlencode
+
+from fastapi import HTTPException, status
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import models as models
+from constants import (BOOK_SEARCH_ENDPOINT, LOCAL_SEARCH,
+                       LOCAL_SEARCH_CHECK_INTERVAL, PROJECT_URL,
+                       SEARCH_PAGE_SIZE)
+from database import engine
+
+SEARCH_TABLE = "book_search"
+INDEX_CHUNK_SIZE = 500
+
+_catalog_checked_at = 0.0
+_catalog_imported = False
+
+
+def is_supported(dialect_name: str = engine.dialect.name) -> bool:
+    """
+    This function is used to check if a database backend has a local index
+
+    :param dialect_name: database dialect name
+
+    :return: whether the backend supports the index
+    """
+
+    return dialect_name == "sqlite"
+
+
+def index_text(book_data: dict) -> dict:
+    """
+    This function is used to get the indexed columns of a book
+
+    :param book_data: book data
+
+    :return: index row
+    """
+
+    return {
+        "id": book_data["id"],
+        "title": book_data["title"],
+        "authors": " ".join(author["name"] for author in book_data["authors"]),
+    }
+
+
+def create_index(connection: Connection):
+    """
+    This function is used to create the index and fill it from the stored
+    books
+
+    :param connection: database connection
+    """
+
+    if not is_supported(connection.dialect.name):
+        return
+    connection.execute(
+        text(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} USING fts5("
+            "title, authors, tokenize='unicode61 remove_diacritics 2')"
+        )
+    )
+    connection.execute(text(f"DELETE FROM {SEARCH_TABLE}"))
+    books = connection.execute(
+        models.Book.__table__.select().with_only_columns(
+            [models.Book.id, models.Book.title, models.Book.authors]
+        )
+    )
+    rows = [index_text(dict(book._mapping)) for book in books]
+    if rows:
+        connection.execute(
+            text(
+                f"INSERT INTO {SEARCH_TABLE} (rowid, title, authors) "
+                "VALUES (:id, :title, :authors)"
+            ),
+            rows,
+        )
+
+
+async def index_books(books_data: Iterable[dict], db: AsyncSession):
+    """
+    This function is used to add or refresh books in the index, within the
+    caller's transaction
+
+    :param books_data: book data
+    :param db: database session
+    """
+
+    if not is_supported():
+        return
+    rows = [index_text(book_data) for book_data in books_data]
+    for start in range(0, len(rows), INDEX_CHUNK_SIZE):
+        chunk = rows[start : start + INDEX_CHUNK_SIZE]
+        await db.execute(
+            text(f"DELETE FROM {SEARCH_TABLE} WHERE rowid = :id"),
+            [{"id": row["id"]} for row in chunk],
+        )
+        await db.execute(
+            text(
+                f"INSERT INTO {SEARCH_TABLE} (rowid, title, authors) "
+                "VALUES (:id, :title, :authors)"
+            ),
+            chunk,
+        )
+
+
+def match_query(search: str) -> Optional[str]:
+    """
+    This function is used to turn a search string into an FTS5 query that
+    matches every word as a prefix
+
+    :param search: search string
+
+    :return: FTS5 query, or None if there is nothing to search for
+    """
+
+    words = [word.replace('"', '""') for word in search.split()]
+    if not words:
+        return None
+    return " ".join(f'"{word}"*' for word in words)
+
+
+def page_url(search: str, page: int) -> str:
+    """
+    This function is used to build a search page link, like the rewritten
+    Gutendex links
+
+    :param search: search string
+    :param page: page number
+
+    :return: page url
+    """
+
+    params = {"search": search}
+    if page > 1:
+        params["page"] = page
+    return f"{PROJECT_URL}/{BOOK_SEARCH_ENDPOINT}?" + urlencode(sorted(params.items()))
+
+
+async def is_enabled(db: AsyncSession) -> bool:
+    """
+    This function is used to check if searches should use the local index:
+    always with LOCAL_SEARCH=always, and with LOCAL_SEARCH=catalog once a
+    catalog was imported
+
+    :param db: database session
+
+    :return: whether the local index is used
+    """
+
+    global _catalog_checked_at, _catalog_imported
+
+    if LOCAL_SEARCH == "off" or not is_supported():
+        return False
+    if LOCAL_SEARCH == "always":
+        return True
+    if not _catalog_imported and (
+        time.monotonic() - _catalog_checked_at >= LOCAL_SEARCH_CHECK_INTERVAL
+    ):
+        imports = await db.execute(
+            models.CatalogImport.__table__.select().limit(1)
+        )
+        _catalog_imported = imports.first() is not None
+        _catalog_checked_at = time.monotonic()
+    return _catalog_imported
+
+
+async def search_books(
+    search: str, page: Optional[int], db: AsyncSession
+) -> Optional[dict]:
+    """
+    This function is used to search the local index
+
+    :param search: search string
+    :param page: page number
+    :param db: database session
+
+    :return: search results shaped like the upstream ones, or None without
+        local hits
+    """
+
+    query = match_query(search)
+    if query is None:
+        return None
+    page = page or 1
+    matches = (
+        f"FROM {SEARCH_TABLE} JOIN books ON books.id = {SEARCH_TABLE}.rowid "
+        f"WHERE {SEARCH_TABLE} MATCH :query"
+    )
+    count = (
+        await db.execute(text(f"SELECT count(*) {matches}"), {"query": query})
+    ).scalar()
+    if not count:
+        return None
+    if (page - 1) * SEARCH_PAGE_SIZE >= count:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail={"detail": "Invalid page."}
+        )
+
+    rows = await db.execute(
+        text(
+            "SELECT books.id, books.title, books.authors, books.languages, "
+            f"books.download_count {matches} "
+            "ORDER BY books.download_count DESC, books.id "
+            "LIMIT :limit OFFSET :offset"
+        ).columns(
+            models.Book.id,
+            models.Book.title,
+            models.Book.authors,
+            models.Book.languages,
+            models.Book.download_count,
+        ),
+        {
+            "query": query,
+            "limit": SEARCH_PAGE_SIZE,
+            "offset": (page - 1) * SEARCH_PAGE_SIZE,
+        },
+    )
+    books: List[dict] = [dict(row._mapping) for row in rows]
+    return {
+        "count": count,
+        "next": page_url(search, page + 1)
+        if page * SEARCH_PAGE_SIZE < count
+        else None,
+        "previous": page_url(search, page - 1) if page > 1 else None,
+        "books": books,
+    }
@@ -0,0 +1,365 @@
+"""
+Background cache warming
+
+Book details and searches are counted as they are requested, in bounded
+heavy-hitter sketches, so that a background task can refresh the most
+requested entries before they expire: the stored metadata of hot books
+before BOOK_METADATA_TTL, and the cached responses of hot searches before
+SEARCH_BOOKS_CACHE_TTL. At startup, the same task first loads the metadata
+of the top-rated books. Every run makes at most CACHE_WARM_BUDGET Gutendex
+calls, at most CACHE_WARM_QPS per second, and none while the Gutendex
+circuit is not closed, so warming can not starve live requests.
+"""
+
+import asyncio
+import heapq
+import logging
+import time
+from functools import wraps
+from typing import Callable, Dict, Hashable, Iterable, List, Optional
+
+from fastapi_cache import FastAPICache
+
+import books.known_ids as known_ids
+import books.leaderboard as leaderboard
+import books.repository as repository
+import caching
+import metrics
+import upstream
+from constants import (BOOK_LOADER_MAX_BATCH_SIZE, BOOK_METADATA_TTL,
+                       CACHE_WARM_BUDGET, CACHE_WARM_INTERVAL, CACHE_WARM_KEYS,
+                       CACHE_WARM_MIN_HITS, CACHE_WARM_QPS,
+                       CACHE_WARM_TOP_RATED, CACHE_WARM_TRACKED_KEYS,
+                       SEARCH_BOOKS_CACHE_TTL)
+
+logger = logging.getLogger(__name__)
+
+
+class SpaceSaving:
+    """
+    Space-Saving heavy-hitters sketch: counts at most `capacity` keys, a new
+    key replaces the least counted one and inherits its count, so the most
+    frequent keys are kept whatever the number of distinct keys. The
+    inherited count is kept as the error of the new key. Keys are grouped
+    in buckets by count (stream-summary), so the least counted key is found
+    in constant time.
+    """
+
+    def __init__(self, capacity: int = CACHE_WARM_TRACKED_KEYS):
+        self.capacity = capacity
+        self.counts: Dict[Hashable, int] = {}
+        self.errors: Dict[Hashable, int] = {}
+        self._buckets: Dict[int, Dict[Hashable, None]] = {}
+        self._min_count = 0
+
+    def __len__(self) -> int:
+        return len(self.counts)
+
+    def _move(self, key: Hashable, count: int):
+        previous = self.counts.get(key)
+        if previous is not None:
+            bucket = self._buckets[previous]
+            del bucket[key]
+            if not bucket:
+                del self._buckets[previous]
+        self.counts[key] = count
+        self._buckets.setdefault(count, {})[key] = None
+        if self._min_count not in self._buckets or count < self._min_count:
+            self._min_count = count
+
+    def add(self, key: Hashable):
+        """
+        This function is used to count a key
+
+        :param key: requested key
+        """
+
+        count = self.counts.get(key)
+        if count is None:
+            count = 0
+            if len(self.counts) >= self.capacity:
+                bucket = self._buckets[self._min_count]
+                evicted = next(iter(bucket))
+                del bucket[evicted]
+                if not bucket:
+                    del self._buckets[self._min_count]
+                count = self.counts.pop(evicted)
+                self.errors.pop(evicted, None)
+                self.errors[key] = count
+        self._move(key, count + 1)
+
+    def top(self, limit: int, min_count: int = 1) -> List[Hashable]:
+        """
+        This function is used to get the most counted keys
+
+        :param limit: maximum number of keys
+        :param min_count: only keys certainly counted at least this many times
+
+        :return: keys, most counted first
+        """
+
+        return [
+            key
+            for key in heapq.nlargest(limit, self.counts, key=self.counts.__getitem__)
+            if self.counts[key] - self.errors.get(key, 0) >= min_count
+        ]
+
+    def decay(self):
+        """
+        This function is used to halve every count, so the sketch follows
+        the recent requests
+        """
+
+        self.counts = {
+            key: count // 2 for key, count in self.counts.items() if count > 1
+        }
+        self.errors = {
+            key: error // 2 for key, error in self.errors.items() if key in self.counts
+        }
+        self._buckets = {}
+        for key, count in self.counts.items():
+            self._buckets.setdefault(count, {})[key] = None
+        self._min_count = min(self._buckets, default=0)
+
+    def clear(self):
+        """
+        This function is used to forget every count
+        """
+
+        self.counts.clear()
+        self.errors.clear()
+        self._buckets.clear()
+        self._min_count = 0
+
+
+class Pacer:
+    """
+    Spaces calls at least 1 / `rate` seconds apart, and allows at most
+    `budget` calls
+    """
+
+    def __init__(self, rate: float, budget: int):
+        self.interval = 1 / rate if rate > 0 else 0.0
+        self.budget = budget
+        self._next_at = 0.0
+
+    async def acquire(self) -> bool:
+        """
+        This function is used to wait for the next call slot
+
+        :return: whether a call is allowed, False once the budget is spent
+            or while Gutendex is failing
+        """
+
+        if self.budget <= 0 or not upstream.is_healthy():
+            return False
+        self.budget -= 1
+        wait = self._next_at - time.monotonic()
+        if wait > 0:
+            await asyncio.sleep(wait)
+        self._next_at = time.monotonic() + self.interval
+        return True
+
+
+book_hits = SpaceSaving()
+search_hits = SpaceSaving()
+_task: Optional[asyncio.Task] = None
+
+
+def tracked(sketch: SpaceSaving, key: Callable[..., Hashable]):
+    """
+    This function is used to count the requests to an endpoint, including
+    the ones answered from the cache
+
+    :param sketch: sketch counting the requests
+    :param key: builds the counted key from the endpoint keyword arguments
+
+    :return: decorator
+    """
+
+    def wrapper(func):
+        @wraps(func)
+        async def inner(*args, **kwargs):
+            sketch.add(key(**kwargs))
+            return await func(*args, **kwargs)
+
+        return inner
+
+    return wrapper
+
+
+async def warm_books(book_ids: Iterable[int], pacer: Pacer, ahead: float) -> int:
+    """
+    This function is used to load the metadata of books that is missing or
+    expires within `ahead` seconds, in batched Gutendex calls
+
+    :param book_ids: book ids, most wanted first
+    :param pacer: Gutendex call pacing and budget
+    :param ahead: seconds before expiry from which metadata is refreshed
+
+    :return: number of books refreshed
+    """
+
+    book_ids = [book_id for book_id in book_ids if not known_ids.is_missing(book_id)]
+    stored_books = await repository.get_stored_books(book_ids)
+    max_age = max(BOOK_METADATA_TTL - ahead, 0)
+    stale_ids = [
+        book_id
+        for book_id in book_ids
+        if book_id not in stored_books
+        or not repository.is_book_fresh(stored_books[book_id], max_age)
+    ]
+
+    refreshed = 0
+    for start in range(0, len(stale_ids), BOOK_LOADER_MAX_BATCH_SIZE):
+        batch = stale_ids[start : start + BOOK_LOADER_MAX_BATCH_SIZE]
+        if not await pacer.acquire():
+            metrics.CACHE_WARM_REFRESHES.inc("book", "skipped", amount=len(batch))
+            break
+        try:
+            books = await repository.book_loader.load_many(batch)
+        except Exception as exc:
+            logger.warning("Could not refresh %d books: %r", len(batch), exc)
+            metrics.CACHE_WARM_REFRESHES.inc("book", "failed", amount=len(batch))
+            continue
+        known_ids.record_not_found(
+            book_id for book_id, book in books.items() if not book
+        )
+        refreshed += len(batch)
+        metrics.CACHE_WARM_REFRESHES.inc("book", "refreshed", amount=len(batch))
+    return refreshed
+
+
+async def warm_searches(searches: Iterable[tuple], pacer: Pacer, ahead: float) -> int:
+    """
+    This function is used to refresh the cached responses of searches that
+    are missing or expire within `ahead` seconds
+
+    :param searches: search string and page pairs, most wanted first
+    :param pacer: Gutendex call pacing and budget
+    :param ahead: seconds before expiry from which responses are refreshed
+
+    :return: number of searches refreshed
+    """
+
+    backend = FastAPICache.get_backend()
+    refreshed = 0
+    for search, page in searches:
+        key_part = caching.hash_key(search, page)
+        ttl, value = await backend.get_with_ttl(caching.build_key("search", key_part))
+        if value is not None and ttl > ahead:
+            continue
+        if not await pacer.acquire():
+            metrics.CACHE_WARM_REFRESHES.inc("search", "skipped")
+            break
+        try:
+            results = await repository.get_books_by_title(search, page, revalidate=True)
+        except Exception as exc:
+            logger.warning("Could not refresh search %r: %r", search, exc)
+            metrics.CACHE_WARM_REFRESHES.inc("search", "failed")
+            continue
+        await caching.set_value(
+            "search", key_part, value=results, expire=SEARCH_BOOKS_CACHE_TTL
+        )
+        refreshed += 1
+        metrics.CACHE_WARM_REFRESHES.inc("search", "refreshed")
+    return refreshed
+
+
+async def prewarm_top_rated(
+    limit: int = CACHE_WARM_TOP_RATED,
+    budget: int = CACHE_WARM_BUDGET,
+    rate: float = CACHE_WARM_QPS,
+) -> int:
+    """
+    This function is used to load the metadata of the top-rated books, by
+    average and by bayesian average, so the first top-rated pages do not
+    wait for Gutendex
+
+    :param limit: number of books per ranking
+    :param budget: maximum number of Gutendex calls
+    :param rate: maximum number of Gutendex calls per second
+
+    :return: number of books refreshed
+    """
+
+    board = await leaderboard.get_leaderboard()
+    book_ids = dict.fromkeys(
+        entry.book_id
+        for entries in board.rankings.values()
+        for entry in entries[:limit]
+    )
+    return await warm_books(book_ids, Pacer(rate, budget), 0)
+
+
+async def warm(
+    limit: int = CACHE_WARM_KEYS,
+    budget: int = CACHE_WARM_BUDGET,
+    rate: float = CACHE_WARM_QPS,
+    ahead: float = CACHE_WARM_INTERVAL,
+) -> int:
+    """
+    This function is used to refresh the most requested books and searches
+    before they expire, and to decay the request counts
+
+    :param limit: number of books and of searches considered
+    :param budget: maximum number of Gutendex calls
+    :param rate: maximum number of Gutendex calls per second
+    :param ahead: seconds before expiry from which entries are refreshed
+
+    :return: number of books and searches refreshed
+    """
+
+    pacer = Pacer(rate, budget)
+    hot_books = book_hits.top(limit, CACHE_WARM_MIN_HITS)
+    hot_searches = search_hits.top(limit, CACHE_WARM_MIN_HITS)
+    book_hits.decay()
+    search_hits.decay()
+    refreshed = await warm_searches(hot_searches, pacer, ahead)
+    refreshed += await warm_books(hot_books, pacer, ahead)
+    return refreshed
+
+
+async def _warm_periodically(interval: float):
+    try:
+        await prewarm_top_rated()
+    except Exception as exc:
+        logger.warning("Top-rated warm-up failed: %r", exc)
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await warm(ahead=interval)
+        except Exception as exc:
+            logger.warning("Cache warming failed: %r", exc)
+
+
+async def startup(interval: float = CACHE_WARM_INTERVAL):
+    """
+    This function is used to start the cache warming task
+
+    :param interval: seconds between runs, 0 disables the task
+    """
+
+    global _task
+
+    if interval > 0:
+        _task = asyncio.create_task(_warm_periodically(interval))
+
+
+async def shutdown():
+    """
+    This function is used to stop the cache warming task and to drop the
+    request counts
+    """
+
+    global _task
+
+    if _task is not None:
+        _task.cancel()
+        try:
+            await _task
+        except asyncio.CancelledError:
+            pass
+    _task = None
+    book_hits.clear()
+    search_hits.clear()
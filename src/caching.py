@@ -0,0 +1,349 @@
+"""
+Response cache settings
+
+Cached endpoints use readable keys (`<prefix>:<namespace>:<key>`), so a
+single entry, e.g. the details of one book, can be invalidated when its
+data changes. Namespaces whose entries can not be listed, such as the
+top-rated pages for every limit, are versioned with a generation number
+that is bumped to invalidate all of them at once. Entries invalidated one
+by one have a generation of their own, which is part of their key and is
+read before the response is computed. Invalidating an entry bumps its
+generation and drops the entry stored under the previous one, and a
+response computed from data changed in the meantime is stored under the
+previous generation and never served.
+"""
+
+import hashlib
+import time
+from functools import wraps
+from typing import Any, Callable, Optional, Tuple, Union
+from urllib.parse import urlparse
+
+import aiomcache
+from fastapi_cache import FastAPICache
+from fastapi_cache.backends import Backend
+from fastapi_cache.backends.inmemory import InMemoryBackend
+from fastapi_cache.backends.memcached import \
+    MemcachedBackend as BaseMemcachedBackend
+
+import metrics
+from constants import (CACHE_BACKEND, CACHE_LOCAL_MAX_BYTES, CACHE_POOL_SIZE,
+                       CACHE_URL)
+from local_cache import LocalBackend, TieredBackend
+
+CACHE_PREFIX = "book_api"
+GENERATION_TTL = 60 * 60 * 24 * 30
+
+
+class MemcachedBackend(BaseMemcachedBackend):
+    """
+    Memcached cache backend, with single key invalidation. Memcached does
+    not tell how long an entry has left, so values are stored after their
+    expiry time, e.g. b"1700000000:value", 0 for entries that do not expire.
+    """
+
+    async def get_with_ttl(self, key: str) -> Tuple[int, Optional[bytes]]:
+        data = await self.mcache.get(key.encode())
+        if data is None:
+            return 0, None
+        expires_at, separator, value = data.partition(b":")
+        if not separator or not expires_at.isdigit():
+            return 0, data
+        ttl = int(expires_at) - int(time.time()) if int(expires_at) else 0
+        return max(ttl, 0), value
+
+    async def get(self, key: str) -> Optional[bytes]:
+        _, value = await self.get_with_ttl(key)
+        return value
+
+    async def set(self, key: str, value: Union[str, bytes], expire: int = None):
+        expires_at = int(time.time()) + expire if expire else 0
+        data = value.encode() if isinstance(value, str) else value
+        await self.mcache.set(
+            key.encode(), b"%d:%b" % (expires_at, data), exptime=expire or 0
+        )
+
+    async def clear(self, namespace: str = None, key: str = None) -> int:
+        if namespace:
+            raise NotImplementedError("Memcached can not clear a whole namespace")
+        return int(await self.mcache.delete(key.encode()))
+
+    async def close(self):
+        await self.mcache.close()
+
+
+def create_backend(
+    backend_name: str = CACHE_BACKEND,
+    cache_url: str = CACHE_URL,
+    local_max_bytes: int = CACHE_LOCAL_MAX_BYTES,
+) -> Backend:
+    """
+    This function is used to build the configured cache backend
+
+    :param backend_name: one of memory, memcached or redis
+    :param cache_url: shared cache server url, e.g. memcached://localhost:11211
+    :param local_max_bytes: memory limit of the in-process tier, 0 sends every
+        lookup to the shared cache
+
+    :return: cache backend
+    """
+
+    if backend_name == "memory":
+        return LocalBackend(local_max_bytes)
+    shared = create_shared_backend(backend_name, cache_url)
+    if local_max_bytes > 0:
+        return TieredBackend(shared, LocalBackend(local_max_bytes))
+    return shared
+
+
+def create_shared_backend(backend_name: str, cache_url: str) -> Backend:
+    """
+    This function is used to build a cache backend shared between workers
+
+    :param backend_name: memcached or redis
+    :param cache_url: shared cache server url
+
+    :return: cache backend
+    """
+
+    if backend_name == "memcached":
+        url = urlparse(cache_url or "memcached://localhost:11211")
+        return MemcachedBackend(
+            aiomcache.Client(
+                url.hostname or "localhost",
+                url.port or 11211,
+                pool_size=CACHE_POOL_SIZE,
+            )
+        )
+    if backend_name == "redis":
+        from fastapi_cache.backends.redis import RedisBackend
+        from redis.asyncio import from_url
+
+        return RedisBackend(
+            from_url(
+                cache_url or "redis://localhost:6379", max_connections=CACHE_POOL_SIZE
+            )
+        )
+    raise ValueError(f"Unknown cache backend: {backend_name}")
+
+
+async def startup(backend: Optional[Backend] = None):
+    """
+    This function is used to set up the response cache on app startup
+
+    :param backend: optional backend to use instead of the configured one
+    """
+
+    FastAPICache.init(backend or create_backend(), prefix=CACHE_PREFIX)
+
+
+async def shutdown():
+    """
+    This function is used to release the cache connections on app shutdown
+    """
+
+    backend = FastAPICache.get_backend()
+    if isinstance(backend, (MemcachedBackend, TieredBackend)):
+        await backend.close()
+    elif hasattr(backend, "redis"):
+        await backend.redis.close()
+
+
+def get_shared_backend() -> Optional[Backend]:
+    """
+    This function is used to get the cache shared between workers, without
+    its local tier, for values that must not be read from a local copy
+
+    :return: shared backend, or None when the cache is kept in memory
+    """
+
+    backend = FastAPICache.get_backend()
+    if isinstance(backend, TieredBackend):
+        return backend.shared
+    if isinstance(backend, (LocalBackend, InMemoryBackend)):
+        return None
+    return backend
+
+
+async def increment(backend: Backend, key: str, expire: int) -> int:
+    """
+    This function is used to atomically add one to a counter of a shared
+    cache, created with a time to live when it does not exist
+
+    :param backend: memcached or redis backend
+    :param key: cache key
+    :param expire: time to live of a new counter, in seconds
+
+    :return: counter value after the increment
+    """
+
+    if isinstance(backend, MemcachedBackend):
+        await backend.mcache.add(key.encode(), b"0", exptime=expire)
+        return await backend.mcache.incr(key.encode())
+    if hasattr(backend, "redis"):
+        async with backend.redis.pipeline(transaction=True) as pipe:
+            pipe.incr(key)
+            pipe.expire(key, expire)
+            value, _ = await pipe.execute()
+        return value
+    raise NotImplementedError(f"{type(backend).__name__} has no atomic counters")
+
+
+def build_key(namespace: str, *parts: Any) -> str:
+    """
+    This function is used to build a cache key
+
+    :param namespace: cache namespace
+    :param parts: key parts
+
+    :return: cache key
+    """
+
+    return ":".join([FastAPICache.get_prefix(), namespace, *map(str, parts)])
+
+
+def hash_key(*parts: Any) -> str:
+    """
+    This function is used to turn free-form values into a safe key part
+
+    :param parts: key parts
+
+    :return: key part
+    """
+
+    return hashlib.md5(repr(parts).encode()).hexdigest()  # nosec: B303
+
+
+async def get_value(namespace: str, *parts: Any) -> Any:
+    """
+    This function is used to read a value stored with set_value
+
+    :param namespace: cache namespace
+    :param parts: key parts
+
+    :return: stored value, or None
+    """
+
+    value = await FastAPICache.get_backend().get(build_key(namespace, *parts))
+    if value is None:
+        return None
+    return FastAPICache.get_coder().decode(value)
+
+
+async def set_value(namespace: str, *parts: Any, value: Any, expire: int):
+    """
+    This function is used to store a value in the cache
+
+    :param namespace: cache namespace
+    :param parts: key parts
+    :param value: JSON serializable value
+    :param expire: time to live, in seconds
+    """
+
+    await FastAPICache.get_backend().set(
+        build_key(namespace, *parts),
+        FastAPICache.get_coder().encode(value),
+        expire=expire,
+    )
+
+
+async def get_generation(namespace: str, *parts: Any) -> str:
+    """
+    This function is used to get the current generation of a namespace, or
+    of a single entry
+
+    :param namespace: cache namespace
+    :param parts: key parts of the entry, none for the whole namespace
+
+    :return: generation
+    """
+
+    generation = await FastAPICache.get_backend().get(
+        build_key(namespace, *parts, "generation")
+    )
+    if generation is None:
+        return await bump_generation(namespace, *parts)
+    return generation.decode() if isinstance(generation, bytes) else generation
+
+
+async def bump_generation(namespace: str, *parts: Any) -> str:
+    """
+    This function is used to invalidate every entry of a versioned namespace,
+    or a single entry
+
+    :param namespace: cache namespace
+    :param parts: key parts of the entry, none for the whole namespace
+
+    :return: new generation
+    """
+
+    generation = str(time.time_ns())
+    await FastAPICache.get_backend().set(
+        build_key(namespace, *parts, "generation"), generation, expire=GENERATION_TTL
+    )
+    return generation
+
+
+async def invalidate(namespace: str, *parts: Any):
+    """
+    This function is used to invalidate a single cache entry
+
+    :param namespace: cache namespace
+    :param parts: key parts
+    """
+
+    previous = await get_generation(namespace, *parts)
+    await bump_generation(namespace, *parts)
+    try:
+        await FastAPICache.get_backend().clear(
+            key=build_key(namespace, *parts, previous)
+        )
+    except KeyError:
+        pass
+
+
+def cached(
+    namespace: str,
+    expire: int,
+    key: Callable[..., Any],
+    versioned: bool = False,
+    invalidated: bool = False,
+):
+    """
+    This function is used to cache an endpoint under an addressable key
+
+    :param namespace: cache namespace
+    :param expire: time to live, in seconds
+    :param key: builds the key from the endpoint keyword arguments
+    :param versioned: whether the namespace is invalidated by generation
+    :param invalidated: whether entries are invalidated one by one, with
+        invalidate
+
+    :return: decorator
+    """
+
+    def wrapper(func):
+        @wraps(func)
+        async def inner(*args, **kwargs):
+            parts = [key(**kwargs)]
+            if versioned:
+                parts.insert(0, await get_generation(namespace))
+            if invalidated:
+                parts.append(await get_generation(namespace, *parts))
+            cache_key = build_key(namespace, *parts)
+            backend = FastAPICache.get_backend()
+            coder = FastAPICache.get_coder()
+
+            _, value = await backend.get_with_ttl(cache_key)
+            if value is not None:
+                metrics.CACHE_REQUESTS.inc(namespace, "hit")
+                return coder.decode(value)
+            metrics.CACHE_REQUESTS.inc(namespace, "miss")
+
+            result = await func(*args, **kwargs)
+            await backend.set(cache_key, coder.encode(result), expire=expire)
+            return result
+
+        return inner
+
+    return wrapper
@@ -0,0 +1,147 @@
+"""
+HTTP conditional requests
+
+Endpoints decorated with `conditional` send an ETag, a Last-Modified date
+and a Cache-Control header. Their validators are computed by a cheap
+lookup, such as the review count and last review date of a book, before
+the endpoint runs, so a matching If-None-Match or If-Modified-Since is
+answered with a 304 without loading reviews or book metadata.
+"""
+
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from functools import wraps
+from typing import Awaitable, Callable, NamedTuple, Optional
+
+from fastapi import Request, Response, status
+
+from caching import hash_key
+from constants import HTTP_MAX_AGE, HTTP_SHARED_MAX_AGE
+
+CACHE_CONTROL = f"public, max-age={HTTP_MAX_AGE}, s-maxage={HTTP_SHARED_MAX_AGE}"
+
+
+class Validators(NamedTuple):
+    """
+    Version of a response: a weak ETag and, when known, its last change
+    """
+
+    etag: str
+    last_modified: Optional[datetime] = None
+
+
+def as_utc(value: datetime) -> datetime:
+    """
+    This function is used to read a database date as UTC, naive dates are
+    stored in UTC
+
+    :param value: date
+
+    :return: UTC date
+    """
+
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+
+def make_validators(*parts, last_modified: Optional[datetime] = None) -> Validators:
+    """
+    This function is used to build the validators of a response from the
+    values it depends on
+
+    :param parts: values that change whenever the response changes
+    :param last_modified: date of the last change, naive dates are UTC
+
+    :return: response validators
+    """
+
+    if last_modified is not None:
+        last_modified = as_utc(last_modified).replace(microsecond=0)
+    return Validators(f'W/"{hash_key(*parts)}"', last_modified)
+
+
+def is_not_modified(request: Request, validators: Validators) -> bool:
+    """
+    This function is used to check if the client already has the current
+    response. If-None-Match takes precedence over If-Modified-Since.
+
+    :param request: request
+    :param validators: current response validators
+
+    :return: whether a 304 can be sent
+    """
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        etags = [etag.strip() for etag in if_none_match.split(",")]
+        opaque_tag = validators.etag.removeprefix("W/")
+        return "*" in etags or any(
+            etag.removeprefix("W/") == opaque_tag for etag in etags
+        )
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since is None or validators.last_modified is None:
+        return False
+    try:
+        since = parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return False
+    return validators.last_modified <= as_utc(since)
+
+
+def validator_headers(validators: Optional[Validators]) -> dict:
+    """
+    This function is used to build the caching headers of a response
+
+    :param validators: response validators, None when unknown
+
+    :return: response headers
+    """
+
+    headers = {"Cache-Control": CACHE_CONTROL}
+    if validators is None:
+        return headers
+    headers["ETag"] = validators.etag
+    if validators.last_modified is not None:
+        headers["Last-Modified"] = format_datetime(
+            validators.last_modified, usegmt=True
+        )
+    return headers
+
+
+def conditional(get_validators: Callable[..., Awaitable[Optional[Validators]]]):
+    """
+    This function is used to answer conditional requests to an endpoint,
+    which must take `request: Request` and `response: Response` arguments
+
+    :param get_validators: computes the validators from the endpoint
+        keyword arguments, or returns None when they are unknown, e.g. for a
+        book that was never fetched
+
+    :return: decorator
+    """
+
+    def wrapper(func):
+        @wraps(func)
+        async def inner(*args, **kwargs):
+            validators = await get_validators(**kwargs)
+            if validators is not None and is_not_modified(
+                kwargs["request"], validators
+            ):
+                return Response(
+                    status_code=status.HTTP_304_NOT_MODIFIED,
+                    headers=validator_headers(validators),
+                )
+
+            result = await func(*args, **kwargs)
+            if validators is None:
+                validators = await get_validators(**kwargs)
+            headers = validator_headers(validators)
+            target = result if isinstance(result, Response) else kwargs["response"]
+            target.headers.update(headers)
+            return result
+
+        return inner
+
+    return wrapper
@@ -8,6 +8,98 @@ EXTERNAL_API_URL = os.getenv("EXTERNAL_API_URL", "https://gutendex.com/books/")
 PROJECT_URL = os.getenv("PROJECT_URL", "http://localhost:8000")
 BOOK_SEARCH_ENDPOINT = "books"
 
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10.0"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_CONNECT_TIMEOUT = float(os.getenv("DB_CONNECT_TIMEOUT", "5.0"))
+DB_STATEMENT_TIMEOUT = float(os.getenv("DB_STATEMENT_TIMEOUT", "30.0"))
+SQLITE_BUSY_TIMEOUT = float(os.getenv("SQLITE_BUSY_TIMEOUT", "5.0"))
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+
+UPSTREAM_CONNECT_TIMEOUT = float(os.getenv("UPSTREAM_CONNECT_TIMEOUT", "3.0"))
+UPSTREAM_READ_TIMEOUT = float(os.getenv("UPSTREAM_READ_TIMEOUT", "10.0"))
+UPSTREAM_MAX_CONNECTIONS = int(os.getenv("UPSTREAM_MAX_CONNECTIONS", "20"))
+UPSTREAM_MAX_KEEPALIVE_CONNECTIONS = int(
+    os.getenv("UPSTREAM_MAX_KEEPALIVE_CONNECTIONS", "10")
+)
+UPSTREAM_MAX_CONCURRENCY = int(os.getenv("UPSTREAM_MAX_CONCURRENCY", "10"))
+UPSTREAM_CALL_TIMEOUT = float(os.getenv("UPSTREAM_CALL_TIMEOUT", "15.0"))
+UPSTREAM_RETRIES = int(os.getenv("UPSTREAM_RETRIES", "2"))
+UPSTREAM_RETRY_BACKOFF = float(os.getenv("UPSTREAM_RETRY_BACKOFF", "0.1"))
+UPSTREAM_RETRY_BACKOFF_MAX = float(os.getenv("UPSTREAM_RETRY_BACKOFF_MAX", "2.0"))
+UPSTREAM_RETRY_BUDGET = float(os.getenv("UPSTREAM_RETRY_BUDGET", "0.2"))
+UPSTREAM_RETRY_RESERVE = int(os.getenv("UPSTREAM_RETRY_RESERVE", "10"))
+UPSTREAM_CIRCUIT_FAILURES = int(os.getenv("UPSTREAM_CIRCUIT_FAILURES", "5"))
+UPSTREAM_CIRCUIT_RESET = float(os.getenv("UPSTREAM_CIRCUIT_RESET", "30.0"))
+UPSTREAM_MAX_QPS = float(os.getenv("UPSTREAM_MAX_QPS", "0"))
+UPSTREAM_QPS_BURST = float(os.getenv("UPSTREAM_QPS_BURST", "0"))
+UPSTREAM_QPS_MAX_WAIT = float(os.getenv("UPSTREAM_QPS_MAX_WAIT", "2.0"))
+
+RATE_LIMIT_RATE = float(os.getenv("RATE_LIMIT_RATE", "0"))
+RATE_LIMIT_BURST = float(os.getenv("RATE_LIMIT_BURST", "0"))
+RATE_LIMIT_KEY_HEADER = os.getenv("RATE_LIMIT_KEY_HEADER", "X-API-Key")
+RATE_LIMIT_MAX_CLIENTS = int(os.getenv("RATE_LIMIT_MAX_CLIENTS", "100000"))
+
+BOOK_LOADER_BATCH_WINDOW = float(os.getenv("BOOK_LOADER_BATCH_WINDOW", "0.002"))
+BOOK_LOADER_MAX_BATCH_SIZE = int(os.getenv("BOOK_LOADER_MAX_BATCH_SIZE", "100"))
+
+REVIEW_PREVIEW_SIZE = int(os.getenv("REVIEW_PREVIEW_SIZE", "5"))
+REVIEW_PAGE_SIZE = 20
+REVIEW_MAX_PAGE_SIZE = 100
+
+REVIEW_WRITE_MODE = os.getenv("REVIEW_WRITE_MODE", "sync")
+REVIEW_QUEUE_BATCH_SIZE = int(os.getenv("REVIEW_QUEUE_BATCH_SIZE", "500"))
+REVIEW_QUEUE_FLUSH_INTERVAL = float(os.getenv("REVIEW_QUEUE_FLUSH_INTERVAL", "0.05"))
+REVIEW_QUEUE_MAX_SIZE = int(os.getenv("REVIEW_QUEUE_MAX_SIZE", "10000"))
+REVIEW_QUEUE_MAX_WAIT = float(os.getenv("REVIEW_QUEUE_MAX_WAIT", "1.0"))
+REVIEW_QUEUE_RETRIES = int(os.getenv("REVIEW_QUEUE_RETRIES", "3"))
+REVIEW_QUEUE_RETRY_BACKOFF = float(os.getenv("REVIEW_QUEUE_RETRY_BACKOFF", "0.1"))
+
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "5000"))
+INGEST_MAX_REPORTED_REJECTIONS = int(
+    os.getenv("INGEST_MAX_REPORTED_REJECTIONS", "1000")
+)
+
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "memory")
+CACHE_URL = os.getenv("CACHE_URL", "")
+CACHE_POOL_SIZE = int(os.getenv("CACHE_POOL_SIZE", "10"))
+CACHE_LOCAL_MAX_BYTES = int(os.getenv("CACHE_LOCAL_MAX_BYTES", str(64 * 1024 * 1024)))
+CACHE_LOCAL_TTL = float(os.getenv("CACHE_LOCAL_TTL", "5"))
+CACHE_LOCAL_COMPRESS = os.getenv("CACHE_LOCAL_COMPRESS", "false").lower() == "true"
+SEARCH_BOOKS_CACHE_TTL = int(os.getenv("SEARCH_BOOKS_CACHE_TTL", "60"))
+GET_BOOK_CACHE_TTL = int(os.getenv("GET_BOOK_CACHE_TTL", str(60 * 60 * 6)))
+TOP_RATED_CACHE_TTL = int(os.getenv("TOP_RATED_CACHE_TTL", str(60 * 60 * 6)))
+HTTP_MAX_AGE = int(os.getenv("HTTP_MAX_AGE", "0"))
+HTTP_SHARED_MAX_AGE = int(os.getenv("HTTP_SHARED_MAX_AGE", "10"))
+
+LEADERBOARD_REFRESH_INTERVAL = float(os.getenv("LEADERBOARD_REFRESH_INTERVAL", "60"))
+LEADERBOARD_MIN_REFRESH_INTERVAL = float(
+    os.getenv("LEADERBOARD_MIN_REFRESH_INTERVAL", "1.0")
+)
+LEADERBOARD_PRIOR_WEIGHT = float(os.getenv("LEADERBOARD_PRIOR_WEIGHT", "10"))
+LEADERBOARD_PAGE_SIZE = 10
+LEADERBOARD_MAX_PAGE_SIZE = 100
+
+TRUSTED_RESPONSES = os.getenv("TRUSTED_RESPONSES", "false").lower() == "true"
+
+LOCAL_SEARCH = os.getenv("LOCAL_SEARCH", "catalog")
+LOCAL_SEARCH_CHECK_INTERVAL = int(os.getenv("LOCAL_SEARCH_CHECK_INTERVAL", "60"))
+SEARCH_PAGE_SIZE = 32
+
+BOOK_NOT_FOUND_TTL = int(os.getenv("BOOK_NOT_FOUND_TTL", "600"))
+BOOK_NOT_FOUND_CACHE_SIZE = int(os.getenv("BOOK_NOT_FOUND_CACHE_SIZE", "100000"))
+BOOK_METADATA_TTL = int(os.getenv("BOOK_METADATA_TTL", str(60 * 60 * 24)))
+STALE_WHILE_REVALIDATE = int(os.getenv("STALE_WHILE_REVALIDATE", "0"))
+
+CACHE_WARM_INTERVAL = float(os.getenv("CACHE_WARM_INTERVAL", "30"))
+CACHE_WARM_KEYS = int(os.getenv("CACHE_WARM_KEYS", "50"))
+CACHE_WARM_TRACKED_KEYS = int(os.getenv("CACHE_WARM_TRACKED_KEYS", "1000"))
+CACHE_WARM_MIN_HITS = int(os.getenv("CACHE_WARM_MIN_HITS", "2"))
+CACHE_WARM_BUDGET = int(os.getenv("CACHE_WARM_BUDGET", "20"))
+CACHE_WARM_QPS = float(os.getenv("CACHE_WARM_QPS", "2"))
+CACHE_WARM_TOP_RATED = int(os.getenv("CACHE_WARM_TOP_RATED", "100"))
+
 MONTHS = {
     1: "January",
     2: "February",
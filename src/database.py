@@ -1,33 +1,194 @@
 """
 Project database settings
+
+The engine is tuned for its backend. SQLite runs in WAL mode, so readers
+are not blocked by the writer, and waits for locks instead of failing.
+Connections are pooled, and other backends, such as Postgres, check them
+before use. Postgres statements are cancelled after DB_STATEMENT_TIMEOUT
+seconds.
 """
 
 import os
 
-from sqlalchemy import create_engine
+from sqlalchemy import Date, Integer, event
+from sqlalchemy.engine import URL, Engine, make_url
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.ext.compiler import compiles
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from sqlalchemy.sql import cast, expression, extract
+
+import metrics
+from constants import (DB_CONNECT_TIMEOUT, DB_MAX_OVERFLOW, DB_POOL_RECYCLE,
+                       DB_POOL_SIZE, DB_POOL_TIMEOUT, DB_STATEMENT_TIMEOUT,
+                       SQLITE_BUSY_TIMEOUT, SQLITE_MMAP_SIZE)
 
-SQLALCHEMY_DATABASE_URL = os.getenv("SQLALCHEMY_DATABASE_URL", "sqlite:///./books.db")
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgres": "postgresql+asyncpg",
+    "postgresql": "postgresql+asyncpg",
+}
 
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
+SQLALCHEMY_DATABASE_URL = os.getenv(
+    "SQLALCHEMY_DATABASE_URL", "sqlite+aiosqlite:///./books.db"
 )
 
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+def get_async_url(database_url: str):
+    """
+    This function is used to map a database url to its async driver
+
+    :param database_url: database url
+
+    :return: database url using an async driver
+    """
+
+    url = make_url(database_url)
+    return url.set(drivername=ASYNC_DRIVERS.get(url.drivername, url.drivername))
+
+
+def is_sqlite_file(url: URL) -> bool:
+    """
+    This function is used to check if a database url points to a SQLite
+    file, rather than to an in-memory database
+
+    :param url: database url
+
+    :return: whether the database is a SQLite file
+    """
+
+    return url.get_backend_name() == "sqlite" and url.database not in (
+        None,
+        "",
+        ":memory:",
+    )
+
+
+def get_engine_options(url: URL) -> dict:
+    """
+    This function is used to get the engine options of a database backend
+
+    :param url: async database url
+
+    :return: create_async_engine keyword arguments
+    """
+
+    if url.get_backend_name() == "sqlite":
+        options = {
+            "connect_args": {
+                "check_same_thread": False,
+                "timeout": SQLITE_BUSY_TIMEOUT,
+            }
+        }
+        if is_sqlite_file(url):
+            # Opening a connection starts a thread and sets the pragmas, so
+            # keep connections open instead of the default NullPool
+            options.update(
+                poolclass=AsyncAdaptedQueuePool,
+                pool_size=DB_POOL_SIZE,
+                max_overflow=DB_MAX_OVERFLOW,
+                pool_timeout=DB_POOL_TIMEOUT,
+            )
+        return options
+
+    options = {
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": True,
+    }
+    if url.drivername == "postgresql+asyncpg":
+        options["connect_args"] = {
+            "timeout": DB_CONNECT_TIMEOUT,
+            "server_settings": {
+                "statement_timeout": str(int(DB_STATEMENT_TIMEOUT * 1000)),
+            },
+        }
+    return options
+
+
+def configure_sqlite(engine: Engine, wal: bool = True):
+    """
+    This function is used to set the pragmas of every new SQLite connection
+
+    :param engine: sync engine, e.g. AsyncEngine.sync_engine
+    :param wal: whether to use WAL mode, which needs a database file
+    """
+
+    @event.listens_for(engine, "connect")
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        if wal:
+            cursor.execute("PRAGMA journal_mode=WAL")
+            cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute(f"PRAGMA busy_timeout={int(SQLITE_BUSY_TIMEOUT * 1000)}")
+        cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+        cursor.close()
+
+
+database_url = get_async_url(SQLALCHEMY_DATABASE_URL)
+
+engine = create_async_engine(database_url, **get_engine_options(database_url))
+if database_url.get_backend_name() == "sqlite":
+    configure_sqlite(engine.sync_engine, wal=is_sqlite_file(database_url))
+metrics.instrument_engine(engine.sync_engine)
+
+SessionLocal = sessionmaker(
+    engine,
+    class_=AsyncSession,
+    autocommit=False,
+    autoflush=False,
+    expire_on_commit=False,
+)
 
 Base = declarative_base()
 
+
+class day_of(expression.FunctionElement):
+    """
+    Day of a timestamp, as a date on every backend
+    """
+
+    type = Date()
+    name = "day_of"
+    inherit_cache = True
+
+
+@compiles(day_of)
+def compile_day_of(element, compiler, **kw):
+    (column,) = element.clauses
+    return compiler.process(cast(column, Date), **kw)
+
+
+@compiles(day_of, "sqlite")
+def compile_day_of_sqlite(element, compiler, **kw):
+    # SQLite casts to DATE with a numeric affinity, which keeps only the year
+    return "date(%s)" % compiler.process(element.clauses, **kw)
+
+
+def extract_int(field: str, column) -> expression.ColumnElement:
+    """
+    This function is used to extract a date field as an integer, where
+    Postgres would return a numeric
+
+    :param field: date field, e.g. "year" or "month"
+    :param column: date or timestamp column
+
+    :return: integer expression
+    """
+
+    return cast(extract(field, column), Integer)
+
+
 metadata = Base.metadata
 
 
-def get_db():
+async def get_db():
     """
     This function is used to get database session
     """
 
-    db = SessionLocal()
-    try:
+    async with SessionLocal() as db:
         yield db
-    finally:
-        db.close()
@@ -0,0 +1,281 @@
+"""
+Bounded in-process cache tier
+
+`LocalBackend` keeps cache entries in process memory, within a byte
+budget. Entries are evicted in least recently used order, and a new entry
+only takes the place of the next entry to evict if its key was requested
+more often (TinyLFU admission), so keys requested once, such as the pages
+of a rare search, do not push popular entries out. Large values can be
+compressed with zlib. `TieredBackend` puts a local tier in front of a shared
+backend such as memcached or redis.
+"""
+
+import time
+import zlib
+from collections import OrderedDict
+from typing import Dict, NamedTuple, Optional, Tuple, Union
+
+from fastapi_cache.backends import Backend
+
+import metrics
+from constants import (CACHE_LOCAL_COMPRESS, CACHE_LOCAL_MAX_BYTES,
+                       CACHE_LOCAL_TTL)
+
+# Estimated memory used by an entry besides its key and value
+ENTRY_OVERHEAD = 200
+COMPRESS_MIN_SIZE = 512
+COMPRESSION_LEVEL = 1
+AVERAGE_ENTRY_SIZE = 1024
+
+Value = Union[str, bytes]
+
+
+class FrequencySketch:
+    """
+    Count-min sketch of 4-bit counters estimating how often keys were
+    requested. Every counter is halved once `sample_size` keys were counted,
+    so estimates follow the recent requests.
+    """
+
+    DEPTH = 4
+    MAX_COUNT = 15
+
+    def __init__(self, width: int):
+        self.mask = (1 << max(width - 1, 1).bit_length()) - 1
+        self.rows = [bytearray(self.mask + 1) for _ in range(self.DEPTH)]
+        self.sample_size = 10 * (self.mask + 1)
+        self.additions = 0
+
+    def _indexes(self, key: str):
+        return [hash((seed, key)) & self.mask for seed in range(self.DEPTH)]
+
+    def add(self, key: str):
+        """
+        This function is used to count a request for a key
+
+        :param key: cache key
+        """
+
+        for row, index in zip(self.rows, self._indexes(key)):
+            if row[index] < self.MAX_COUNT:
+                row[index] += 1
+        self.additions += 1
+        if self.additions >= self.sample_size:
+            self.additions //= 2
+            self.rows = [bytearray(count >> 1 for count in row) for row in self.rows]
+
+    def estimate(self, key: str) -> int:
+        """
+        This function is used to estimate how often a key was requested
+
+        :param key: cache key
+
+        :return: estimated count
+        """
+
+        return min(row[index] for row, index in zip(self.rows, self._indexes(key)))
+
+
+class Entry(NamedTuple):
+    """
+    Stored value, compressed or not
+    """
+
+    data: bytes
+    is_text: bool
+    compressed: bool
+    size: int
+    expires_at: Optional[float]
+    ttl_expires_at: Optional[float]
+
+
+class LocalBackend(Backend):
+    """
+    In-process cache backend holding at most `max_bytes` of entries. With
+    `max_ttl` set, entries are kept at most that many seconds, which bounds
+    how long an entry invalidated by another process can be served.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int = CACHE_LOCAL_MAX_BYTES,
+        compress: bool = CACHE_LOCAL_COMPRESS,
+        max_ttl: Optional[float] = None,
+        tier: str = "local",
+    ):
+        self.max_bytes = max_bytes
+        self.compress = compress
+        self.max_ttl = max_ttl
+        self.tier = tier
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, Entry]" = OrderedDict()
+        self._sketch = FrequencySketch(max(max_bytes // AVERAGE_ENTRY_SIZE, 1024))
+        metrics.CACHE_LOCAL_BYTES.collect = lambda: {(): self.bytes}
+        metrics.CACHE_LOCAL_ENTRIES.collect = lambda: {(): len(self._entries)}
+
+    def _lookup(self, key: str) -> Optional[Entry]:
+        self._sketch.add(key)
+        entry = self._entries.get(key)
+        if entry is not None and entry.expires_at is not None:
+            if entry.expires_at <= time.monotonic():
+                self._remove(key)
+                metrics.CACHE_LOCAL_EVICTIONS.inc("expired")
+                entry = None
+        if entry is None:
+            self.misses += 1
+            metrics.CACHE_TIER_REQUESTS.inc(self.tier, "miss")
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        metrics.CACHE_TIER_REQUESTS.inc(self.tier, "hit")
+        return entry
+
+    @staticmethod
+    def _decode(entry: Entry) -> Value:
+        data = zlib.decompress(entry.data) if entry.compressed else entry.data
+        return data.decode() if entry.is_text else data
+
+    def _remove(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.bytes -= entry.size
+
+    async def get_with_ttl(self, key: str) -> Tuple[int, Optional[Value]]:
+        entry = self._lookup(key)
+        if entry is None:
+            return 0, None
+        ttl = 0
+        if entry.ttl_expires_at is not None:
+            ttl = max(int(entry.ttl_expires_at - time.monotonic()), 0)
+        return ttl, self._decode(entry)
+
+    async def get(self, key: str) -> Optional[Value]:
+        entry = self._lookup(key)
+        return None if entry is None else self._decode(entry)
+
+    async def set(self, key: str, value: Value, expire: Optional[int] = None):
+        self.store(key, value, expire)
+
+    def store(self, key: str, value: Value, expire: Optional[float] = None) -> bool:
+        """
+        This function is used to store an entry, evicting the least recently
+        used entries to make room, unless the entry is larger than the cache
+        or its key is requested less often than the entry it would evict
+
+        :param key: cache key
+        :param value: encoded value
+        :param expire: time to live in seconds, None or 0 for no expiry
+
+        :return: whether the entry was stored
+        """
+
+        is_text = isinstance(value, str)
+        data = value.encode() if is_text else value
+        compressed = False
+        if self.compress and len(data) >= COMPRESS_MIN_SIZE:
+            packed = zlib.compress(data, COMPRESSION_LEVEL)
+            if len(packed) < len(data):
+                data, compressed = packed, True
+        size = len(data) + len(key) + ENTRY_OVERHEAD
+
+        self._remove(key)
+        if size > self.max_bytes:
+            metrics.CACHE_LOCAL_EVICTIONS.inc("rejected")
+            return False
+        frequency = self._sketch.estimate(key)
+        while self.bytes + size > self.max_bytes:
+            victim_key = next(iter(self._entries))
+            if self._sketch.estimate(victim_key) > frequency:
+                metrics.CACHE_LOCAL_EVICTIONS.inc("rejected")
+                return False
+            self._remove(victim_key)
+            metrics.CACHE_LOCAL_EVICTIONS.inc("evicted")
+
+        now = time.monotonic()
+        ttl_expires_at = now + expire if expire else None
+        expires_at = ttl_expires_at
+        if self.max_ttl:
+            expires_at = min(expires_at or now + self.max_ttl, now + self.max_ttl)
+        self._entries[key] = Entry(
+            data, is_text, compressed, size, expires_at, ttl_expires_at
+        )
+        self.bytes += size
+        return True
+
+    async def clear(self, namespace: Optional[str] = None, key: Optional[str] = None):
+        if namespace:
+            keys = [name for name in self._entries if name.startswith(namespace)]
+        else:
+            keys = [key] if key in self._entries else []
+        for name in keys:
+            self._remove(name)
+        return len(keys)
+
+    def stats(self) -> Dict[str, float]:
+        """
+        This function is used to report the cache usage, to size it
+
+        :return: entries, bytes used, byte budget and hit ratio
+        """
+
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self.bytes,
+            "max_bytes": self.max_bytes,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+        }
+
+
+class TieredBackend(Backend):
+    """
+    Local tier in front of a shared backend. Reads try the local tier first,
+    writes and invalidations go to both. Local entries are kept at most
+    `local_ttl` seconds, so entries changed by other processes are picked up.
+    """
+
+    def __init__(
+        self,
+        shared: Backend,
+        local: Optional[LocalBackend] = None,
+        local_ttl: float = CACHE_LOCAL_TTL,
+    ):
+        self.shared = shared
+        self.local = local or LocalBackend()
+        self.local.max_ttl = local_ttl
+
+    async def get_with_ttl(self, key: str) -> Tuple[int, Optional[Value]]:
+        ttl, value = await self.local.get_with_ttl(key)
+        if value is not None:
+            return ttl, value
+        ttl, value = await self.shared.get_with_ttl(key)
+        metrics.CACHE_TIER_REQUESTS.inc(
+            "shared", "miss" if value is None else "hit"
+        )
+        if value is not None:
+            self.local.store(key, value, ttl or None)
+        return ttl, value
+
+    async def get(self, key: str) -> Optional[Value]:
+        _, value = await self.get_with_ttl(key)
+        return value
+
+    async def set(self, key: str, value: Value, expire: Optional[int] = None):
+        await self.shared.set(key, value, expire=expire)
+        self.local.store(key, value, expire)
+
+    async def clear(self, namespace: Optional[str] = None, key: Optional[str] = None):
+        await self.local.clear(namespace=namespace, key=key)
+        return await self.shared.clear(namespace=namespace, key=key)
+
+    async def close(self):
+        """
+        This function is used to release the shared backend connections
+        """
+
+        if hasattr(self.shared, "close"):
+            await self.shared.close()
+        elif hasattr(self.shared, "redis"):
+            await self.shared.redis.close()
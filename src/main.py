@@ -3,16 +3,26 @@ FastAPI app
 """
 
 from fastapi import FastAPI
-from fastapi_cache import FastAPICache
-from fastapi_cache.backends.inmemory import InMemoryBackend
+from fastapi.responses import PlainTextResponse
 from starlette.config import Config
 
+import books.known_ids as known_ids
+import books.leaderboard as leaderboard
+import books.repository as repository
+import books.warming as warming
+import caching
+import metrics
+import migrations
+import upstream
 from books.router import book_router
-from database import Base, engine
+from constants import REVIEW_WRITE_MODE
 
 config = Config(".env")
 
 ENVIRONMENT = config("ENVIRONMENT", default="local")
+RUN_MIGRATIONS_ON_STARTUP = config(
+    "RUN_MIGRATIONS_ON_STARTUP", cast=bool, default=True
+)
 SHOW_DOCS_ENVIRONMENT = ("local",)
 
 app_configs = {"title": "Books API"}
@@ -22,8 +32,32 @@ if ENVIRONMENT not in SHOW_DOCS_ENVIRONMENT:
 
 app = FastAPI(**app_configs)
 
-FastAPICache().init(InMemoryBackend(), prefix="book_api")
+app.add_middleware(metrics.MetricsMiddleware)
+app.include_router(book_router)
 
-Base.metadata.create_all(bind=engine)
 
-app.include_router(book_router)
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    return PlainTextResponse(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+
+@app.on_event("startup")
+async def startup():
+    if RUN_MIGRATIONS_ON_STARTUP:
+        await migrations.upgrade()
+    await caching.startup()
+    await known_ids.load()
+    await upstream.startup()
+    await leaderboard.startup()
+    await warming.startup()
+    if REVIEW_WRITE_MODE == "queued":
+        await repository.review_writer.start()
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    await warming.shutdown()
+    await repository.review_writer.stop()
+    await leaderboard.shutdown()
+    await upstream.shutdown()
+    await caching.shutdown()
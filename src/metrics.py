@@ -0,0 +1,378 @@
+"""
+Prometheus metrics
+
+Counters and histograms are kept in process memory and rendered in the
+Prometheus text format by the /metrics endpoint. Recording a value is a
+dict lookup and a few additions, so the metrics stay on in production.
+"""
+
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from functools import wraps
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+DEFAULT_BUCKETS = (
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1,
+    2.5,
+    5,
+    10,
+)
+CONTENT_TYPE = "text/plain; version=0.0.4"
+
+REGISTRY: List["Metric"] = []
+
+_span: ContextVar[str] = ContextVar("span", default="none")
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(
+        f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)
+    )
+    return "{" + pairs + "}"
+
+
+class Metric:
+    """
+    Base metric, registered on creation
+    """
+
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        REGISTRY.append(self)
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.kind}",
+            *self.samples(),
+        ]
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    """
+    Monotonic counter
+    """
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self.values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labelvalues: str, amount: float = 1):
+        self.values[labelvalues] = self.values.get(labelvalues, 0) + amount
+
+    def samples(self) -> List[str]:
+        return [
+            f"{self.name}{_format_labels(self.labelnames, labels)} {value}"
+            for labels, value in self.values.items()
+        ]
+
+
+class Gauge(Metric):
+    """
+    Gauge, set directly or read from a callback when rendered
+    """
+
+    kind = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        collect: Optional[Callable[[], Dict[Tuple[str, ...], float]]] = None,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.values: Dict[Tuple[str, ...], float] = {}
+        self.collect = collect
+
+    def inc(self, *labelvalues: str, amount: float = 1):
+        self.values[labelvalues] = self.values.get(labelvalues, 0) + amount
+
+    def dec(self, *labelvalues: str, amount: float = 1):
+        self.inc(*labelvalues, amount=-amount)
+
+    def samples(self) -> List[str]:
+        values = dict(self.values)
+        if self.collect is not None:
+            values.update(self.collect())
+        return [
+            f"{self.name}{_format_labels(self.labelnames, labels)} {value}"
+            for labels, value in values.items()
+        ]
+
+
+class Histogram(Metric):
+    """
+    Histogram with fixed buckets, in seconds
+    """
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+        self.values: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, *labelvalues: str):
+        series = self.values.get(labelvalues)
+        if series is None:
+            series = self.values[labelvalues] = [[0] * len(self.buckets), 0.0, 0]
+        index = bisect_left(self.buckets, value)
+        if index < len(self.buckets):
+            series[0][index] += 1
+        series[1] += value
+        series[2] += 1
+
+    def samples(self) -> List[str]:
+        lines = []
+        names = self.labelnames + ("le",)
+        for labels, (counts, total, count) in self.values.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                lines.append(
+                    f"{self.name}_bucket"
+                    f"{_format_labels(names, labels + (repr(float(bound)),))} "
+                    f"{cumulative}"
+                )
+            lines.append(
+                f"{self.name}_bucket{_format_labels(names, labels + ('+Inf',))} "
+                f"{count}"
+            )
+            label_text = _format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{label_text} {total}")
+            lines.append(f"{self.name}_count{label_text} {count}")
+        return lines
+
+
+def render() -> str:
+    """
+    This function is used to render every metric in the Prometheus text
+    format
+
+    :return: metrics text
+    """
+
+    return "\n".join(metric.render() for metric in REGISTRY) + "\n"
+
+
+REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds",
+    "HTTP request latency by route",
+    ("method", "route", "status"),
+)
+UPSTREAM_REQUESTS = Counter(
+    "upstream_requests_total", "Gutendex requests by status", ("status",)
+)
+UPSTREAM_DURATION = Histogram(
+    "upstream_request_duration_seconds", "Gutendex request latency"
+)
+UPSTREAM_CIRCUIT_STATE = Gauge(
+    "upstream_circuit_state", "Gutendex circuit breaker: 0 closed, 1 half open, 2 open"
+)
+UPSTREAM_CIRCUIT_TRANSITIONS = Counter(
+    "upstream_circuit_transitions_total",
+    "Gutendex circuit breaker state changes by new state",
+    ("state",),
+)
+RATE_LIMIT_DECISIONS = Counter(
+    "rate_limit_decisions_total",
+    "Rate limited calls by limiter and result: allowed, delayed or rejected",
+    ("limiter", "result"),
+)
+CACHE_REQUESTS = Counter(
+    "cache_requests_total",
+    "Response cache lookups by namespace and result",
+    ("namespace", "result"),
+)
+CACHE_TIER_REQUESTS = Counter(
+    "cache_tier_requests_total",
+    "Cache backend lookups by tier, local or shared, and result",
+    ("tier", "result"),
+)
+CACHE_LOCAL_BYTES = Gauge("cache_local_bytes", "Memory used by the local cache tier")
+CACHE_LOCAL_ENTRIES = Gauge("cache_local_entries", "Entries in the local cache tier")
+CACHE_LOCAL_EVICTIONS = Counter(
+    "cache_local_evictions_total",
+    "Local cache entries evicted, expired, or rejected on admission",
+    ("reason",),
+)
+FUNCTION_DURATION = Histogram(
+    "repository_duration_seconds",
+    "Repository function latency, including upstream and database time",
+    ("function",),
+)
+DB_QUERY_DURATION = Histogram(
+    "db_query_duration_seconds",
+    "Database statement latency by calling repository function",
+    ("function",),
+)
+BOOK_ID_REJECTIONS = Counter(
+    "book_id_rejections_total",
+    "Unknown book ids rejected without a Gutendex call, by reason",
+    ("reason",),
+)
+REVIEW_QUEUE_DEPTH = Gauge("review_queue_depth", "Queued reviews not written yet")
+REVIEW_WRITES = Counter(
+    "review_queue_writes_total", "Queued reviews written or lost", ("result",)
+)
+REVIEW_BATCH_SIZE = Histogram(
+    "review_queue_batch_size",
+    "Reviews written per queued batch",
+    buckets=(1, 5, 10, 50, 100, 500, 1000, 5000),
+)
+CACHE_WARM_REFRESHES = Counter(
+    "cache_warm_refreshes_total",
+    "Entries refreshed ahead of their expiry by kind and result",
+    ("kind", "result"),
+)
+DB_CONNECTIONS = Gauge("db_connections_checked_out", "Database connections in use")
+DB_POOL_SIZE = Gauge("db_pool_size", "Database connection pool size")
+
+
+def timed(func):
+    """
+    This function is used to time a repository coroutine function, and to
+    attribute the database statements it runs to it
+
+    :param func: coroutine function
+
+    :return: timed coroutine function
+    """
+
+    name = func.__name__
+
+    @wraps(func)
+    async def inner(*args, **kwargs):
+        token = _span.set(name)
+        started = time.perf_counter()
+        try:
+            return await func(*args, **kwargs)
+        finally:
+            FUNCTION_DURATION.observe(time.perf_counter() - started, name)
+            _span.reset(token)
+
+    return inner
+
+
+def instrument_engine(engine: Engine):
+    """
+    This function is used to time the statements and count the connections
+    in use of a database engine
+
+    :param engine: sync engine, e.g. AsyncEngine.sync_engine
+    """
+
+    pool = engine.pool
+    if hasattr(pool, "size"):
+        DB_POOL_SIZE.collect = lambda: {(): pool.size()}
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, many):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, many):
+        started = conn.info["query_started"].pop()
+        DB_QUERY_DURATION.observe(time.perf_counter() - started, _span.get())
+
+    @event.listens_for(engine, "handle_error")
+    def handle_error(exception_context):
+        connection = exception_context.connection
+        if connection is not None and connection.info.get("query_started"):
+            connection.info["query_started"].pop()
+
+    @event.listens_for(engine, "checkout")
+    def checkout(dbapi_connection, connection_record, connection_proxy):
+        DB_CONNECTIONS.inc()
+
+    @event.listens_for(engine, "checkin")
+    def checkin(dbapi_connection, connection_record):
+        DB_CONNECTIONS.dec()
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording the latency of every HTTP request, labelled
+    with the route path template
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.route_paths: Dict[Callable, str] = {}
+
+    def route_path(self, scope) -> str:
+        endpoint = scope.get("endpoint")
+        if endpoint is None:
+            return "unmatched"
+        path = self.route_paths.get(endpoint)
+        if path is None:
+            path = next(
+                (
+                    route.path
+                    for route in scope["app"].routes
+                    if getattr(route, "endpoint", None) is endpoint
+                ),
+                endpoint.__name__,
+            )
+            self.route_paths[endpoint] = path
+        return path
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+        started = time.perf_counter()
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            REQUEST_DURATION.observe(
+                time.perf_counter() - started,
+                scope["method"],
+                self.route_path(scope),
+                str(status),
+            )
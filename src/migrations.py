@@ -0,0 +1,209 @@
+"""
+Versioned schema migrations
+
+New tables are created from the models, migrations bring tables that
+already exist up to date. Run `python -m migrations` from the `src`
+directory to apply pending migrations without starting the app. Upgrades
+hold a database lock, so workers starting together apply each migration
+once: an advisory lock on Postgres, the write lock on SQLite.
+"""
+
+import asyncio
+from datetime import datetime
+from typing import Callable, List, Tuple
+
+from sqlalchemy import (Column, DateTime, Float, Integer, String, Table, cast,
+                        delete, insert, inspect, select, text)
+from sqlalchemy.engine import Connection
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.sql import func
+
+import books.search as search_index
+import models as models
+from database import day_of, engine, metadata
+
+# Postgres advisory lock key held while migrations are applied
+MIGRATIONS_LOCK_KEY = 7_150_001
+
+schema_migrations = Table(
+    "schema_migrations",
+    metadata,
+    Column("version", Integer, primary_key=True, autoincrement=False),
+    Column("description", String, nullable=False),
+    Column("applied_at", DateTime, nullable=False),
+)
+
+
+def _create_indexes(connection: Connection, table: Table, *names: str):
+    for index in table.indexes:
+        if index.name in names:
+            index.create(connection, checkfirst=True)
+
+
+def add_book_review_indexes(connection: Connection):
+    """
+    Index book reviews by book, for the per-book rating and review queries
+    """
+
+    _create_indexes(
+        connection,
+        models.BookReview.__table__,
+        "ix_book_reviews_book_id_date",
+        "ix_book_reviews_book_id_rating",
+    )
+
+
+def backfill_book_rating_rollups(connection: Connection):
+    """
+    Fill the daily rating rollups from the reviews written before them
+    """
+
+    reviews = models.BookReview.__table__
+    day = day_of(reviews.c.date)
+    connection.execute(
+        insert(models.BookRatingRollup.__table__).from_select(
+            ["book_id", "day", "review_count", "rating_sum"],
+            select(
+                [
+                    reviews.c.book_id,
+                    day,
+                    func.count(reviews.c.id),
+                    func.sum(reviews.c.rating),
+                ]
+            ).group_by(reviews.c.book_id, day),
+        )
+    )
+
+
+def backfill_book_rating_stats(connection: Connection):
+    """
+    Fill the rating aggregates from the reviews written before them, rows
+    recorded since then are recomputed
+    """
+
+    reviews = models.BookReview.__table__
+    stats = models.BookRatingStats.__table__
+    connection.execute(delete(stats))
+    connection.execute(
+        insert(stats).from_select(
+            ["book_id", "review_count", "rating_sum", "rating_avg", "last_review_at"],
+            select(
+                [
+                    reviews.c.book_id,
+                    func.count(reviews.c.id),
+                    func.sum(reviews.c.rating),
+                    cast(func.avg(reviews.c.rating), Float),
+                    func.max(reviews.c.date),
+                ]
+            ).group_by(reviews.c.book_id),
+        )
+    )
+
+
+def add_book_review_uuids(connection: Connection):
+    """
+    Add the public review ids, reviews written before them have none
+    """
+
+    columns = inspect(connection).get_columns("book_reviews")
+    if "uuid" not in {column["name"] for column in columns}:
+        connection.execute(text("ALTER TABLE book_reviews ADD COLUMN uuid VARCHAR(36)"))
+    _create_indexes(connection, models.BookReview.__table__, "ix_book_reviews_uuid")
+
+
+def add_catalog_import_completeness(connection: Connection):
+    """
+    Add the highest id and the completeness of book catalogs, catalogs
+    imported before them are not trusted to list every book
+    """
+
+    columns = inspect(connection).get_columns("catalog_imports")
+    names = {column["name"] for column in columns}
+    if "max_book_id" not in names:
+        connection.execute(
+            text("ALTER TABLE catalog_imports ADD COLUMN max_book_id INTEGER")
+        )
+    if "complete" not in names:
+        connection.execute(
+            text(
+                "ALTER TABLE catalog_imports "
+                "ADD COLUMN complete BOOLEAN NOT NULL DEFAULT FALSE"
+            )
+        )
+
+
+MIGRATIONS: List[Tuple[int, str, Callable[[Connection], None]]] = [
+    (1, "Add book_reviews indexes on book_id", add_book_review_indexes),
+    (2, "Backfill book_rating_rollups from reviews", backfill_book_rating_rollups),
+    (3, "Add the book_search full-text index", search_index.create_index),
+    (4, "Add book_reviews uuid", add_book_review_uuids),
+    (5, "Add catalog_imports completeness", add_catalog_import_completeness),
+    (6, "Backfill book_rating_stats from reviews", backfill_book_rating_stats),
+]
+
+
+def lock_schema(connection: Connection):
+    """
+    This function is used to wait for the other upgrades to finish, holding
+    a lock until the end of the transaction
+
+    :param connection: database connection, in a transaction
+    """
+
+    if connection.dialect.name == "postgresql":
+        connection.execute(
+            text("SELECT pg_advisory_xact_lock(:key)"), {"key": MIGRATIONS_LOCK_KEY}
+        )
+    elif connection.dialect.name == "sqlite":
+        connection.exec_driver_sql("BEGIN IMMEDIATE")
+
+
+def apply_migrations(connection: Connection) -> List[int]:
+    """
+    This function is used to create missing tables and apply pending migrations
+
+    :param connection: database connection
+
+    :return: applied migration versions
+    """
+
+    applied = []
+    lock_schema(connection)
+    metadata.create_all(connection)
+    current_versions = set(
+        connection.execute(select(schema_migrations.c.version)).scalars()
+    )
+    for version, description, migration in MIGRATIONS:
+        if version in current_versions:
+            continue
+        migration(connection)
+        connection.execute(
+            insert(schema_migrations).values(
+                version=version,
+                description=description,
+                applied_at=datetime.utcnow(),
+            )
+        )
+        applied.append(version)
+    return applied
+
+
+async def upgrade(bind: AsyncEngine = engine) -> List[int]:
+    """
+    This function is used to bring the database schema up to date
+
+    :param bind: database engine
+
+    :return: applied migration versions
+    """
+
+    async with bind.begin() as connection:
+        return await connection.run_sync(apply_migrations)
+
+
+if __name__ == "__main__":
+    applied_versions = asyncio.run(upgrade())
+    if applied_versions:
+        print(f"Applied migrations: {', '.join(map(str, applied_versions))}")
+    else:
+        print("Database is up to date")
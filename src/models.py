@@ -2,7 +2,10 @@
 Book Models
 """
 
-from sqlalchemy import Column, DateTime, Integer, SmallInteger, String
+from uuid import uuid4
+
+from sqlalchemy import (JSON, Boolean, Column, Date, DateTime, Float, Index,
+                        Integer, SmallInteger, String)
 from sqlalchemy.orm import validates
 from sqlalchemy.sql import func
 
@@ -15,8 +18,14 @@ class BookReview(Base):
     """
 
     __tablename__ = "book_reviews"
+    __table_args__ = (
+        Index("ix_book_reviews_book_id_date", "book_id", "date"),
+        Index("ix_book_reviews_book_id_rating", "book_id", "rating"),
+        Index("ix_book_reviews_uuid", "uuid", unique=True),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
+    uuid = Column(String(length=36), default=lambda: str(uuid4()))
     book_id = Column(Integer, nullable=False)
     rating = Column(SmallInteger, nullable=False)
     review = Column(String(length=500), nullable=False)
@@ -27,3 +36,65 @@ class BookReview(Base):
         if not 0 <= value <= 5:
             raise ValueError("Rating must be between 0 and 5")
         return value
+
+
+class Book(Base):
+    """
+    Book metadata Model, a local copy of the external API data
+    """
+
+    __tablename__ = "books"
+
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    title = Column(String, nullable=False)
+    authors = Column(JSON, nullable=False, default=list)
+    languages = Column(JSON, nullable=False, default=list)
+    download_count = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, nullable=False)
+
+
+class BookRatingStats(Base):
+    """
+    Book Rating Stats Model, per-book rating aggregates kept up to date on
+    every review insert
+    """
+
+    __tablename__ = "book_rating_stats"
+    __table_args__ = (Index("ix_book_rating_stats_rating_avg", "rating_avg"),)
+
+    book_id = Column(Integer, primary_key=True, autoincrement=False)
+    review_count = Column(Integer, nullable=False, default=0)
+    rating_sum = Column(Integer, nullable=False, default=0)
+    rating_avg = Column(Float, nullable=False, default=0.0)
+    last_review_at = Column(DateTime(timezone=True))
+
+
+class BookRatingRollup(Base):
+    """
+    Book Rating Rollup Model, per-book daily review counts and rating sums
+    kept up to date on every review insert
+    """
+
+    __tablename__ = "book_rating_rollups"
+
+    book_id = Column(Integer, primary_key=True, autoincrement=False)
+    day = Column(Date, primary_key=True)
+    review_count = Column(Integer, nullable=False, default=0)
+    rating_sum = Column(Integer, nullable=False, default=0)
+
+
+class CatalogImport(Base):
+    """
+    Catalog Import Model, one row per book catalog file loaded into the
+    book metadata and the search index. A complete catalog lists every book
+    up to its highest id.
+    """
+
+    __tablename__ = "catalog_imports"
+
+    id = Column(Integer, primary_key=True)
+    source = Column(String, nullable=False)
+    book_count = Column(Integer, nullable=False)
+    imported_at = Column(DateTime, nullable=False)
+    max_book_id = Column(Integer)
+    complete = Column(Boolean, nullable=False, default=False)
@@ -0,0 +1,180 @@
+"""
+Token bucket rate limiting
+
+Each limited key, such as a client or Gutendex as a whole, has a bucket
+that refills at `rate` tokens per second up to `burst` tokens, and every
+call takes a token. Calls finding the bucket empty either wait for their
+token, up to `max_wait` seconds, or are rejected with a 429 and a
+Retry-After header. Buckets are kept in process memory, or, when a
+shared cache is configured, so every worker takes from the same buckets,
+as atomic counters of the tokens taken in each window of `burst / rate`
+seconds. Shared buckets hold at most `burst` tokens per window, so a
+client can make up to twice `burst` calls around the end of a window.
+"""
+
+import asyncio
+import itertools
+import math
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from fastapi import HTTPException, Request, status
+from fastapi_cache.backends import Backend
+
+import caching
+import metrics
+from constants import (RATE_LIMIT_BURST, RATE_LIMIT_KEY_HEADER,
+                       RATE_LIMIT_MAX_CLIENTS, RATE_LIMIT_RATE)
+
+Bucket = Tuple[float, float]
+
+
+class RateLimited(HTTPException):
+    """
+    A token bucket is empty, and would not refill within the allowed wait
+    """
+
+    def __init__(self, detail: str, retry_after: float):
+        super().__init__(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=detail,
+            headers={"Retry-After": str(max(math.ceil(retry_after), 1))},
+        )
+
+
+def take_token(
+    bucket: Optional[Bucket], rate: float, burst: float, now: float
+) -> Tuple[Bucket, float]:
+    """
+    This function is used to take a token from a bucket. A token that is
+    not there yet is reserved, and the bucket goes below zero until it
+    refills.
+
+    :param bucket: tokens and time of the last update, None for a full bucket
+    :param rate: tokens added per second
+    :param burst: bucket size
+    :param now: current time, in seconds
+
+    :return: updated bucket, and seconds until the token is there
+    """
+
+    tokens, updated_at = bucket if bucket is not None else (burst, now)
+    tokens = min(tokens + max(now - updated_at, 0) * rate, burst) - 1
+    return (tokens, now), max(-tokens / rate, 0.0)
+
+
+class RateLimiter:
+    """
+    Token buckets of `burst` tokens refilling at `rate` tokens per second,
+    kept under the `namespace` cache namespace
+    """
+
+    def __init__(
+        self,
+        namespace: str,
+        rate: float,
+        burst: float = 0,
+        max_wait: float = 0,
+        max_keys: int = RATE_LIMIT_MAX_CLIENTS,
+    ):
+        self.namespace = namespace
+        self.rate = rate
+        self.burst = burst or max(rate, 1)
+        self.max_wait = max_wait
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[str, Bucket]" = OrderedDict()
+
+    @property
+    def enabled(self) -> bool:
+        return self.rate > 0
+
+    def _take_local(self, key: str) -> float:
+        updated, wait = take_token(
+            self._buckets.get(key), self.rate, self.burst, time.time()
+        )
+        if wait <= self.max_wait:
+            self._buckets[key] = updated
+            self._buckets.move_to_end(key)
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return wait
+
+    async def _take_shared(self, backend: Backend, key: str) -> float:
+        window = self.burst / self.rate
+        now = time.time()
+        for index in itertools.count(int(now // window)):
+            wait = max(index * window - now, 0.0)
+            if wait > self.max_wait:
+                return wait
+            taken = await caching.increment(
+                backend,
+                caching.build_key(self.namespace, key, index),
+                expire=math.ceil(window + self.max_wait) + 1,
+            )
+            if taken <= self.burst:
+                return wait
+
+    async def acquire(self, key: str, detail: str = "Too many requests"):
+        """
+        This function is used to take a token for a call, waiting for it
+        when it is there within `max_wait` seconds
+
+        :param key: limited key, e.g. a client id
+        :param detail: error detail when the call is rejected
+        """
+
+        if not self.enabled:
+            return
+        backend = caching.get_shared_backend()
+        if backend is None:
+            wait = self._take_local(key)
+        else:
+            wait = await self._take_shared(backend, key)
+        if wait > self.max_wait:
+            metrics.RATE_LIMIT_DECISIONS.inc(self.namespace, "rejected")
+            raise RateLimited(detail, retry_after=wait)
+        if wait > 0:
+            metrics.RATE_LIMIT_DECISIONS.inc(self.namespace, "delayed")
+            await asyncio.sleep(wait)
+        else:
+            metrics.RATE_LIMIT_DECISIONS.inc(self.namespace, "allowed")
+
+    def reset(self):
+        """
+        This function is used to refill the in-process buckets
+        """
+
+        self._buckets.clear()
+
+
+client_limiter = RateLimiter("rate-limit", RATE_LIMIT_RATE, RATE_LIMIT_BURST)
+
+
+def client_id(request: Request) -> str:
+    """
+    This function is used to identify the client of a request, by its API
+    key when it sends one, or else by its address
+
+    :param request: request
+
+    :return: client id
+    """
+
+    api_key = request.headers.get(RATE_LIMIT_KEY_HEADER)
+    if api_key:
+        return "key:" + caching.hash_key(api_key)
+    return "ip:" + (request.client.host if request.client else "unknown")
+
+
+async def limit_client(request: Request):
+    """
+    This function is used as a route dependency to reject the requests of
+    clients going over RATE_LIMIT_RATE requests per second
+
+    :param request: request
+    """
+
+    await client_limiter.acquire(
+        client_id(request), "Too many requests, slow down and retry later"
+    )
@@ -0,0 +1,39 @@
+"""
+Response serialization
+
+Responses are encoded with orjson. With TRUSTED_RESPONSES=true, the book
+list endpoints also skip the response model, whose validation of every
+nested book and author costs more than the encoding itself. Their
+repository functions only return data that was validated when it was
+stored, shaped like the response model.
+"""
+
+from functools import wraps
+
+from fastapi.responses import ORJSONResponse
+
+from constants import TRUSTED_RESPONSES
+
+
+def trusted_response(func=None, *, trusted: bool = TRUSTED_RESPONSES):
+    """
+    This function is used to send the result of an endpoint as is, without
+    validating it against its response model
+
+    :param func: endpoint, whose result is already shaped like the model
+    :param trusted: whether to skip the response model
+
+    :return: endpoint returning an orjson response
+    """
+
+    def wrapper(func):
+        if not trusted:
+            return func
+
+        @wraps(func)
+        async def inner(*args, **kwargs):
+            return ORJSONResponse(await func(*args, **kwargs))
+
+        return inner
+
+    return wrapper(func) if func is not None else wrapper
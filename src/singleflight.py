@@ -0,0 +1,86 @@
+"""
+Request coalescing for concurrent identical calls
+"""
+
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Hashable, Iterable, List
+
+logger = logging.getLogger(__name__)
+
+
+class SingleFlight:
+    """
+    Runs at most one call per key at a time, concurrent callers with the
+    same key wait for and share the result of the call in flight
+    """
+
+    def __init__(self):
+        self._calls: Dict[Hashable, asyncio.Future] = {}
+
+    def _start(
+        self, key: Hashable, func: Callable[[], Awaitable[Any]]
+    ) -> asyncio.Future:
+        call = self._calls.get(key)
+        if call is None:
+            call = asyncio.ensure_future(func())
+            self._calls[key] = call
+            call.add_done_callback(lambda _: self._forget(key, call))
+        return call
+
+    def _forget(self, key: Hashable, call: asyncio.Future):
+        if self._calls.get(key) is call:
+            del self._calls[key]
+
+    async def do(self, key: Hashable, func: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        This function is used to run a call, or join the one in flight
+
+        :param key: call key
+        :param func: coroutine function to run if no call is in flight
+
+        :return: call result
+        """
+
+        return await asyncio.shield(self._start(key, func))
+
+    def refresh(self, key: Hashable, func: Callable[[], Awaitable[Any]]):
+        """
+        This function is used to run a call in the background, unless one
+        with the same key is already in flight
+
+        :param key: call key
+        :param func: coroutine function to run
+        """
+
+        if key in self._calls:
+            return
+        self._start(key, func).add_done_callback(self._log_failure)
+
+    def refresh_many(
+        self, keys: Iterable[Hashable], func: Callable[[List], Awaitable[Any]]
+    ):
+        """
+        This function is used to run a single call in the background for the
+        keys that are not already in flight
+
+        :param keys: call keys
+        :param func: coroutine function to run with the keys not in flight
+        """
+
+        keys = [key for key in dict.fromkeys(keys) if key not in self._calls]
+        if not keys:
+            return
+        call = asyncio.ensure_future(func(keys))
+        for key in keys:
+            self._calls[key] = call
+            call.add_done_callback(lambda _, key=key: self._forget(key, call))
+        call.add_done_callback(self._log_failure)
+
+    @staticmethod
+    def _log_failure(call: asyncio.Future):
+        if not call.cancelled() and call.exception() is not None:
+            logger.warning("Background refresh failed: %r", call.exception())
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._calls
@@ -0,0 +1,297 @@
+"""
+Shared async client for the external books API (Gutendex)
+
+Calls have an overall deadline and are retried with jittered backoff on
+connection errors and 5xx responses, within a retry budget. A circuit
+breaker fails calls fast once Gutendex keeps failing, and lets a single
+trial call through after UPSTREAM_CIRCUIT_RESET seconds. With
+UPSTREAM_MAX_QPS set, calls above that rate, across every worker sharing
+the cache, wait for their turn up to UPSTREAM_QPS_MAX_WAIT seconds and are
+then rejected with a 429.
+"""
+
+import asyncio
+import logging
+import random
+import time
+from typing import Optional
+
+import httpx
+from fastapi import HTTPException, status
+
+import metrics
+import rate_limit
+from constants import (UPSTREAM_CALL_TIMEOUT, UPSTREAM_CIRCUIT_FAILURES,
+                       UPSTREAM_CIRCUIT_RESET, UPSTREAM_CONNECT_TIMEOUT,
+                       UPSTREAM_MAX_CONCURRENCY, UPSTREAM_MAX_CONNECTIONS,
+                       UPSTREAM_MAX_KEEPALIVE_CONNECTIONS, UPSTREAM_MAX_QPS,
+                       UPSTREAM_QPS_BURST, UPSTREAM_QPS_MAX_WAIT,
+                       UPSTREAM_READ_TIMEOUT, UPSTREAM_RETRIES,
+                       UPSTREAM_RETRY_BACKOFF, UPSTREAM_RETRY_BACKOFF_MAX,
+                       UPSTREAM_RETRY_BUDGET, UPSTREAM_RETRY_RESERVE)
+
+logger = logging.getLogger(__name__)
+
+
+class UpstreamUnavailable(HTTPException):
+    """
+    Gutendex could not be reached, kept failing, or the circuit is open
+    """
+
+    def __init__(self, detail: str, retry_after: Optional[float] = None):
+        super().__init__(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=detail,
+            headers={"Retry-After": str(max(int(retry_after), 1))}
+            if retry_after
+            else None,
+        )
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive failures, then lets one
+    trial call through every `reset_timeout` seconds until one succeeds
+    """
+
+    CLOSED = "closed"
+    HALF_OPEN = "half_open"
+    OPEN = "open"
+    STATES = (CLOSED, HALF_OPEN, OPEN)
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trial_in_flight = False
+        metrics.UPSTREAM_CIRCUIT_STATE.values[()] = self.STATES.index(self.state)
+
+    def retry_after(self) -> float:
+        return max(self.opened_at + self.reset_timeout - time.monotonic(), 0.0)
+
+    def allow(self) -> bool:
+        if self.state == self.OPEN:
+            if self.retry_after() > 0:
+                return False
+            self._set_state(self.HALF_OPEN)
+        if self.state == self.HALF_OPEN:
+            if self.trial_in_flight:
+                return False
+            self.trial_in_flight = True
+        return True
+
+    def record_success(self):
+        self.failures = 0
+        self.trial_in_flight = False
+        if self.state != self.CLOSED:
+            self._set_state(self.CLOSED)
+
+    def record_failure(self):
+        self.failures += 1
+        self.trial_in_flight = False
+        if self.state == self.HALF_OPEN or (
+            self.state == self.CLOSED and self.failures >= self.failure_threshold
+        ):
+            self.opened_at = time.monotonic()
+            self._set_state(self.OPEN)
+
+    def release(self):
+        self.trial_in_flight = False
+
+    def _set_state(self, state: str):
+        logger.warning(
+            "Gutendex circuit %s -> %s after %d failures",
+            self.state,
+            state,
+            self.failures,
+        )
+        self.state = state
+        metrics.UPSTREAM_CIRCUIT_STATE.values[()] = self.STATES.index(state)
+        metrics.UPSTREAM_CIRCUIT_TRANSITIONS.inc(state)
+
+
+class RetryBudget:
+    """
+    Allows retries for up to `ratio` of the calls, plus a reserve of
+    `reserve` retries, so retries can not multiply the load on an
+    upstream that is already struggling
+    """
+
+    def __init__(self, ratio: float, reserve: int):
+        self.ratio = ratio
+        self.reserve = reserve
+        self.tokens = float(reserve)
+
+    def deposit(self):
+        self.tokens = min(self.tokens + self.ratio, self.reserve)
+
+    def withdraw(self) -> bool:
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+
+_client: Optional[httpx.AsyncClient] = None
+_semaphore: Optional[asyncio.Semaphore] = None
+_breaker = CircuitBreaker(UPSTREAM_CIRCUIT_FAILURES, UPSTREAM_CIRCUIT_RESET)
+_budget = RetryBudget(UPSTREAM_RETRY_BUDGET, UPSTREAM_RETRY_RESERVE)
+_governor = rate_limit.RateLimiter(
+    "upstream-qps", UPSTREAM_MAX_QPS, UPSTREAM_QPS_BURST, UPSTREAM_QPS_MAX_WAIT
+)
+
+
+def create_client(
+    transport: Optional[httpx.AsyncBaseTransport] = None,
+) -> httpx.AsyncClient:
+    """
+    This function is used to build a pooled client for the external API
+
+    :param transport: optional transport, used by tests to plug a fake upstream
+
+    :return: async http client
+    """
+
+    return httpx.AsyncClient(
+        timeout=httpx.Timeout(
+            UPSTREAM_READ_TIMEOUT,
+            connect=UPSTREAM_CONNECT_TIMEOUT,
+            read=UPSTREAM_READ_TIMEOUT,
+        ),
+        limits=httpx.Limits(
+            max_connections=UPSTREAM_MAX_CONNECTIONS,
+            max_keepalive_connections=UPSTREAM_MAX_KEEPALIVE_CONNECTIONS,
+        ),
+        transport=transport,
+        follow_redirects=True,
+    )
+
+
+async def startup(client: Optional[httpx.AsyncClient] = None):
+    """
+    This function is used to open the shared client on app startup
+
+    :param client: optional client to use instead of the default one
+    """
+
+    global _client, _semaphore, _breaker, _budget
+    if _client is not None:
+        await _client.aclose()
+    _client = client or create_client()
+    _semaphore = asyncio.Semaphore(UPSTREAM_MAX_CONCURRENCY)
+    _breaker = CircuitBreaker(UPSTREAM_CIRCUIT_FAILURES, UPSTREAM_CIRCUIT_RESET)
+    _budget = RetryBudget(UPSTREAM_RETRY_BUDGET, UPSTREAM_RETRY_RESERVE)
+
+
+async def shutdown():
+    """
+    This function is used to close the shared client on app shutdown
+    """
+
+    global _client, _semaphore
+    if _client is not None:
+        await _client.aclose()
+    _client = None
+    _semaphore = None
+
+
+def is_healthy() -> bool:
+    """
+    This function is used to check if Gutendex calls currently go through,
+    so optional background calls can hold off while it is failing
+
+    :return: whether the circuit is closed
+    """
+
+    return _breaker.state == CircuitBreaker.CLOSED
+
+
+def error_detail(response: httpx.Response):
+    """
+    This function is used to read the error of an upstream response, which
+    may be an HTML or plain text page rather than JSON
+
+    :param response: upstream response
+
+    :return: JSON error body, or the start of the text body
+    """
+
+    try:
+        return response.json()
+    except ValueError:
+        return response.text[:200] or response.reason_phrase
+
+
+async def _send(url: str, params: Optional[dict]) -> httpx.Response:
+    async with _semaphore:
+        started = time.perf_counter()
+        try:
+            response = await _client.get(url, params=params)
+        except httpx.HTTPError:
+            metrics.UPSTREAM_REQUESTS.inc("error")
+            raise
+        finally:
+            metrics.UPSTREAM_DURATION.observe(time.perf_counter() - started)
+        metrics.UPSTREAM_REQUESTS.inc(str(response.status_code))
+        return response
+
+
+async def _get_with_retries(url: str, params: Optional[dict]) -> httpx.Response:
+    _budget.deposit()
+    attempt = 0
+    while True:
+        await _governor.acquire("gutendex", "Too many Gutendex requests, retry later")
+        if not _breaker.allow():
+            metrics.UPSTREAM_REQUESTS.inc("circuit_open")
+            raise UpstreamUnavailable(
+                "Gutendex is unavailable", retry_after=_breaker.retry_after()
+            )
+        try:
+            response = await _send(url, params)
+        except httpx.TransportError as exc:
+            error = f"Gutendex request failed: {exc!r}"
+        except asyncio.CancelledError:
+            _breaker.release()
+            raise
+        else:
+            if response.status_code < status.HTTP_500_INTERNAL_SERVER_ERROR:
+                _breaker.record_success()
+                return response
+            error = (
+                f"Gutendex returned {response.status_code}: "
+                f"{error_detail(response)}"
+            )
+
+        _breaker.record_failure()
+        if attempt >= UPSTREAM_RETRIES or not _budget.withdraw():
+            raise UpstreamUnavailable(error)
+        backoff = min(UPSTREAM_RETRY_BACKOFF * 2**attempt, UPSTREAM_RETRY_BACKOFF_MAX)
+        await asyncio.sleep(random.uniform(0, backoff))
+        attempt += 1
+
+
+async def get(url: str, params: Optional[dict] = None) -> httpx.Response:
+    """
+    This function is used to send a GET request to the external API
+
+    :param url: request url
+    :param params: query parameters, None values are dropped
+
+    :return: upstream response, with a status code below 500
+    """
+
+    if _client is None:
+        await startup()
+    if params:
+        params = {key: value for key, value in params.items() if value is not None}
+    try:
+        return await asyncio.wait_for(
+            _get_with_retries(url, params), timeout=UPSTREAM_CALL_TIMEOUT
+        )
+    except asyncio.TimeoutError:
+        _breaker.record_failure()
+        raise UpstreamUnavailable(
+            f"Gutendex did not answer within {UPSTREAM_CALL_TIMEOUT}s"
+        ) from None
@@ -9,7 +9,7 @@ from src.constants import BOOK_SEARCH_ENDPOINT
 
 
 def test_get_book_monthly_rating(client):
-    month = datetime.now().strftime("%B")
+    month = datetime.utcnow().strftime("%B")
     book_id = 22400
     data = {"review": "Awesome book", "rating": 5}
     client.post(f"/{BOOK_SEARCH_ENDPOINT}/{book_id}/review", json.dumps(data))
@@ -17,4 +17,8 @@ def test_get_book_monthly_rating(client):
     client.post(f"/{BOOK_SEARCH_ENDPOINT}/{book_id}/review", json.dumps(data))
     request = client.get(f"/{BOOK_SEARCH_ENDPOINT}/{book_id}/monthly-rating")
     assert request.status_code == 200
-    assert request.json()["ratings"][0] == {"month": month, "rating": 4.5}
+    assert request.json()["ratings"][0] == {
+        "year": datetime.utcnow().year,
+        "month": month,
+        "rating": 4.5,
+    }
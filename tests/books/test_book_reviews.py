@@ -0,0 +1,67 @@
+"""
+Tests for the /books/{book_id}/reviews endpoint
+"""
+
+import json
+
+from src.constants import BOOK_SEARCH_ENDPOINT
+
+
+def _add_reviews(client, book_id, count):
+    for number in range(count):
+        data = {"review": f"Review {number}", "rating": number % 6}
+        client.post(f"/{BOOK_SEARCH_ENDPOINT}/{book_id}/review", json.dumps(data))
+
+
+def test_get_book_reviews_pages(client):
+    book_id = 22400
+    _add_reviews(client, book_id, 5)
+    pages = []
+    cursor = ""
+    while cursor is not None:
+        request = client.get(
+            f"/{BOOK_SEARCH_ENDPOINT}/{book_id}/reviews?limit=2"
+            + (f"&cursor={cursor}" if cursor else "")
+        )
+        assert request.status_code == 200
+        pages.append([review["review"] for review in request.json()["reviews"]])
+        cursor = request.json()["next_cursor"]
+    assert pages == [
+        ["Review 4", "Review 3"],
+        ["Review 2", "Review 1"],
+        ["Review 0"],
+    ]
+
+
+def test_get_book_reviews_empty(client):
+    request = client.get(f"/{BOOK_SEARCH_ENDPOINT}/22400/reviews")
+    assert request.status_code == 200
+    assert request.json() == {"book_id": 22400, "reviews": [], "next_cursor": None}
+
+
+def test_get_book_reviews_invalid_cursor(client):
+    client.post(
+        f"/{BOOK_SEARCH_ENDPOINT}/22401/review",
+        json={"review": "Awesome book", "rating": 5},
+    )
+    for cursor in (1, 999):
+        request = client.get(f"/{BOOK_SEARCH_ENDPOINT}/22400/reviews?cursor={cursor}")
+        assert request.status_code == 400
+
+
+def test_get_book_reviews_limit_too_large(client):
+    request = client.get(f"/{BOOK_SEARCH_ENDPOINT}/22400/reviews?limit=1000")
+    assert request.status_code == 422
+
+
+def test_retrieve_book_embeds_review_preview(client):
+    book_id = 22400
+    _add_reviews(client, book_id, 7)
+    request = client.get(f"/{BOOK_SEARCH_ENDPOINT}/{book_id}")
+    assert request.json()["review_count"] == 7
+    assert request.json()["reviews"] == [
+        f"Review {number}" for number in (6, 5, 4, 3, 2)
+    ]
+    request = client.get(f"/{BOOK_SEARCH_ENDPOINT}/top-rated")
+    assert request.json()["books"][0]["review_count"] == 7
+    assert len(request.json()["books"][0]["reviews"]) == 5
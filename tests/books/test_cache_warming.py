@@ -0,0 +1,107 @@
+"""
+Tests for the background cache warming
+"""
+
+import asyncio
+import random
+from datetime import datetime, timedelta
+from functools import partial
+
+from sqlalchemy import update
+
+import books.warming as warming
+import models
+from src.constants import BOOK_METADATA_TTL, BOOK_SEARCH_ENDPOINT
+
+
+def upstream_calls(app):
+    return len(app.state.gutendex.state.calls)
+
+
+def age_books(db_session, seconds):
+    updated_at = datetime.utcnow() - timedelta(seconds=seconds)
+
+    async def run():
+        await db_session.execute(update(models.Book).values(updated_at=updated_at))
+        await db_session.commit()
+
+    asyncio.run(run())
+
+
+def test_space_saving_keeps_heavy_hitters():
+    sketch = warming.SpaceSaving(capacity=10)
+    for number in range(500):
+        sketch.add(f"rare {number}")
+        if number % 5 == 0:
+            sketch.add("hot")
+    assert len(sketch) == 10
+    assert sketch.top(1) == ["hot"]
+
+    sketch.decay()
+    assert sketch.top(10, min_count=2) == ["hot"]
+
+
+def test_space_saving_counts_every_request():
+    rng = random.Random(0)
+    sketch = warming.SpaceSaving(capacity=50)
+    for number in range(5000):
+        sketch.add(int(rng.paretovariate(1)) if number % 3 else rng.randrange(10**6))
+        if number == 2500:
+            sketch.decay()
+            added = sum(sketch.counts.values())
+    assert len(sketch) == 50
+    assert sum(sketch.counts.values()) == added + 2499
+    assert sketch.top(1) == [1]
+
+
+def test_hot_books_are_refreshed_before_expiry(app, client, db_session):
+    def request_book():
+        for _ in range(2):
+            assert client.get(f"/{BOOK_SEARCH_ENDPOINT}/22400").status_code == 200
+
+    request_book()
+    calls = upstream_calls(app)
+    assert client.portal.call(warming.warm) == 0
+
+    age_books(db_session, BOOK_METADATA_TTL - 10)
+    request_book()
+    assert client.portal.call(partial(warming.warm, budget=0)) == 0
+    assert upstream_calls(app) == calls
+
+    request_book()
+    assert client.portal.call(warming.warm) == 1
+    assert upstream_calls(app) == calls + 1
+
+    request_book()
+    assert client.portal.call(warming.warm) == 0
+    assert upstream_calls(app) == calls + 1
+
+
+def test_hot_searches_are_refreshed_before_expiry(app, client):
+    for _ in range(2):
+        response = client.get(f"/{BOOK_SEARCH_ENDPOINT}", params={"search": "oz"})
+        assert response.status_code == 200
+    calls = upstream_calls(app)
+
+    assert client.portal.call(warming.warm) == 0
+    warming.search_hits.add(("oz", None))
+    warming.search_hits.add(("oz", None))
+    assert client.portal.call(partial(warming.warm, ahead=120)) == 1
+    assert upstream_calls(app) == calls + 1
+
+
+def test_top_rated_books_are_prewarmed(app, client, db_session):
+    for book_id in (22400, 22401):
+        response = client.post(
+            f"/{BOOK_SEARCH_ENDPOINT}/{book_id}/review",
+            json={"review": "Awesome book", "rating": 5},
+        )
+        assert response.status_code == 201
+    age_books(db_session, BOOK_METADATA_TTL + 10)
+    calls = upstream_calls(app)
+
+    assert client.portal.call(warming.prewarm_top_rated) == 2
+    assert upstream_calls(app) == calls + 1
+    response = client.get(f"/{BOOK_SEARCH_ENDPOINT}/top-rated")
+    assert [book["id"] for book in response.json()["books"]] == [22400, 22401]
+    assert upstream_calls(app) == calls + 1
@@ -0,0 +1,92 @@
+"""
+Tests for the ETag, Last-Modified and 304 responses
+"""
+
+import books.repository as repository
+from src.constants import BOOK_SEARCH_ENDPOINT
+
+
+def add_review(client, book_id, rating=4):
+    client.post(
+        f"/{BOOK_SEARCH_ENDPOINT}/{book_id}/review",
+        json={"review": "Great book", "rating": rating},
+    )
+
+
+def fail(*args, **kwargs):
+    raise AssertionError("the response should not be rendered")
+
+
+def test_book_details_not_modified(client, monkeypatch):
+    url = f"/{BOOK_SEARCH_ENDPOINT}/22400"
+    add_review(client, 22400)
+    first = client.get(url)
+    assert first.status_code == 200
+    assert first.headers["cache-control"] == "public, max-age=0, s-maxage=10"
+    etag = first.headers["etag"]
+    assert etag.startswith('W/"')
+
+    with monkeypatch.context() as patch:
+        patch.setattr(repository, "get_book_with_review", fail)
+        patch.setattr(repository, "get_book_validators", fail)
+        not_modified = client.get(url, headers={"If-None-Match": etag})
+        assert not_modified.status_code == 304
+        assert not_modified.content == b""
+        assert not_modified.headers["etag"] == etag
+        by_date = client.get(
+            url, headers={"If-Modified-Since": first.headers["last-modified"]}
+        )
+        assert by_date.status_code == 304
+        cached = client.get(url)
+        assert cached.status_code == 200
+        assert cached.headers["last-modified"] == first.headers["last-modified"]
+
+    add_review(client, 22400, rating=2)
+    changed = client.get(url, headers={"If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.headers["etag"] != etag
+    assert changed.json()["review_count"] == 2
+
+
+def test_unknown_book_is_fetched_first(client):
+    url = f"/{BOOK_SEARCH_ENDPOINT}/22401"
+    first = client.get(url, headers={"If-None-Match": "*"})
+    assert first.status_code == 200
+    second = client.get(url, headers={"If-None-Match": first.headers["etag"]})
+    assert second.status_code == 304
+
+
+def test_monthly_rating_not_modified(client, monkeypatch):
+    url = f"/{BOOK_SEARCH_ENDPOINT}/22400/monthly-rating"
+    empty = client.get(url)
+    assert empty.status_code == 200
+    assert "last-modified" not in empty.headers
+
+    add_review(client, 22400)
+    first = client.get(url, headers={"If-None-Match": empty.headers["etag"]})
+    assert first.status_code == 200
+    assert first.headers["etag"] != empty.headers["etag"]
+
+    with monkeypatch.context() as patch:
+        patch.setattr(repository, "get_monthly_rating", fail)
+        headers = {"If-None-Match": f'"other", {first.headers["etag"]}'}
+        assert client.get(url, headers=headers).status_code == 304
+    old_date = {"If-Modified-Since": "Mon, 01 Jan 2001 00:00:00 GMT"}
+    assert client.get(url, headers=old_date).status_code == 200
+
+
+def test_top_rated_not_modified(client):
+    url = f"/{BOOK_SEARCH_ENDPOINT}/top-rated?limit=5"
+    add_review(client, 22400)
+    first = client.get(url)
+    etag = first.headers["etag"]
+    assert client.get(url, headers={"If-None-Match": etag}).status_code == 304
+    other_page = client.get(
+        f"/{BOOK_SEARCH_ENDPOINT}/top-rated?limit=6", headers={"If-None-Match": etag}
+    )
+    assert other_page.status_code == 200
+
+    add_review(client, 43737, rating=5)
+    changed = client.get(url, headers={"If-None-Match": etag})
+    assert changed.status_code == 200
+    assert [book["id"] for book in changed.json()["books"]] == [43737, 22400]
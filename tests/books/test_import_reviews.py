@@ -0,0 +1,83 @@
+"""
+Tests for the /books/reviews/bulk endpoint
+"""
+
+import asyncio
+import json
+
+import httpx
+
+import books.ingest as ingest
+import models
+import upstream
+from src.constants import BOOK_SEARCH_ENDPOINT
+
+
+def test_import_reviews_jsonl(client, db_session):
+    rows = [
+        {"book_id": 22400, "review": "Awesome book", "rating": 5},
+        {"book_id": 22400, "review": "Good book", "rating": 4},
+        {"book_id": 22401, "review": "Nice", "rating": 3, "date": "2021-03-01T10:00Z"},
+        {"book_id": 2240000000, "review": "Unknown", "rating": 3},
+        {"book_id": 22401, "review": "Bad rating", "rating": 9},
+    ]
+    body = "\n".join(json.dumps(row) for row in rows) + "\nnot json\n"
+    request = client.post(
+        f"/{BOOK_SEARCH_ENDPOINT}/reviews/bulk",
+        data=body,
+        headers={"content-type": "application/x-ndjson"},
+    )
+    assert request.status_code == 200
+    report = request.json()
+    assert report["rows_read"] == 6
+    assert report["rows_inserted"] == 3
+    assert report["rows_rejected"] == 3
+    assert [rejection["line"] for rejection in report["rejections"]] == [5, 6, 4]
+    assert report["rejections"][2]["reason"] == "book_id: book 2240000000 not found"
+
+    stats = asyncio.run(db_session.get(models.BookRatingStats, 22400))
+    assert (stats.review_count, stats.rating_sum, stats.rating_avg) == (2, 9, 4.5)
+    request = client.get(f"/{BOOK_SEARCH_ENDPOINT}/22401")
+    assert request.json()["rating"] == 3
+    assert request.json()["reviews"] == ["Nice"]
+
+
+def test_import_reviews_csv_updates_existing_stats(client, db_session):
+    data = {"review": "Awesome book", "rating": 5}
+    client.post(f"/{BOOK_SEARCH_ENDPOINT}/22400/review", json.dumps(data))
+    body = 'book_id,rating,review\n22400,1,"Boring, long"\n22400,3,Fine\n'
+    request = client.post(
+        f"/{BOOK_SEARCH_ENDPOINT}/reviews/bulk",
+        data=body,
+        headers={"content-type": "text/csv"},
+    )
+    assert request.json()["rows_inserted"] == 2
+    stats = asyncio.run(db_session.get(models.BookRatingStats, 22400))
+    assert (stats.review_count, stats.rating_sum, stats.rating_avg) == (3, 9, 3.0)
+
+
+def test_import_reviews_in_batches_checks_each_book_once(app, db_session):
+    rows = [
+        {"book_id": 60000 + number % 40 + 1, "review": "Spooky", "rating": 4}
+        for number in range(250)
+    ]
+
+    async def lines():
+        for row in rows:
+            yield json.dumps(row)
+
+    async def run():
+        transport = httpx.ASGITransport(app=app.state.gutendex)
+        await upstream.startup(upstream.create_client(transport=transport))
+        try:
+            report = await ingest.ingest_reviews(
+                lines(), "jsonl", db_session, batch_size=100
+            )
+        finally:
+            await upstream.shutdown()
+        return report, await db_session.get(models.BookRatingStats, 60001)
+
+    report, stats = asyncio.run(run())
+    assert report.rows_inserted == 250
+    assert stats.review_count == 7
+    assert len(app.state.gutendex.state.calls) == 2
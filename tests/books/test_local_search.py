@@ -0,0 +1,130 @@
+"""
+Tests for the local book search index and the catalog import
+"""
+
+import asyncio
+import io
+import json
+
+import pytest
+from fastapi_cache import FastAPICache
+
+import books.catalog as catalog
+import books.repository as repository
+import books.search as search_index
+from src.constants import BOOK_SEARCH_ENDPOINT
+from tests import fake_gutendex
+
+
+@pytest.fixture
+def local_search(monkeypatch):
+    monkeypatch.setattr(search_index, "_catalog_imported", False)
+    monkeypatch.setattr(search_index, "LOCAL_SEARCH_CHECK_INTERVAL", 0)
+
+
+def _import_catalog(db_session, tmp_path):
+    path = tmp_path / "catalog.json"
+    path.write_text(json.dumps(list(fake_gutendex.BOOKS.values())))
+    return asyncio.run(
+        catalog.import_catalog(catalog.read_catalog(str(path)), str(path), db_session)
+    )
+
+
+def _clear_response_cache():
+    asyncio.run(FastAPICache.get_backend().clear(namespace=FastAPICache.get_prefix()))
+
+
+def test_imported_catalog_answers_searches_like_upstream(
+    app, client, db_session, tmp_path, local_search
+):
+    urls = [
+        f"/{BOOK_SEARCH_ENDPOINT}?search=ghosts",
+        f"/{BOOK_SEARCH_ENDPOINT}?search=ghosts&page=2",
+        f"/{BOOK_SEARCH_ENDPOINT}?search=tolkien",
+    ]
+    upstream_responses = [client.get(url).json() for url in urls]
+    upstream_calls = len(app.state.gutendex.state.calls)
+
+    assert _import_catalog(db_session, tmp_path) == len(fake_gutendex.BOOKS)
+    _clear_response_cache()
+    local_responses = [client.get(url).json() for url in urls]
+
+    assert local_responses == upstream_responses
+    assert len(app.state.gutendex.state.calls) == upstream_calls
+    invalid_page = client.get(f"/{BOOK_SEARCH_ENDPOINT}?search=ghosts&page=3")
+    assert invalid_page.status_code == 404
+
+
+def test_searches_without_local_hits_go_upstream(
+    app, client, db_session, tmp_path, local_search
+):
+    _import_catalog(db_session, tmp_path)
+    request = client.get(f"/{BOOK_SEARCH_ENDPOINT}?search=wizard marvelous")
+    assert request.status_code == 200
+    assert request.json()["books"] == []
+    assert app.state.gutendex.state.calls == [("list", "wizard marvelous", None, 1)]
+
+
+def test_pg_catalog_import_keeps_stored_books(app, client, db_session, tmp_path):
+    assert client.get(f"/{BOOK_SEARCH_ENDPOINT}/22400").status_code == 200
+    path = tmp_path / "pg_catalog.csv"
+    path.write_text(
+        "Text#,Type,Issued,Title,Language,Authors,Subjects,LoCC,Bookshelves\n"
+        "22400,Text,2007-08-20,The Wonderful Wizard of Oz,en,"
+        '"Baum, L. Frank",,,\n'
+        "22401,Text,2007-08-20,The Marvelous Land of Oz,en,"
+        '"Baum, L. Frank",,,\n'
+    )
+    book_count = asyncio.run(
+        catalog.import_catalog(
+            catalog.read_catalog(str(path)), str(path), db_session, stale=True
+        )
+    )
+    assert book_count == 1
+
+    stored = asyncio.run(repository.get_stored_books([22400, 22401]))
+    assert stored[22400].download_count == 900
+    assert stored[22401].updated_at == catalog.STALE_UPDATED_AT
+
+    calls = len(app.state.gutendex.state.calls)
+    response = client.get(f"/{BOOK_SEARCH_ENDPOINT}/22401")
+    assert response.json()["download_count"] == 800
+    assert len(app.state.gutendex.state.calls) == calls + 1
+
+
+def test_read_pg_catalog():
+    lines = io.StringIO(
+        "Text#,Type,Issued,Title,Language,Authors,Subjects,LoCC,Bookshelves\n"
+        '55,Text,2008-06-25,"The Wonderful Wizard of Oz",en,'
+        '"Baum, L. Frank (Lyman Frank), 1856-1919; '
+        'Denslow, W. W., 1856-1915 [Illustrator]",,,\n'
+        "56,Sound,2008-06-25,Audio,en,Anonymous,,,\n"
+    )
+    assert list(catalog.read_pg_catalog(lines)) == [
+        {
+            "id": 55,
+            "title": "The Wonderful Wizard of Oz",
+            "authors": [
+                {
+                    "name": "Baum, L. Frank (Lyman Frank)",
+                    "birth_year": 1856,
+                    "death_year": 1919,
+                },
+                {"name": "Denslow, W. W.", "birth_year": 1856, "death_year": 1915},
+            ],
+            "languages": ["en"],
+            "download_count": 0,
+        },
+        {
+            "id": 56,
+            "title": "Audio",
+            "authors": [{"name": "Anonymous", "birth_year": None, "death_year": None}],
+            "languages": ["en"],
+            "download_count": 0,
+        },
+    ]
+
+
+def test_match_query():
+    assert search_index.match_query(' Oz  "wizard ') == '"Oz"* """wizard"*'
+    assert search_index.match_query("  ") is None
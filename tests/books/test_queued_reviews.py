@@ -0,0 +1,114 @@
+"""
+Tests for the queued review writes
+"""
+
+import asyncio
+
+import pytest
+from sqlalchemy.exc import IntegrityError, OperationalError
+
+import books.repository as repository
+import books.review_queue as review_queue
+import books.router as router
+import metrics
+from src.constants import BOOK_SEARCH_ENDPOINT
+
+
+@pytest.fixture
+def queued(monkeypatch):
+    monkeypatch.setattr(router, "REVIEW_WRITE_MODE", "queued")
+
+
+def test_queued_reviews_are_written_in_batches(client, queued):
+    first = client.get(f"/{BOOK_SEARCH_ENDPOINT}/22400").json()
+    assert first["review_count"] == 0
+
+    responses = [
+        client.post(
+            f"/{BOOK_SEARCH_ENDPOINT}/22400/review",
+            json={"review": f"Review {rating}", "rating": rating},
+        )
+        for rating in (5, 4, 3)
+    ]
+    assert [response.status_code for response in responses] == [202, 202, 202]
+    uuids = [response.json()["uuid"] for response in responses]
+    assert len(set(uuids)) == 3
+    assert responses[0].json()["book_id"] == 22400
+
+    client.portal.call(repository.review_writer.stop)
+    book = client.get(f"/{BOOK_SEARCH_ENDPOINT}/22400").json()
+    assert (book["review_count"], book["rating"]) == (3, 4.0)
+    reviews = client.get(f"/{BOOK_SEARCH_ENDPOINT}/22400/reviews").json()["reviews"]
+    assert {review["uuid"] for review in reviews} == set(uuids)
+
+
+def test_queued_review_of_unknown_book(client, queued):
+    response = client.post(
+        f"/{BOOK_SEARCH_ENDPOINT}/2240000000/review",
+        json={"review": "Awesome book", "rating": 5},
+    )
+    assert response.status_code == 404
+
+
+class StalledWriter(review_queue.ReviewWriter):
+    async def write(self, batch):
+        await asyncio.Event().wait()
+
+
+def test_full_queue_rejects_reviews():
+    async def run():
+        writer = StalledWriter(batch_size=1, max_size=1, max_wait=0.01)
+        await writer.start()
+        await writer.submit({"book_id": 1})
+        await asyncio.sleep(0)
+        await writer.submit({"book_id": 2})
+        try:
+            with pytest.raises(review_queue.ReviewQueueFull) as error:
+                await writer.submit({"book_id": 3})
+        finally:
+            writer._task.cancel()
+        return error.value
+
+    error = asyncio.run(run())
+    assert error.status_code == 503
+    assert error.headers == {"Retry-After": "1"}
+
+
+class FlakyWriter(review_queue.ReviewWriter):
+    def __init__(self, locked_attempts, **kwargs):
+        super().__init__(retry_backoff=0.001, **kwargs)
+        self.locked_attempts = locked_attempts
+        self.written = []
+
+    async def insert(self, batch):
+        if self.locked_attempts:
+            self.locked_attempts -= 1
+            raise OperationalError("INSERT", {}, Exception("database is locked"))
+        if any(review["book_id"] == 0 for review in batch):
+            raise IntegrityError("INSERT", {}, Exception("bad review"))
+        self.written.extend(batch)
+
+
+def test_locked_database_is_retried():
+    writer = FlakyWriter(locked_attempts=2)
+    lost = metrics.REVIEW_WRITES.values.get(("lost",), 0)
+    asyncio.run(writer.write([{"book_id": book_id} for book_id in (1, 2, 3)]))
+    assert [review["book_id"] for review in writer.written] == [1, 2, 3]
+    assert metrics.REVIEW_WRITES.values.get(("lost",), 0) == lost
+
+
+def test_bad_review_does_not_lose_its_batch():
+    writer = FlakyWriter(locked_attempts=0)
+    lost = metrics.REVIEW_WRITES.values.get(("lost",), 0)
+    asyncio.run(writer.write([{"book_id": book_id} for book_id in (1, 2, 0, 4, 5)]))
+    assert [review["book_id"] for review in writer.written] == [1, 2, 4, 5]
+    assert metrics.REVIEW_WRITES.values.get(("lost",), 0) == lost + 1
+
+
+def test_reviews_are_lost_once_retries_are_exhausted():
+    writer = FlakyWriter(locked_attempts=10, retries=2)
+    lost = metrics.REVIEW_WRITES.values.get(("lost",), 0)
+    asyncio.run(writer.write([{"book_id": book_id} for book_id in (1, 2)]))
+    assert writer.written == []
+    assert writer.locked_attempts == 7
+    assert metrics.REVIEW_WRITES.values.get(("lost",), 0) == lost + 2
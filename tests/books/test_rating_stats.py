@@ -0,0 +1,71 @@
+"""
+Tests for the book rating aggregates
+"""
+
+import asyncio
+import json
+from datetime import date, datetime
+
+from sqlalchemy.dialects import postgresql
+
+import books.aggregates as aggregates
+import models
+from src.constants import BOOK_SEARCH_ENDPOINT
+
+
+def test_add_review_updates_rating_stats(client, db_session):
+    book_id = 22400
+    for rating in (5, 4, 2):
+        data = {"review": "Awesome book", "rating": rating}
+        client.post(f"/{BOOK_SEARCH_ENDPOINT}/{book_id}/review", json.dumps(data))
+    stats = asyncio.run(db_session.get(models.BookRatingStats, book_id))
+    assert stats.review_count == 3
+    assert stats.rating_sum == 11
+    assert stats.rating_avg == 11 / 3
+    assert stats.last_review_at is not None
+
+
+def test_rebuild_rating_stats(db_session):
+    async def rebuild():
+        for book_id, rating in ((22400, 5), (22400, 4), (22401, 3)):
+            db_session.add(
+                models.BookReview(book_id=book_id, review="Nice", rating=rating)
+            )
+        await db_session.commit()
+        book_count = await aggregates.rebuild_rating_stats(db_session)
+        return book_count, await db_session.get(models.BookRatingStats, 22400)
+
+    book_count, stats = asyncio.run(rebuild())
+    assert book_count == 2
+    assert (stats.review_count, stats.rating_sum, stats.rating_avg) == (2, 9, 4.5)
+
+
+def test_rebuild_rating_rollups(db_session):
+    async def rebuild():
+        for rating, day in ((5, 1), (4, 1), (3, 2)):
+            db_session.add(
+                models.BookReview(
+                    book_id=22400,
+                    review="Nice",
+                    rating=rating,
+                    date=datetime(2023, 5, day, 12),
+                )
+            )
+        await db_session.commit()
+        rollup_count = await aggregates.rebuild_rating_rollups(db_session)
+        return rollup_count, await db_session.get(
+            models.BookRatingRollup, (22400, date(2023, 5, 1))
+        )
+
+    rollup_count, rollup = asyncio.run(rebuild())
+    assert rollup_count == 2
+    assert (rollup.review_count, rollup.rating_sum) == (2, 9)
+
+
+def test_rating_upserts_do_not_conflict_on_postgres():
+    rollups = models.BookRatingRollup.__table__
+    statement = aggregates.upsert(rollups, "postgresql").on_conflict_do_update(
+        index_elements=["book_id", "day"], set_={"rating_sum": 0}
+    )
+    sql = str(statement.compile(dialect=postgresql.dialect()))
+    assert "ON CONFLICT (book_id, day) DO UPDATE" in sql
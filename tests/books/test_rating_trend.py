@@ -0,0 +1,82 @@
+"""
+Tests for the year-aware monthly rating and the /books/{book_id}/rating-trend
+endpoint
+"""
+
+import json
+
+from src.constants import BOOK_SEARCH_ENDPOINT
+
+
+def _import_reviews(client, rows):
+    request = client.post(
+        f"/{BOOK_SEARCH_ENDPOINT}/reviews/bulk",
+        data="\n".join(json.dumps(row) for row in rows),
+        headers={"content-type": "application/x-ndjson"},
+    )
+    assert request.json()["rows_inserted"] == len(rows)
+
+
+def _review(rating, date):
+    return {"book_id": 22400, "review": "Nice", "rating": rating, "date": date}
+
+
+def test_monthly_rating_separates_years(client):
+    _import_reviews(
+        client,
+        [
+            _review(5, "2023-01-05T10:00Z"),
+            _review(3, "2023-01-20T10:00Z"),
+            _review(1, "2024-01-05T10:00Z"),
+        ],
+    )
+    _import_reviews(client, [_review(2, "2023-01-05T18:00Z")])
+    request = client.get(f"/{BOOK_SEARCH_ENDPOINT}/22400/monthly-rating")
+    assert request.status_code == 200
+    assert request.json()["ratings"] == [
+        {"year": 2023, "month": "January", "rating": 10 / 3},
+        {"year": 2024, "month": "January", "rating": 1.0},
+    ]
+
+
+def test_rating_trend(client):
+    _import_reviews(
+        client,
+        [
+            _review(5, "2023-01-02T10:00Z"),
+            _review(3, "2023-01-08T10:00Z"),
+            _review(4, "2023-01-09T10:00Z"),
+            _review(1, "2023-02-01T10:00Z"),
+            _review(2, "2024-06-01T10:00Z"),
+        ],
+    )
+    url = f"/{BOOK_SEARCH_ENDPOINT}/22400/rating-trend"
+
+    request = client.get(f"{url}?from=2023-01-01&to=2023-01-31&granularity=week")
+    assert request.status_code == 200
+    assert request.json() == {
+        "book_id": 22400,
+        "granularity": "week",
+        "points": [
+            {"start": "2023-01-02", "review_count": 2, "rating": 4.0},
+            {"start": "2023-01-09", "review_count": 1, "rating": 4.0},
+        ],
+    }
+
+    request = client.get(f"{url}?granularity=year")
+    assert [
+        (point["start"], point["review_count"]) for point in request.json()["points"]
+    ] == [("2023-01-01", 4), ("2024-01-01", 1)]
+
+    request = client.get(f"{url}?from=2023-02-01")
+    assert [point["start"] for point in request.json()["points"]] == [
+        "2023-02-01",
+        "2024-06-01",
+    ]
+
+
+def test_rating_trend_rejects_inverted_range(client):
+    request = client.get(
+        f"/{BOOK_SEARCH_ENDPOINT}/22400/rating-trend?from=2024-01-01&to=2023-01-01"
+    )
+    assert request.status_code == 400
@@ -4,6 +4,9 @@ Tests for the /books/{book_id}/ endpoint
 
 import json
 
+import httpx
+
+import upstream
 from src.constants import BOOK_SEARCH_ENDPOINT
 
 
@@ -27,3 +30,59 @@ def test_get_book_avg_rating(client):
     request = client.get(f"/{BOOK_SEARCH_ENDPOINT}/{book_id}")
     assert request.status_code == 200
     assert request.json()["rating"] == 4.5
+
+
+def test_retrieve_book_reads_local_metadata_store(app, client):
+    book_id = 22400
+    data = {"review": "Awesome book", "rating": 5}
+    client.post(f"/{BOOK_SEARCH_ENDPOINT}/{book_id}/review", json.dumps(data))
+    client.get(f"/{BOOK_SEARCH_ENDPOINT}/{book_id}")
+    client.get(f"/{BOOK_SEARCH_ENDPOINT}/top-rated")
+    assert app.state.gutendex.state.calls == [("list", None, str(book_id), 1)]
+
+
+def test_retrieve_book_refreshes_stale_metadata(app, client, monkeypatch):
+    monkeypatch.setattr("books.repository.BOOK_METADATA_TTL", -1)
+    book_id = 22400
+    data = {"review": "Awesome book", "rating": 5}
+    client.post(f"/{BOOK_SEARCH_ENDPOINT}/{book_id}/review", json.dumps(data))
+    request = client.post(f"/{BOOK_SEARCH_ENDPOINT}/{book_id}/review", json.dumps(data))
+    assert request.status_code == 201
+    assert app.state.gutendex.state.calls == [("list", None, str(book_id), 1)] * 2
+
+
+def test_stored_metadata_is_served_while_upstream_is_down(client, monkeypatch):
+    monkeypatch.setattr("books.repository.BOOK_METADATA_TTL", -1)
+    monkeypatch.setattr(upstream, "UPSTREAM_RETRY_BACKOFF", 0)
+    book_id = 22400
+    data = {"review": "Awesome book", "rating": 5}
+    client.post(f"/{BOOK_SEARCH_ENDPOINT}/{book_id}/review", json.dumps(data))
+
+    def handler(request):
+        return httpx.Response(502, text="<html>Bad Gateway</html>")
+
+    transport = httpx.MockTransport(handler)
+    client.portal.call(upstream.startup, upstream.create_client(transport=transport))
+    request = client.post(f"/{BOOK_SEARCH_ENDPOINT}/{book_id}/review", json.dumps(data))
+    assert request.status_code == 201
+    request = client.get(f"/{BOOK_SEARCH_ENDPOINT}/22401")
+    assert request.status_code == 503
+    assert request.json()["detail"].startswith("Gutendex")
+
+
+def test_retrieve_book_not_found(client):
+    request = client.get(f"/{BOOK_SEARCH_ENDPOINT}/2240000000")
+    assert request.status_code == 404
+    assert request.json()["detail"] == {"detail": "Not found."}
+
+
+def test_add_review_invalidates_cached_book(client):
+    book_id = 22400
+    data = {"review": "Awesome book", "rating": 5}
+    client.post(f"/{BOOK_SEARCH_ENDPOINT}/{book_id}/review", json.dumps(data))
+    assert client.get(f"/{BOOK_SEARCH_ENDPOINT}/{book_id}").json()["rating"] == 5
+    data = {"review": "Boring book", "rating": 1}
+    client.post(f"/{BOOK_SEARCH_ENDPOINT}/{book_id}/review", json.dumps(data))
+    request = client.get(f"/{BOOK_SEARCH_ENDPOINT}/{book_id}")
+    assert request.json()["rating"] == 3
+    assert sorted(request.json()["reviews"]) == ["Awesome book", "Boring book"]
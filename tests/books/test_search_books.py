@@ -2,6 +2,12 @@
 Tests for the /books/ endpoint
 """
 
+import asyncio
+
+import httpx
+
+import books.repository as repository
+import upstream
 from src.constants import BOOK_SEARCH_ENDPOINT, PROJECT_URL
 
 
@@ -44,3 +50,40 @@ def test_search_books_pagination(client):
         request.json()["previous"]
         == f"{PROJECT_URL}/{BOOK_SEARCH_ENDPOINT}?search=ghosts"
     )
+
+
+async def _with_fake_upstream(app, coroutine_function):
+    transport = httpx.ASGITransport(app=app.state.gutendex)
+    await upstream.startup(upstream.create_client(transport=transport))
+    try:
+        return await coroutine_function()
+    finally:
+        await upstream.shutdown()
+
+
+def test_concurrent_searches_share_one_upstream_call(app):
+    async def search():
+        return await asyncio.gather(
+            *[repository.get_books_by_title("ghosts", None) for _ in range(5)]
+        )
+
+    results = asyncio.run(_with_fake_upstream(app, search))
+    assert all(result is results[0] for result in results)
+    assert app.state.gutendex.state.calls == [("list", "ghosts", None, 1)]
+
+
+def test_expired_search_is_served_while_revalidating(app, monkeypatch):
+    monkeypatch.setattr(repository, "STALE_WHILE_REVALIDATE", 60)
+    monkeypatch.setattr(repository, "SEARCH_BOOKS_CACHE_TTL", 0)
+
+    async def search():
+        first = await repository.get_books_by_title("ghosts", None)
+        stale = await repository.get_books_by_title("ghosts", None)
+        assert ("ghosts", None) in repository.search_flight
+        while ("ghosts", None) in repository.search_flight:
+            await asyncio.sleep(0.01)
+        return first, stale
+
+    first, stale = asyncio.run(_with_fake_upstream(app, search))
+    assert stale == first
+    assert app.state.gutendex.state.calls == [("list", "ghosts", None, 1)] * 2
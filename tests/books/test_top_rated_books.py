@@ -2,8 +2,14 @@
 Tests for the /books/{book_id}/top-rated endpoint
 """
 
+import asyncio
 import json
 
+import books.aggregates as aggregates
+import books.leaderboard as leaderboard
+import books.repository as repository
+import caching
+import models
 from src.constants import BOOK_SEARCH_ENDPOINT
 
 
@@ -42,3 +48,109 @@ def test_get_top_rated_books_limit_1(client):
     assert len(request.json()["books"]) == 1
     assert request.json()["books"][0]["id"] == 22400
     assert request.json()["books"][0]["rating"] == 4.5
+
+
+def test_get_top_rated_books_batches_upstream_calls(app, client, db_session):
+    book_ids = [60000 + number for number in range(1, 41)] + [2240000000]
+
+    async def add_reviews():
+        for book_id in book_ids:
+            db_session.add(
+                models.BookReview(book_id=book_id, review="Spooky", rating=book_id % 5)
+            )
+        await db_session.commit()
+        await aggregates.rebuild_rating_stats(db_session)
+
+    asyncio.run(add_reviews())
+    request = client.get(f"/{BOOK_SEARCH_ENDPOINT}/top-rated?limit=100")
+    assert request.status_code == 200
+    assert len(request.json()["books"]) == 40
+    assert [call[0] for call in app.state.gutendex.state.calls] == ["list", "list"]
+
+
+def test_add_review_invalidates_cached_top_rated_books(client):
+    data = {"review": "Awesome book", "rating": 4}
+    client.post(f"/{BOOK_SEARCH_ENDPOINT}/22400/review", json.dumps(data))
+    request = client.get(f"/{BOOK_SEARCH_ENDPOINT}/top-rated")
+    assert [book["id"] for book in request.json()["books"]] == [22400]
+    data = {"review": "Awesome book", "rating": 5}
+    client.post(f"/{BOOK_SEARCH_ENDPOINT}/22401/review", json.dumps(data))
+    request = client.get(f"/{BOOK_SEARCH_ENDPOINT}/top-rated")
+    assert [book["id"] for book in request.json()["books"]] == [22401, 22400]
+
+
+def _add_ratings(client, ratings_by_book):
+    for book_id, ratings in ratings_by_book.items():
+        for rating in ratings:
+            data = {"review": "Awesome book", "rating": rating}
+            client.post(f"/{BOOK_SEARCH_ENDPOINT}/{book_id}/review", json.dumps(data))
+
+
+def test_get_top_rated_books_pages(client):
+    _add_ratings(client, {22400: [5, 4], 22401: [4, 4], 43737: [2, 3, 1]})
+    request = client.get(f"/{BOOK_SEARCH_ENDPOINT}/top-rated?limit=2&offset=1")
+    assert request.status_code == 200
+    page = request.json()
+    assert page["total"] == 3
+    assert page["ranking"] == "average"
+    assert page["refreshed_at"]
+    assert [(book["rank"], book["id"]) for book in page["books"]] == [
+        (2, 22401),
+        (3, 43737),
+    ]
+
+
+def test_get_top_rated_books_filters(client):
+    _add_ratings(client, {22400: [5], 22401: [4, 4], 43737: [3, 3, 2]})
+    request = client.get(f"/{BOOK_SEARCH_ENDPOINT}/top-rated?min_reviews=2")
+    assert [book["id"] for book in request.json()["books"]] == [22401, 43737]
+    request = client.get(f"/{BOOK_SEARCH_ENDPOINT}/top-rated?language=enm")
+    assert [book["id"] for book in request.json()["books"]] == [43737]
+    assert request.json()["total"] == 1
+
+
+def test_get_top_rated_books_bayesian_ranking(client):
+    _add_ratings(
+        client, {22400: [5], 22401: [5, 5, 5, 5, 4, 5, 5, 5], 43737: [1] * 5}
+    )
+    request = client.get(f"/{BOOK_SEARCH_ENDPOINT}/top-rated")
+    assert [book["id"] for book in request.json()["books"]] == [22400, 22401, 43737]
+    request = client.get(f"/{BOOK_SEARCH_ENDPOINT}/top-rated?ranking=bayesian")
+    books = request.json()["books"]
+    assert [book["id"] for book in books] == [22401, 22400, 43737]
+    assert books[1]["rating"] == 5.0
+    assert books[1]["score"] < books[0]["score"] < books[0]["rating"]
+
+
+def test_unchanged_rebuilds_keep_cached_top_rated_books(client, db_session):
+    _add_ratings(client, {22400: [5], 22401: [4]})
+    client.portal.call(leaderboard.refresh)
+    generation = client.portal.call(caching.get_generation, "top-rated")
+    client.portal.call(leaderboard.refresh)
+    assert client.portal.call(caching.get_generation, "top-rated") == generation
+
+    # Reviews written by another process change the rankings
+    asyncio.run(aggregates.record_review_rating(22401, 5, db_session))
+    asyncio.run(db_session.commit())
+    client.portal.call(leaderboard.refresh)
+    assert client.portal.call(caching.get_generation, "top-rated") != generation
+
+
+def test_get_top_rated_books_limit_is_bounded(client):
+    request = client.get(f"/{BOOK_SEARCH_ENDPOINT}/top-rated?limit=600")
+    assert request.status_code == 422
+
+
+def test_review_previews_of_many_books(db_session):
+    async def previews():
+        for book_id in range(1, 601):
+            for review in ("First", "Second"):
+                db_session.add(
+                    models.BookReview(book_id=book_id, review=review, rating=4)
+                )
+        await db_session.commit()
+        return await repository.get_review_previews(range(1, 601), db_session)
+
+    results = asyncio.run(previews())
+    assert len(results) == 600
+    assert results[600] == ["Second", "First"]
@@ -0,0 +1,104 @@
+"""
+Tests for the rejection of unknown book ids
+"""
+
+import asyncio
+import json
+
+import books.catalog as catalog
+import books.known_ids as known_ids
+from src.constants import BOOK_SEARCH_ENDPOINT
+from tests import fake_gutendex
+
+
+def upstream_calls(app):
+    return len(app.state.gutendex.state.calls)
+
+
+def test_not_found_books_are_remembered(app, client, monkeypatch):
+    url = f"/{BOOK_SEARCH_ENDPOINT}/2240000000"
+    assert client.get(url).status_code == 404
+    calls = upstream_calls(app)
+
+    review = {"review": "Awesome book", "rating": 5}
+    assert client.get(url).status_code == 404
+    assert client.post(f"{url}/review", json=review).status_code == 404
+    assert upstream_calls(app) == calls
+
+    monkeypatch.setattr(known_ids._not_found, "ttl", 0)
+    known_ids.record_not_found([2240000000])
+    assert client.get(url).status_code == 404
+    assert upstream_calls(app) == calls + 1
+
+
+def test_catalog_ids_reject_unknown_books(app, client, db_session, tmp_path):
+    path = tmp_path / "catalog.json"
+    path.write_text(json.dumps(list(fake_gutendex.BOOKS.values())))
+    asyncio.run(
+        catalog.import_catalog(
+            catalog.read_catalog(str(path)), str(path), db_session, complete=True
+        )
+    )
+    client.portal.call(known_ids.load)
+
+    assert client.get(f"/{BOOK_SEARCH_ENDPOINT}/22400").status_code == 200
+    assert client.get(f"/{BOOK_SEARCH_ENDPOINT}/22402").status_code == 404
+    assert app.state.gutendex.state.calls == []
+
+    # Books newer than the catalog are still looked up
+    assert client.get(f"/{BOOK_SEARCH_ENDPOINT}/70000").status_code == 404
+    assert upstream_calls(app) == 1
+
+
+def test_catalog_ids_include_every_book_type(client, db_session, tmp_path):
+    path = tmp_path / "pg_catalog.csv"
+    path.write_text(
+        "Text#,Type,Issued,Title,Language,Authors,Subjects,LoCC,Bookshelves\n"
+        "1,Text,1971-12-01,The Declaration of Independence,en,Jefferson,,,\n"
+        "2,Sound,2003-11-01,The Declaration of Independence,en,Jefferson,,,\n"
+        "3,Text,1973-11-01,John F. Kennedy's Inaugural Address,en,Kennedy,,,\n"
+        "5,Text,1975-12-01,The United States Constitution,en,,,,\n"
+    )
+    asyncio.run(
+        catalog.import_catalog(
+            catalog.read_catalog(str(path)),
+            str(path),
+            db_session,
+            stale=True,
+            complete=True,
+        )
+    )
+    client.portal.call(known_ids.load)
+    assert [known_ids.is_missing(book_id) for book_id in range(1, 7)] == [
+        False,
+        False,
+        False,
+        True,
+        False,
+        False,
+    ]
+
+
+def test_incomplete_catalogs_do_not_reject_ids(client, db_session, tmp_path):
+    path = tmp_path / "page.json"
+    path.write_text(json.dumps({"results": [fake_gutendex.BOOKS[22400]]}))
+    asyncio.run(
+        catalog.import_catalog(catalog.read_catalog(str(path)), str(path), db_session)
+    )
+    client.portal.call(known_ids.load)
+    assert not known_ids.is_missing(100)
+
+
+def test_book_id_set():
+    book_ids = known_ids.BookIdSet([0, 7, 8, 75000])
+    assert [book_id in book_ids for book_id in (0, 7, 8, 9, 75000, 75001, -1)] == [
+        True,
+        True,
+        True,
+        False,
+        True,
+        False,
+        False,
+    ]
+    book_ids.add(known_ids.MAX_BITMAP_BOOK_ID + 1)
+    assert len(book_ids.bits) <= 75000 // 8 * 2
@@ -1,34 +1,55 @@
+import asyncio
+import os
 from typing import Any, Generator
-from unittest import mock
 
+os.environ["SQLALCHEMY_DATABASE_URL"] = "sqlite+aiosqlite:///./test_db.db"
+os.environ["LEADERBOARD_MIN_REFRESH_INTERVAL"] = "0"
+
+import httpx
 import pytest
 from fastapi import FastAPI
 from fastapi.testclient import TestClient
 from fastapi_cache import FastAPICache
 from fastapi_cache.backends.inmemory import InMemoryBackend
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
-
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import books.known_ids as known_ids
+import books.leaderboard as leaderboard
+import books.repository as repository
+import books.warming as warming
+import migrations
+import upstream
 from books.router import book_router
-from database import Base, get_db
+from database import Base, SessionLocal, engine
+from tests import fake_gutendex
 
 FastAPICache().init(InMemoryBackend(), prefix="test_book_api")
 
-mock.patch("fastapi_cache.decorator.cache", lambda *args, **kwargs: lambda f: f).start()
-
 
 def start_application():
     app = FastAPI()
     app.include_router(book_router)
-    return app
+    app.state.gutendex = fake_gutendex.create_app()
 
+    @app.on_event("startup")
+    async def startup():
+        transport = httpx.ASGITransport(app=app.state.gutendex)
+        await upstream.startup(upstream.create_client(transport=transport))
+        await leaderboard.startup()
 
-SQLALCHEMY_DATABASE_URL = "sqlite:///./test_db.db"
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
-)
+    @app.on_event("shutdown")
+    async def shutdown():
+        await warming.shutdown()
+        await repository.review_writer.stop()
+        await leaderboard.shutdown()
+        await upstream.shutdown()
 
-SessionTesting = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    return app
+
+
+async def drop_all():
+    async with engine.begin() as connection:
+        await connection.run_sync(Base.metadata.drop_all)
 
 
 @pytest.fixture(scope="function")
@@ -36,33 +57,25 @@ def app() -> Generator[FastAPI, Any, None]:
     """
     Create a fresh database on each test case.
     """
-    Base.metadata.create_all(engine)
+    asyncio.run(migrations.upgrade(engine))
+    asyncio.run(FastAPICache.get_backend().clear(namespace=FastAPICache.get_prefix()))
+    known_ids.reset()
     _app = start_application()
     yield _app
-    Base.metadata.drop_all(engine)
+    asyncio.run(drop_all())
 
 
 @pytest.fixture(scope="function")
-def db_session(app: FastAPI) -> Generator[SessionTesting, Any, None]:
-    connection = engine.connect()
-    transaction = connection.begin()
-    session = SessionTesting(bind=connection)
+def db_session(app: FastAPI) -> Generator[AsyncSession, Any, None]:
+    """
+    Session on the test database, to be used inside asyncio.run
+    """
+    session = SessionLocal()
     yield session
-    session.close()
-    transaction.rollback()
-    connection.close()
+    asyncio.run(session.close())
 
 
 @pytest.fixture(scope="function")
-def client(
-    app: FastAPI, db_session: SessionTesting
-) -> Generator[TestClient, Any, None]:
-    def _get_test_db():
-        try:
-            yield db_session
-        finally:
-            pass
-
-    app.dependency_overrides[get_db] = _get_test_db
+def client(app: FastAPI) -> Generator[TestClient, Any, None]:
     with TestClient(app) as client:
         yield client
@@ -0,0 +1,155 @@
+"""
+Local stand-in for the Gutendex API, served in-process to the app under test
+"""
+
+import asyncio
+import random
+from typing import Dict, List, Optional
+from urllib.parse import urlencode
+
+from fastapi import FastAPI, Query, Request
+from fastapi.responses import JSONResponse
+
+from src.constants import EXTERNAL_API_URL
+
+PAGE_SIZE = 32
+
+
+def _book(book_id: int, title: str, author: str, download_count: int) -> dict:
+    return {
+        "id": book_id,
+        "title": title,
+        "authors": [{"name": author, "birth_year": None, "death_year": None}],
+        "translators": [],
+        "subjects": [],
+        "bookshelves": [],
+        "languages": ["en"],
+        "copyright": False,
+        "media_type": "Text",
+        "formats": {},
+        "download_count": download_count,
+    }
+
+
+BOOKS: Dict[int, dict] = {
+    book["id"]: book
+    for book in [
+        _book(22400, "The Wonderful Wizard of Oz", "Baum, L. Frank", 900),
+        _book(22401, "The Marvelous Land of Oz", "Baum, L. Frank", 800),
+        {
+            **_book(
+                43737,
+                "A Middle English Vocabulary, Designed for use with Sisam's "
+                "Fourteenth Century Verse & Prose",
+                "Tolkien, J. R. R. (John Ronald Reuel)",
+                700,
+            ),
+            "languages": ["en", "enm"],
+            "authors": [
+                {
+                    "name": "Tolkien, J. R. R. (John Ronald Reuel)",
+                    "birth_year": 1892,
+                    "death_year": 1973,
+                }
+            ],
+        },
+        *[
+            _book(
+                60000 + number,
+                f"Ghosts and Spirits, Vol. {number}",
+                "Anonymous",
+                100 - number,
+            )
+            for number in range(1, 41)
+        ],
+    ]
+}
+
+
+def generate_books(count: int, first_id: int = 100000) -> Dict[int, dict]:
+    """
+    Build a catalog of numbered books, for load tests
+    """
+
+    return {
+        book_id: _book(book_id, f"Generated Book {book_id}", "Anonymous", count - n)
+        for n, book_id in enumerate(range(first_id, first_id + count))
+    }
+
+
+def _page_url(params: dict, page: int) -> Optional[str]:
+    query = dict(params)
+    if page > 1:
+        query["page"] = page
+    return EXTERNAL_API_URL + ("?" + urlencode(sorted(query.items())) if query else "")
+
+
+def _matches(book: dict, search: str) -> bool:
+    haystack = " ".join(
+        [book["title"], *[author["name"] for author in book["authors"]]]
+    ).lower()
+    return all(word in haystack for word in search.lower().split())
+
+
+def create_app(
+    books: Dict[int, dict] = BOOKS,
+    latency: float = 0.0,
+    error_rate: float = 0.0,
+    seed: Optional[int] = None,
+) -> FastAPI:
+    """
+    Build a fake Gutendex app serving the given books, answering after
+    `latency` seconds and failing a `error_rate` share of calls with a 503
+    """
+
+    fake_app = FastAPI()
+    fake_app.state.calls = []
+    failures = random.Random(seed)
+
+    @fake_app.middleware("http")
+    async def simulate_network(request: Request, call_next):
+        if latency:
+            await asyncio.sleep(latency)
+        if error_rate and failures.random() < error_rate:
+            return JSONResponse(status_code=503, content={"detail": "Unavailable"})
+        return await call_next(request)
+
+    @fake_app.get("/books/")
+    @fake_app.get("/books")
+    async def list_books(
+        search: Optional[str] = None,
+        ids: Optional[str] = None,
+        page: int = Query(default=1, ge=1),
+    ):
+        fake_app.state.calls.append(("list", search, ids, page))
+        params = {}
+        results: List[dict] = sorted(
+            books.values(), key=lambda book: book["download_count"], reverse=True
+        )
+        if search:
+            params["search"] = search
+            results = [book for book in results if _matches(book, search)]
+        if ids:
+            params["ids"] = ids
+            wanted = {int(book_id) for book_id in ids.split(",") if book_id}
+            results = [book for book in results if book["id"] in wanted]
+        start = (page - 1) * PAGE_SIZE
+        if results and start >= len(results):
+            return JSONResponse(status_code=404, content={"detail": "Invalid page."})
+        has_next = start + PAGE_SIZE < len(results)
+        return {
+            "count": len(results),
+            "next": _page_url(params, page + 1) if has_next else None,
+            "previous": _page_url(params, page - 1) if page > 1 else None,
+            "results": results[start : start + PAGE_SIZE],
+        }
+
+    @fake_app.get("/books/{book_id}/")
+    @fake_app.get("/books/{book_id}")
+    async def retrieve_book(book_id: int):
+        fake_app.state.calls.append(("retrieve", book_id))
+        if book_id not in books:
+            return JSONResponse(status_code=404, content={"detail": "Not found."})
+        return books[book_id]
+
+    return fake_app
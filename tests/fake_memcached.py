@@ -0,0 +1,72 @@
+"""
+Local stand-in for a memcached server, speaking the text protocol subset
+used by aiomcache (get, gets, set, add, incr, delete)
+"""
+
+import asyncio
+import time
+from typing import Dict, Tuple
+
+
+class FakeMemcached:
+    """
+    In-process memcached server, start it with `async with`
+    """
+
+    def __init__(self):
+        self.store: Dict[bytes, Tuple[bytes, float]] = {}
+        self.server = None
+        self.port = None
+
+    async def __aenter__(self) -> "FakeMemcached":
+        self.server = await asyncio.start_server(self.handle, "127.0.0.1", 0)
+        self.port = self.server.sockets[0].getsockname()[1]
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.server.close()
+        await self.server.wait_closed()
+
+    def _get(self, key: bytes):
+        value = self.store.get(key)
+        if value and value[1] and value[1] < time.time():
+            del self.store[key]
+            return None
+        return value
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        while line := await reader.readline():
+            command, *args = line.split()
+            if command in (b"get", b"gets"):
+                for key in args:
+                    value = self._get(key)
+                    if value:
+                        header = b"VALUE %s 0 %d" % (key, len(value[0]))
+                        if command == b"gets":
+                            header += b" 1"
+                        writer.write(header + b"\r\n" + value[0] + b"\r\n")
+                writer.write(b"END\r\n")
+            elif command in (b"set", b"add"):
+                key, _, exptime, size = args[:4]
+                data = await reader.readexactly(int(size) + 2)
+                if command == b"add" and self._get(key):
+                    writer.write(b"NOT_STORED\r\n")
+                else:
+                    expires_at = time.time() + int(exptime) if int(exptime) else 0
+                    self.store[key] = (data[:-2], expires_at)
+                    writer.write(b"STORED\r\n")
+            elif command == b"incr":
+                value = self._get(args[0])
+                if value is None:
+                    writer.write(b"NOT_FOUND\r\n")
+                else:
+                    number = int(value[0]) + int(args[1])
+                    self.store[args[0]] = (str(number).encode(), value[1])
+                    writer.write(b"%d\r\n" % number)
+            elif command == b"delete":
+                found = self.store.pop(args[0], None) is not None
+                writer.write(b"DELETED\r\n" if found else b"NOT_FOUND\r\n")
+            else:
+                writer.write(b"ERROR\r\n")
+            await writer.drain()
+        writer.close()
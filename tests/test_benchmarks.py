@@ -0,0 +1,71 @@
+"""
+Tests for the benchmark harness helpers and the fake Gutendex options
+"""
+
+import asyncio
+
+import httpx
+
+from benchmarks import run, seed, serialization
+from tests import fake_gutendex
+
+
+def test_parse_size():
+    assert [seed.parse_size(size) for size in ("500", "10k", "1M", "10m")] == [
+        500,
+        10000,
+        1000000,
+        10000000,
+    ]
+
+
+def test_summarize_percentiles():
+    results = run.summarize([number / 1000 for number in range(100, 0, -1)], 2, 2.0)
+    assert (results["p50_ms"], results["p95_ms"], results["p99_ms"]) == (
+        50.0,
+        95.0,
+        99.0,
+    )
+    assert results["errors"] == 2
+    assert results["throughput_rps"] == 50.0
+
+
+def test_compare_with_baseline():
+    baseline = {"routes": {"get_book": {"p95_ms": 10.0, "throughput_rps": 100.0}}}
+    faster = {"routes": {"get_book": {"p95_ms": 11.0, "throughput_rps": 90.0}}}
+    slower = {"routes": {"get_book": {"p95_ms": 13.0, "throughput_rps": 70.0}}}
+    assert run.compare(faster, baseline, tolerance=0.2) == []
+    assert len(run.compare(slower, baseline, tolerance=0.2)) == 2
+
+
+def test_fake_gutendex_errors():
+    async def get_statuses():
+        gutendex = fake_gutendex.create_app(error_rate=0.5, seed=1)
+        transport = httpx.ASGITransport(app=gutendex)
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://gutendex"
+        ) as client:
+            return [
+                (await client.get("/books/22400")).status_code for _ in range(20)
+            ]
+
+    statuses = asyncio.run(get_statuses())
+    assert set(statuses) == {200, 503}
+
+
+def test_serialization_modes_send_the_same_payload():
+    async def get_bodies(model, payload):
+        bodies = []
+        for mode in serialization.MODES:
+            transport = httpx.ASGITransport(
+                app=serialization.build_app(model, payload, mode)
+            )
+            async with httpx.AsyncClient(
+                transport=transport, base_url="http://benchmark"
+            ) as client:
+                bodies.append((await client.get("/")).json())
+        return bodies
+
+    for model, payload in serialization.build_payloads(3).values():
+        validated, *others = asyncio.run(get_bodies(model, payload))
+        assert others == [validated, validated]
@@ -0,0 +1,113 @@
+"""
+Tests for the cache backend configuration
+"""
+
+import asyncio
+
+import pytest
+from fastapi_cache import FastAPICache
+import caching
+import local_cache
+from src.constants import BOOK_SEARCH_ENDPOINT
+from tests.fake_memcached import FakeMemcached
+
+
+def test_create_memory_backend():
+    backend = caching.create_backend("memory", local_max_bytes=1024)
+    assert isinstance(backend, local_cache.LocalBackend)
+    assert backend.max_bytes == 1024
+
+
+def test_create_unknown_backend():
+    with pytest.raises(ValueError):
+        caching.create_backend("filesystem")
+
+
+def test_memcached_backend_round_trip():
+    async def run():
+        async with FakeMemcached() as server:
+            backend = caching.create_backend(
+                "memcached", f"memcached://127.0.0.1:{server.port}", local_max_bytes=0
+            )
+            await backend.set("book_api::key", '{"id": 1}', expire=60)
+            stored = await backend.get_with_ttl("book_api::key")
+            cleared = await backend.clear(key="book_api::key")
+            missing = await backend.get("book_api::key")
+            await backend.close()
+            return stored, cleared, missing
+
+    (ttl, stored), cleared, missing = asyncio.run(run())
+    assert stored == b'{"id": 1}'
+    assert 59 <= ttl <= 60
+    assert cleared == 1
+    assert missing is None
+
+
+def test_memcached_backend_with_local_tier():
+    async def run():
+        async with FakeMemcached() as server:
+            backend = caching.create_backend(
+                "memcached", f"memcached://127.0.0.1:{server.port}"
+            )
+            await backend.set("book_api::key", '{"id": 1}', expire=60)
+            server.store.clear()
+            stored = await backend.get("book_api::key")
+            await backend.clear(key="book_api::key")
+            missing = await backend.get("book_api::key")
+            await backend.close()
+            return backend, stored, missing
+
+    backend, stored, missing = asyncio.run(run())
+    assert isinstance(backend, local_cache.TieredBackend)
+    assert stored == '{"id": 1}'
+    assert missing is None
+
+
+def test_app_serves_requests_with_the_default_backend(client, monkeypatch):
+    for name in ("_init", "_backend", "_prefix"):
+        monkeypatch.setattr(FastAPICache, name, getattr(FastAPICache, name))
+    FastAPICache._init = False
+    client.portal.call(caching.startup)
+    assert isinstance(FastAPICache.get_backend(), local_cache.LocalBackend)
+
+    url = f"/{BOOK_SEARCH_ENDPOINT}/22400"
+    assert client.get(url).status_code == 200
+    review = {"review": "Awesome book", "rating": 5}
+    assert client.post(f"{url}/review", json=review).status_code == 201
+    assert client.get(url).json()["review_count"] == 1
+    assert client.get(f"/{BOOK_SEARCH_ENDPOINT}/top-rated").status_code == 200
+
+
+def test_entry_invalidated_while_computed_is_not_served():
+    results = iter(["old", "new"])
+
+    @caching.cached("race", expire=60, key=lambda book_id: book_id, invalidated=True)
+    async def get_book(book_id):
+        result = next(results)
+        if result == "old":
+            # A review is written after the book was read
+            await caching.invalidate("race", book_id)
+        return result
+
+    async def run():
+        return [await get_book(book_id=1) for _ in range(3)]
+
+    assert asyncio.run(run()) == ["old", "new", "new"]
+
+
+def test_invalidate_drops_the_stored_entry():
+    @caching.cached("drop", expire=60, key=lambda book_id: book_id, invalidated=True)
+    async def get_book(book_id):
+        return {"id": book_id}
+
+    async def run():
+        await get_book(book_id=1)
+        generation = await caching.get_generation("drop", 1)
+        key = caching.build_key("drop", 1, generation)
+        stored = await FastAPICache.get_backend().get(key)
+        await caching.invalidate("drop", 1)
+        return stored, await FastAPICache.get_backend().get(key)
+
+    stored, dropped = asyncio.run(run())
+    assert stored is not None
+    assert dropped is None
@@ -0,0 +1,54 @@
+"""
+Tests for the backend-aware database engine
+"""
+
+import asyncio
+
+from sqlalchemy import select, text
+from sqlalchemy.dialects import postgresql, sqlite
+
+import models as models
+from database import (day_of, engine, extract_int, get_async_url,
+                      get_engine_options, is_sqlite_file)
+
+
+def test_sqlite_connections_use_wal():
+    async def pragmas():
+        async with engine.connect() as connection:
+            return [
+                (await connection.execute(text(f"PRAGMA {name}"))).scalar()
+                for name in ("journal_mode", "synchronous", "busy_timeout")
+            ]
+
+    assert asyncio.run(pragmas()) == ["wal", 1, 5000]
+
+
+def test_engine_options():
+    sqlite_url = get_async_url("sqlite:///./books.db")
+    assert is_sqlite_file(sqlite_url)
+    assert not is_sqlite_file(get_async_url("sqlite://"))
+    assert get_engine_options(sqlite_url)["pool_size"] == 10
+    assert "pool_size" not in get_engine_options(get_async_url("sqlite://"))
+
+    postgres_url = get_async_url("postgres://books@localhost/books")
+    assert postgres_url.drivername == "postgresql+asyncpg"
+    options = get_engine_options(postgres_url)
+    assert options["pool_pre_ping"]
+    assert options["pool_size"] == 10
+    assert options["connect_args"]["server_settings"] == {
+        "statement_timeout": "30000"
+    }
+
+
+def test_portable_date_expressions():
+    reviews = models.BookReview.__table__
+    query = select([day_of(reviews.c.date), extract_int("month", reviews.c.date)])
+
+    assert str(query.compile(dialect=sqlite.dialect())).startswith(
+        "SELECT date(book_reviews.date) AS day_of_1, "
+        "CAST(CAST(STRFTIME('%m', book_reviews.date) AS INTEGER) AS INTEGER)"
+    )
+    assert str(query.compile(dialect=postgresql.dialect())).startswith(
+        "SELECT CAST(book_reviews.date AS DATE) AS day_of_1, "
+        "CAST(EXTRACT(month FROM book_reviews.date) AS INTEGER)"
+    )
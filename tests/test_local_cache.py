@@ -0,0 +1,79 @@
+"""
+Tests for the bounded in-process cache tier
+"""
+
+import asyncio
+import json
+
+from fastapi_cache.backends.inmemory import InMemoryBackend
+
+import local_cache
+
+VALUE = json.dumps({"books": [{"title": "The Wonderful Wizard of Oz"}] * 20})
+ENTRY_SIZE = len(VALUE) + len("key 0") + local_cache.ENTRY_OVERHEAD
+
+
+def test_entries_are_evicted_within_the_byte_limit():
+    async def run():
+        backend = local_cache.LocalBackend(max_bytes=3 * ENTRY_SIZE)
+        for number in range(3):
+            await backend.get(f"key {number}")
+            await backend.set(f"key {number}", VALUE, expire=60)
+        await backend.get("key 0")
+        await backend.get("key 3")
+        await backend.get("key 3")
+        await backend.set("key 3", VALUE, expire=60)
+        return backend, [await backend.get(f"key {number}") for number in range(4)]
+
+    backend, values = asyncio.run(run())
+    assert values == [VALUE, None, VALUE, VALUE]
+    assert backend.bytes == 3 * ENTRY_SIZE
+    assert backend.stats()["entries"] == 3
+    assert 0 < backend.stats()["hit_ratio"] < 1
+
+
+def test_keys_requested_once_are_not_admitted():
+    async def run():
+        backend = local_cache.LocalBackend(max_bytes=2 * ENTRY_SIZE)
+        for number in range(2):
+            for _ in range(3):
+                await backend.get(f"key {number}")
+            await backend.set(f"key {number}", VALUE, expire=60)
+        await backend.get("key 2")
+        await backend.set("key 2", VALUE, expire=60)
+        return [await backend.get(f"key {number}") for number in range(3)]
+
+    assert asyncio.run(run()) == [VALUE, VALUE, None]
+
+
+def test_values_are_compressed():
+    async def run():
+        backend = local_cache.LocalBackend(compress=True)
+        await backend.set("text", VALUE)
+        await backend.set("bytes", VALUE.encode(), expire=60)
+        ttl, value = await backend.get_with_ttl("bytes")
+        return backend, await backend.get("text"), value, ttl
+
+    backend, text, value, ttl = asyncio.run(run())
+    assert (text, value) == (VALUE, VALUE.encode())
+    assert 0 < ttl <= 60
+    assert backend.bytes < 2 * len(VALUE)
+
+
+def test_tiered_backend_reads_the_local_tier_first():
+    async def run():
+        shared = InMemoryBackend()
+        backend = local_cache.TieredBackend(shared, local_ttl=60)
+        await backend.set("tiered:key", VALUE, expire=60)
+        await shared.clear(key="tiered:key")
+        local_value = await backend.get("tiered:key")
+
+        await shared.set("tiered:other", VALUE, expire=60)
+        ttl, shared_value = await backend.get_with_ttl("tiered:other")
+        await backend.clear(key="tiered:other")
+        return local_value, shared_value, ttl, await backend.get("tiered:other")
+
+    local_value, shared_value, ttl, missing = asyncio.run(run())
+    assert local_value == shared_value == VALUE
+    assert 0 < ttl <= 60
+    assert missing is None
@@ -0,0 +1,83 @@
+"""
+Tests for the Prometheus metrics
+"""
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import metrics
+from src.constants import BOOK_SEARCH_ENDPOINT
+
+
+def _sample(name: str) -> float:
+    for line in metrics.render().splitlines():
+        if line.startswith(name + " "):
+            return float(line.rsplit(" ", 1)[1])
+    return 0.0
+
+
+def test_render_histogram_and_counter():
+    histogram = metrics.Histogram(
+        "test_duration_seconds", "Test latency", ("route",), buckets=(0.1, 1)
+    )
+    counter = metrics.Counter("test_total", "Test calls", ("status",))
+    try:
+        for value in (0.05, 0.5, 5):
+            histogram.observe(value, 'say "hi"')
+        counter.inc("200")
+        counter.inc("200")
+        assert histogram.render().splitlines() == [
+            "# HELP test_duration_seconds Test latency",
+            "# TYPE test_duration_seconds histogram",
+            'test_duration_seconds_bucket{route="say \\"hi\\"",le="0.1"} 1',
+            'test_duration_seconds_bucket{route="say \\"hi\\"",le="1.0"} 2',
+            'test_duration_seconds_bucket{route="say \\"hi\\"",le="+Inf"} 3',
+            'test_duration_seconds_sum{route="say \\"hi\\""} 5.55',
+            'test_duration_seconds_count{route="say \\"hi\\""} 3',
+        ]
+        assert counter.samples() == ['test_total{status="200"} 2']
+    finally:
+        metrics.REGISTRY.remove(histogram)
+        metrics.REGISTRY.remove(counter)
+
+
+def test_middleware_labels_requests_with_route_template():
+    app = FastAPI()
+    app.add_middleware(metrics.MetricsMiddleware)
+
+    @app.get("/items/{item_id}")
+    async def get_item(item_id: int):
+        return {"id": item_id}
+
+    name = (
+        "http_request_duration_seconds_count"
+        '{method="GET",route="/items/{item_id}",status="200"}'
+    )
+    before = _sample(name)
+    with TestClient(app) as client:
+        client.get("/items/1")
+        client.get("/items/2")
+    assert _sample(name) == before + 2
+
+
+def test_request_path_metrics(client):
+    upstream_calls = _sample('upstream_requests_total{status="200"}')
+    misses = _sample('cache_requests_total{namespace="book",result="miss"}')
+    hits = _sample('cache_requests_total{namespace="book",result="hit"}')
+    rating_calls = _sample(
+        'repository_duration_seconds_count{function="get_book_avg_rating"}'
+    )
+    for _ in range(2):
+        assert client.get(f"/{BOOK_SEARCH_ENDPOINT}/22400").status_code == 200
+
+    assert _sample('upstream_requests_total{status="200"}') == upstream_calls + 1
+    assert (
+        _sample('cache_requests_total{namespace="book",result="miss"}') == misses + 1
+    )
+    assert _sample('cache_requests_total{namespace="book",result="hit"}') == hits + 1
+    assert (
+        _sample('repository_duration_seconds_count{function="get_book_avg_rating"}')
+        == rating_calls + 1
+    )
+    assert _sample('db_query_duration_seconds_count{function="get_book_avg_rating"}')
+    assert _sample("db_connections_checked_out") == 0
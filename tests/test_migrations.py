@@ -0,0 +1,137 @@
+"""
+Tests for the schema migrations
+"""
+
+import asyncio
+
+from sqlalchemy import inspect, text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+import migrations
+
+
+def test_upgrade_adds_indexes_to_existing_tables(tmp_path):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'books.db'}")
+
+    async def get_index_names():
+        async with engine.connect() as connection:
+            indexes = await connection.run_sync(
+                lambda sync_connection: inspect(sync_connection).get_indexes(
+                    "book_reviews"
+                )
+            )
+        return {index["name"] for index in indexes}
+
+    async def run():
+        async with engine.begin() as connection:
+            await connection.execute(
+                text(
+                    "CREATE TABLE book_reviews (id INTEGER PRIMARY KEY, "
+                    "book_id INTEGER NOT NULL, rating SMALLINT NOT NULL, "
+                    "review VARCHAR(500) NOT NULL, date DATETIME)"
+                )
+            )
+        first_upgrade = await migrations.upgrade(engine)
+        index_names = await get_index_names()
+        second_upgrade = await migrations.upgrade(engine)
+        await engine.dispose()
+        return first_upgrade, index_names, second_upgrade
+
+    first_upgrade, index_names, second_upgrade = asyncio.run(run())
+    assert first_upgrade == [1, 2, 3, 4, 5, 6]
+    assert {
+        "ix_book_reviews_book_id_date",
+        "ix_book_reviews_book_id_rating",
+        "ix_book_reviews_uuid",
+    } <= index_names
+    assert second_upgrade == []
+
+
+def test_upgrade_backfills_rating_rollups_and_stats(tmp_path):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'books.db'}")
+
+    async def run():
+        async with engine.begin() as connection:
+            await connection.execute(
+                text(
+                    "CREATE TABLE book_reviews (id INTEGER PRIMARY KEY, "
+                    "book_id INTEGER NOT NULL, rating SMALLINT NOT NULL, "
+                    "review VARCHAR(500) NOT NULL, date DATETIME)"
+                )
+            )
+            await connection.execute(
+                text(
+                    "INSERT INTO book_reviews (book_id, rating, review, date) "
+                    "VALUES (1, 5, 'a', '2023-01-10 08:00:00'), "
+                    "(1, 3, 'b', '2023-01-10 20:00:00'), "
+                    "(1, 4, 'c', '2024-01-10 08:00:00')"
+                )
+            )
+        await migrations.upgrade(engine)
+        async with engine.connect() as connection:
+            rollups = await connection.execute(
+                text(
+                    "SELECT book_id, day, review_count, rating_sum "
+                    "FROM book_rating_rollups ORDER BY day"
+                )
+            )
+            rows = [tuple(row) for row in rollups]
+            stats = await connection.execute(
+                text(
+                    "SELECT book_id, review_count, rating_sum, rating_avg, "
+                    "last_review_at FROM book_rating_stats"
+                )
+            )
+            stats_rows = [tuple(row) for row in stats]
+        await engine.dispose()
+        return rows, stats_rows
+
+    rows, stats_rows = asyncio.run(run())
+    assert rows == [(1, "2023-01-10", 2, 8), (1, "2024-01-10", 1, 4)]
+    assert stats_rows == [(1, 3, 12, 4.0, "2024-01-10 08:00:00")]
+
+
+def test_upgrade_adds_catalog_import_completeness(tmp_path):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'books.db'}")
+
+    async def run():
+        async with engine.begin() as connection:
+            await connection.execute(
+                text(
+                    "CREATE TABLE catalog_imports (id INTEGER PRIMARY KEY, "
+                    "source VARCHAR NOT NULL, book_count INTEGER NOT NULL, "
+                    "imported_at DATETIME NOT NULL)"
+                )
+            )
+            await connection.execute(
+                text(
+                    "INSERT INTO catalog_imports (source, book_count, imported_at) "
+                    "VALUES ('page.json', 32, '2023-01-10 08:00:00')"
+                )
+            )
+        await migrations.upgrade(engine)
+        async with engine.connect() as connection:
+            imports = await connection.execute(
+                text("SELECT max_book_id, complete FROM catalog_imports")
+            )
+            rows = [tuple(row) for row in imports]
+        await engine.dispose()
+        return rows
+
+    assert asyncio.run(run()) == [(None, 0)]
+
+
+def test_concurrent_upgrades_apply_each_migration_once(tmp_path):
+    url = f"sqlite+aiosqlite:///{tmp_path / 'books.db'}"
+    engines = [create_async_engine(url) for _ in range(3)]
+
+    async def run():
+        results = await asyncio.gather(
+            *[migrations.upgrade(engine) for engine in engines]
+        )
+        for engine in engines:
+            await engine.dispose()
+        return results
+
+    versions = [version for version, *_ in migrations.MIGRATIONS]
+    assert sorted(asyncio.run(run())) == [[], [], versions]
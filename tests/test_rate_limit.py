@@ -0,0 +1,88 @@
+"""
+Tests for the client rate limits and the Gutendex QPS governor
+"""
+
+import asyncio
+
+import pytest
+
+import caching
+import rate_limit
+import upstream
+from src.constants import BOOK_SEARCH_ENDPOINT
+from tests.fake_memcached import FakeMemcached
+
+
+@pytest.fixture
+def limited(monkeypatch):
+    monkeypatch.setattr(rate_limit.client_limiter, "rate", 0.5)
+    monkeypatch.setattr(rate_limit.client_limiter, "burst", 2)
+    rate_limit.client_limiter.reset()
+    yield
+    rate_limit.client_limiter.reset()
+
+
+def test_take_token():
+    bucket, wait = rate_limit.take_token(None, rate=2, burst=2, now=100)
+    assert (bucket, wait) == ((1, 100), 0)
+    bucket, wait = rate_limit.take_token(bucket, rate=2, burst=2, now=100)
+    bucket, wait = rate_limit.take_token(bucket, rate=2, burst=2, now=100)
+    assert (bucket, wait) == ((-1, 100), 0.5)
+    bucket, wait = rate_limit.take_token(bucket, rate=2, burst=2, now=110)
+    assert (bucket, wait) == ((1, 110), 0)
+
+
+def test_clients_over_the_rate_are_rejected(client, limited):
+    url = f"/{BOOK_SEARCH_ENDPOINT}/22400"
+    assert [client.get(url).status_code for _ in range(2)] == [200, 200]
+    response = client.get(url)
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "2"
+
+    # Clients sending an API key have their own bucket
+    response = client.get(url, headers={"X-API-Key": "reader"})
+    assert response.status_code == 200
+
+
+def test_shared_buckets_are_used_by_every_worker(monkeypatch):
+    async def run():
+        async with FakeMemcached() as server:
+            shared = caching.create_backend(
+                "memcached", f"memcached://127.0.0.1:{server.port}", local_max_bytes=0
+            )
+            monkeypatch.setattr(caching, "get_shared_backend", lambda: shared)
+            workers = [
+                rate_limit.RateLimiter("test-shared-limit", 0.01, 2) for _ in range(2)
+            ]
+            results = await asyncio.gather(
+                *[workers[number % 2].acquire("client") for number in range(50)],
+                return_exceptions=True,
+            )
+            await shared.close()
+            return results
+
+    results = asyncio.run(run())
+    rejected = [result for result in results if result is not None]
+    assert len(rejected) == 48
+    assert all(isinstance(result, rate_limit.RateLimited) for result in rejected)
+
+
+def test_gutendex_calls_over_the_rate_are_queued_then_shed(app, client, monkeypatch):
+    monkeypatch.setattr(upstream._governor, "rate", 10)
+    monkeypatch.setattr(upstream._governor, "burst", 1)
+    monkeypatch.setattr(upstream._governor, "max_wait", 0.15)
+    upstream._governor.reset()
+
+    def search(term):
+        return client.get(f"/{BOOK_SEARCH_ENDPOINT}", params={"search": term})
+
+    assert [search(term).status_code for term in ("oz", "ghosts")] == [200, 200]
+    assert len(app.state.gutendex.state.calls) == 2
+
+    monkeypatch.setattr(upstream._governor, "max_wait", 0)
+    upstream._governor.reset()
+    assert search("tolkien").status_code == 200
+    response = search("baum")
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "1"
+    upstream._governor.reset()
@@ -0,0 +1,50 @@
+"""
+Tests for the trusted response serialization
+"""
+
+import asyncio
+import json
+
+from fastapi.responses import ORJSONResponse
+
+import books.repository as repository
+from database import SessionLocal
+from responses import trusted_response
+from src.constants import BOOK_SEARCH_ENDPOINT
+
+
+def test_trusted_response_skips_only_when_trusted():
+    async def endpoint():
+        return {"books": []}
+
+    assert trusted_response(endpoint, trusted=False) is endpoint
+    response = asyncio.run(trusted_response(endpoint, trusted=True)())
+    assert isinstance(response, ORJSONResponse)
+    assert response.body == b'{"books":[]}'
+
+
+def test_trusted_results_match_the_response_models(client):
+    for book_id in (22400, 43737):
+        client.post(
+            f"/{BOOK_SEARCH_ENDPOINT}/{book_id}/review",
+            json={"review": "Great book", "rating": 4},
+        )
+
+    async def get_top_rated_books():
+        async with SessionLocal() as db:
+            return await repository.get_top_rated_books(10, db)
+
+    async def get_book():
+        async with SessionLocal() as db:
+            return await repository.get_book_with_review(22400, db)
+
+    search_results = client.portal.call(repository.get_books_by_title, "ghosts", None)
+    top_rated_results = client.portal.call(get_top_rated_books)
+    book_results = client.portal.call(get_book)
+
+    for url, results in [
+        (f"/{BOOK_SEARCH_ENDPOINT}?search=ghosts", search_results),
+        (f"/{BOOK_SEARCH_ENDPOINT}/top-rated", top_rated_results),
+        (f"/{BOOK_SEARCH_ENDPOINT}/22400", book_results),
+    ]:
+        assert json.loads(ORJSONResponse(results).body) == client.get(url).json()
@@ -0,0 +1,63 @@
+"""
+Tests for the request coalescing helper
+"""
+
+import asyncio
+
+from singleflight import SingleFlight
+
+
+def test_concurrent_calls_share_one_execution():
+    calls = []
+
+    async def fetch():
+        calls.append("fetch")
+        await asyncio.sleep(0.01)
+        return {"id": 1}
+
+    async def run():
+        flight = SingleFlight()
+        return await asyncio.gather(*[flight.do("book:1", fetch) for _ in range(5)])
+
+    results = asyncio.run(run())
+    assert calls == ["fetch"]
+    assert all(result is results[0] for result in results)
+
+
+def test_refresh_runs_once_in_background():
+    calls = []
+
+    async def fetch():
+        calls.append("fetch")
+        await asyncio.sleep(0.01)
+
+    async def run():
+        flight = SingleFlight()
+        flight.refresh("book:1", fetch)
+        flight.refresh("book:1", fetch)
+        assert "book:1" in flight
+        while "book:1" in flight:
+            await asyncio.sleep(0.01)
+
+    asyncio.run(run())
+    assert calls == ["fetch"]
+
+
+def test_refresh_many_runs_one_call_for_the_keys_not_in_flight():
+    calls = []
+
+    async def fetch(keys):
+        calls.append(keys)
+        await asyncio.sleep(0.01)
+
+    async def run():
+        flight = SingleFlight()
+        flight.refresh_many([1, 2], fetch)
+        flight.refresh_many([1, 2, 3, 3], fetch)
+        flight.refresh_many([2, 3], fetch)
+        assert all(key in flight for key in (1, 2, 3))
+        while any(key in flight for key in (1, 2, 3)):
+            await asyncio.sleep(0.01)
+
+    asyncio.run(run())
+    assert calls == [[1, 2], [3]]
@@ -0,0 +1,151 @@
+"""
+Tests for the shared upstream client
+"""
+
+import asyncio
+
+import httpx
+import pytest
+
+import upstream
+
+
+def test_upstream_calls_run_concurrently_up_to_the_cap(monkeypatch):
+    in_flight = {"now": 0, "max": 0}
+
+    async def handler(request):
+        in_flight["now"] += 1
+        in_flight["max"] = max(in_flight["max"], in_flight["now"])
+        await asyncio.sleep(0.05)
+        in_flight["now"] -= 1
+        return httpx.Response(200, json={"id": 1})
+
+    monkeypatch.setattr(upstream, "UPSTREAM_MAX_CONCURRENCY", 3)
+
+    async def run():
+        await upstream.startup(
+            upstream.create_client(transport=httpx.MockTransport(handler))
+        )
+        try:
+            return await asyncio.gather(
+                *[upstream.get("http://upstream/books/1") for _ in range(9)]
+            )
+        finally:
+            await upstream.shutdown()
+
+    responses = asyncio.run(run())
+    assert [response.status_code for response in responses] == [200] * 9
+    assert in_flight["max"] == 3
+
+
+def test_upstream_drops_empty_query_params():
+    seen = []
+
+    def handler(request):
+        seen.append(str(request.url))
+        return httpx.Response(200, json={})
+
+    async def run():
+        await upstream.startup(
+            upstream.create_client(transport=httpx.MockTransport(handler))
+        )
+        try:
+            await upstream.get(
+                "http://upstream/books/", params={"search": "oz", "page": None}
+            )
+        finally:
+            await upstream.shutdown()
+
+    asyncio.run(run())
+    assert seen == ["http://upstream/books/?search=oz"]
+
+
+def _run_with_handler(handler, coroutine_function):
+    async def run():
+        await upstream.startup(
+            upstream.create_client(transport=httpx.MockTransport(handler))
+        )
+        try:
+            return await coroutine_function()
+        finally:
+            await upstream.shutdown()
+
+    return asyncio.run(run())
+
+
+def test_upstream_retries_server_errors(monkeypatch):
+    monkeypatch.setattr(upstream, "UPSTREAM_RETRY_BACKOFF", 0)
+    statuses = [503, 502, 200]
+
+    def handler(request):
+        return httpx.Response(statuses.pop(0), json={"id": 1})
+
+    response = _run_with_handler(
+        handler, lambda: upstream.get("http://upstream/books/1")
+    )
+    assert response.status_code == 200
+    assert statuses == []
+
+
+def test_upstream_gives_up_with_non_json_error(monkeypatch):
+    monkeypatch.setattr(upstream, "UPSTREAM_RETRY_BACKOFF", 0)
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        return httpx.Response(500, text="<html>Internal Server Error</html>")
+
+    async def get():
+        with pytest.raises(upstream.UpstreamUnavailable) as error:
+            await upstream.get("http://upstream/books/1")
+        return error.value
+
+    error = _run_with_handler(handler, get)
+    assert error.status_code == 503
+    assert "<html>Internal Server Error</html>" in error.detail
+    assert len(calls) == upstream.UPSTREAM_RETRIES + 1
+
+
+def test_circuit_opens_and_recovers(monkeypatch):
+    monkeypatch.setattr(upstream, "UPSTREAM_RETRIES", 0)
+    monkeypatch.setattr(upstream, "UPSTREAM_CIRCUIT_FAILURES", 2)
+    monkeypatch.setattr(upstream, "UPSTREAM_CIRCUIT_RESET", 0.05)
+    responses = [503, 503, 200]
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        return httpx.Response(responses.pop(0), json={})
+
+    async def run():
+        for _ in range(3):
+            with pytest.raises(upstream.UpstreamUnavailable):
+                await upstream.get("http://upstream/books/1")
+        state = upstream._breaker.state
+        await asyncio.sleep(0.05)
+        response = await upstream.get("http://upstream/books/1")
+        return state, response.status_code, upstream._breaker.state
+
+    assert _run_with_handler(handler, run) == ("open", 200, "closed")
+    assert len(calls) == 3
+
+
+def test_upstream_call_deadline(monkeypatch):
+    monkeypatch.setattr(upstream, "UPSTREAM_CALL_TIMEOUT", 0.05)
+
+    async def handler(request):
+        await asyncio.sleep(1)
+        return httpx.Response(200, json={})
+
+    async def get():
+        with pytest.raises(upstream.UpstreamUnavailable):
+            await upstream.get("http://upstream/books/1")
+
+    _run_with_handler(handler, get)
+
+
+def test_error_detail():
+    assert upstream.error_detail(httpx.Response(404, json={"detail": "x"})) == {
+        "detail": "x"
+    }
+    assert upstream.error_detail(httpx.Response(502, text="Bad")) == "Bad"